@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PretLoc.settings")
 
 application = get_asgi_application()
+
+# Load the PDF rendering resources before serving the first request
+from ui.reservation.pdf import warm_up  # noqa: E402
+
+warm_up()
@@ -0,0 +1,16 @@
+"""
+gunicorn settings, given to gunicorn by entrypoint.sh.
+"""
+
+import os
+
+
+def child_exit(server, worker):
+    """
+    Remove the gauges of an exited worker from the Prometheus metrics, its
+    counters and histograms are kept (see utils/metrics.py).
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -54,10 +54,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "utils.structured_logging.RequestContextMiddleware",
+    "utils.metrics.MetricsMiddleware",
+    "utils.query_profiler.QueryProfilerMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "accounts.middleware.CapabilityMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.locale.LocaleMiddleware",
@@ -77,6 +81,7 @@ TEMPLATES = [
                 "django.template.context_processors.i18n",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "accounts.context_processors.capability",
             ],
         },
     },
@@ -84,6 +89,37 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "PretLoc.wsgi.application"
 
+# Load the profile with the user of the session (see accounts/backends.py)
+AUTHENTICATION_BACKENDS = ["accounts.backends.ProfileModelBackend"]
+# Seconds a web worker keeps the users it loaded, 0 disables the cache. The
+# other workers do not see the changes of a user before the delay expires
+AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", "0"))
+
+# Sessions: "db" (default), "cached_db" (database with a cache in front),
+# "cache" (cache only) or "signed_cookies" (stored in the client cookie)
+SESSION_ENGINE = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}[os.environ.get("SESSION_BACKEND", "db")]
+
+# Cache: "locmem" (per worker process, default) or "file" (shared by the
+# workers of a container, in data/cache)
+if os.environ.get("CACHE_BACKEND", "locmem") == "file":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / "data" / "cache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -150,30 +186,117 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 
 MEDIA_ROOT = "/data/media"
 
-# Configuration pour stocker les migrations dans un volume externe
-MIGRATION_MODULES = {
-    "admin": "data.migrations_data.admin",
-    "auth": "data.migrations_data.auth",
-    "contenttypes": "data.migrations_data.contenttypes",
-    "sessions": "data.migrations_data.sessions",
-    "ui": "data.migrations_data.ui",
-    "accounts": "data.migrations_data.accounts",
-}
+# State of the last boot: migration hash and recorded data migrations (see ui/management/commands/boot.py)
+BOOT_STATE_FILE = BASE_DIR / "data" / "boot_state.json"
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Per-request SQL query profiling (see utils/query_profiler.py)
+QUERY_PROFILER_ENABLED = os.environ.get("QUERY_PROFILER", "False").lower() == "true"
+QUERY_PROFILER_SLOWEST = 5
+# Raise instead of logging a warning when a view exceeds its query budget
+QUERY_BUDGET_STRICT = os.environ.get("QUERY_BUDGET_STRICT", "False").lower() == "true"
+
+# Prometheus metrics served on /metrics (see utils/metrics.py)
+METRICS_ENABLED = os.environ.get("METRICS", "True").lower() == "true"
+# Bearer token required by /metrics when set
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+# The values of the worker processes are shared through the directory of the
+# PROMETHEUS_MULTIPROC_DIR environment variable, read by prometheus_client
+# Readiness fails when a database round trip takes longer (milliseconds)
+READINESS_MAX_DB_LATENCY_MS = int(os.environ.get("READINESS_MAX_DB_LATENCY_MS", "250"))
+
+# Calls, time, queries and items processed by the availability computations,
+# in the metrics and the query profiler (see utils/instrumentation.py)
+COMPUTATIONS_INSTRUMENTATION = (
+    os.environ.get("COMPUTATIONS_INSTRUMENTATION", "False").lower() == "true"
+)
+
+# "reject" refuses to save a reservation overbooking its assets, "flag" saves
+# it with a warning (see ui/reservation/booking.py)
+RESERVATION_OVERBOOKING = os.environ.get("RESERVATION_OVERBOOKING", "reject").lower()
+
+# Seconds during which a repeated submit of a form gets the response of the
+# first one instead of running again (see utils/idempotency.py)
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", "86400"))
+
+# Months after which the returned and cancelled reservations are moved to the
+# archive by the archive_reservations command (see ui/reservation/archive.py)
+RESERVATION_ARCHIVE_MONTHS = int(os.environ.get("RESERVATION_ARCHIVE_MONTHS", "24"))
+
+# Days of stock events kept as is, the older ones being compacted by the
+# compact_stock_events command (see ui/stock/compaction.py)
+STOCK_EVENT_RETENTION_DAYS = int(os.environ.get("STOCK_EVENT_RETENTION_DAYS", "1825"))
+
+# Threads computing availabilities for the async views (see utils/executors.py)
+AVAILABILITY_EXECUTOR_WORKERS = int(os.environ.get("AVAILABILITY_WORKERS", "4"))
+
+# Background rendering of the reservation PDFs (see ui/reservation/pdf.py)
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", "2"))
+# Rendered PDFs are cached on the data volume, shared by all the workers
+PDF_CACHE_DIR = BASE_DIR / "data" / "pdf_cache"
+# Seconds after which a render that did not complete is started again
+PDF_RENDER_TIMEOUT = 120
+# Load the stylesheet, fonts and images of the PDFs in the threads of the PDF
+# pool when a web worker starts
+PDF_WARM_UP = os.environ.get("PDF_WARM_UP", "True").lower() == "true"
+# Processes rendering the batch exports, started by the first export of a web
+# worker and kept; 0 renders in the request process
+PDF_BATCH_PROCESSES = int(os.environ.get("PDF_BATCH_PROCESSES", "2"))
+# Maximum number of reservations of a batch export
+PDF_BATCH_MAX_RESERVATIONS = 300
+
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
 
+# Logging: records are written by a background thread (see
+# utils/structured_logging.py), as JSON unless LOG_FORMAT=verbose.
+# LOG_LEVEL is the default level, LOG_LEVELS sets the level of some loggers
+# ("ui=DEBUG,pretloc.access=WARNING") and LOG_SAMPLING the fraction of the
+# debug records of some loggers which are kept ("ui=0.1")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = {
+    "django": "WARNING",
+    **{
+        name.strip(): level.strip().upper()
+        for name, level in (
+            item.split("=", 1)
+            for item in os.environ.get("LOG_LEVELS", "").split(",")
+            if "=" in item
+        )
+    },
+}
+LOG_SAMPLING = {
+    name.strip(): float(rate)
+    for name, rate in (
+        item.split("=", 1)
+        for item in os.environ.get("LOG_SAMPLING", "").split(",")
+        if "=" in item
+    )
+}
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "verbose" if DEBUG else "json")
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "filters": {
+        "request_context": {
+            "()": "utils.structured_logging.RequestContextFilter",
+        },
+        "sampling": {
+            "()": "utils.structured_logging.SamplingFilter",
+            "rates": LOG_SAMPLING,
+        },
+    },
     "formatters": {
+        "json": {
+            "()": "utils.structured_logging.JsonFormatter",
+        },
         "verbose": {
-            "format": "[{asctime}] [{levelname}] [{module}] {message}",
+            "format": "[{asctime}] [{levelname}] [{module}] [{request_id}] {message}",
             "style": "{",
         },
         "simple": {
@@ -183,25 +306,14 @@ LOGGING = {
     },
     "handlers": {
         "console": {
-            "level": "DEBUG",
-            "class": "logging.StreamHandler",
-            "formatter": "verbose",
+            "()": "utils.structured_logging.QueueLogHandler",
+            "formatter": LOG_FORMAT,
+            "filters": ["request_context", "sampling"],
         },
     },
     "root": {
         "handlers": ["console"],
-        "level": "DEBUG",
-    },
-    "loggers": {
-        "django": {
-            "handlers": ["console"],
-            "level": "WARNING",
-            "propagate": False,
-        },
-        "ui": {
-            "handlers": ["console"],
-            "level": "DEBUG",
-            "propagate": False,
-        },
+        "level": LOG_LEVEL,
     },
+    "loggers": {name: {"level": level} for name, level in LOG_LEVELS.items()},
 }
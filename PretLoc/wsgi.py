@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PretLoc.settings")
 
 application = get_wsgi_application()
+
+# Load the PDF rendering resources before serving the first request
+from ui.reservation.pdf import warm_up  # noqa: E402
+
+warm_up()
@@ -0,0 +1,83 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from utils.metrics import CACHE_REQUESTS
+from .models import UserProfile
+
+UserModel = get_user_model()
+
+# Utilisateurs récemment chargés par ce processus : id -> (expiration, utilisateur)
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+USER_CACHE_MAX_SIZE = 1000
+
+
+def forget_user(user_id):
+    """
+    Retire un utilisateur du cache de ce processus.
+    :param user_id: Identifiant de l'utilisateur
+    """
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
+@receiver([post_save, post_delete], sender=UserModel)
+def forget_saved_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def forget_saved_profile(sender, instance, **kwargs):
+    forget_user(instance.user_id)
+
+
+class ProfileModelBackend(ModelBackend):
+    """
+    Backend d'authentification chargeant le profil avec l'utilisateur de la
+    session, en une seule requête. Les utilisateurs chargés sont gardés
+    ``AUTH_USER_CACHE_TTL`` secondes par le processus, afin que les requêtes
+    rapprochées (recherches en cours de saisie) ne les rechargent pas ; le
+    cache est vidé lorsque l'utilisateur ou son profil est enregistré par ce
+    processus. Les autres processus gardent l'utilisateur jusqu'à
+    l'expiration : un utilisateur désactivé, ou dont le mot de passe a changé,
+    y reste connecté jusque-là. Le cache est donc désactivé par défaut.
+    """
+
+    def get_user(self, user_id):
+        ttl = settings.AUTH_USER_CACHE_TTL
+        if ttl <= 0:
+            return self.load_user(user_id)
+        now = time.monotonic()
+        entry = _user_cache.get(user_id)
+        if entry is None or entry[0] <= now:
+            CACHE_REQUESTS.labels(cache="user", result="miss").inc()
+            user = self.load_user(user_id)
+            if user is None:
+                return None
+            with _user_cache_lock:
+                if len(_user_cache) >= USER_CACHE_MAX_SIZE:
+                    _user_cache.clear()
+                entry = _user_cache[user_id] = (now + ttl, user)
+        else:
+            CACHE_REQUESTS.labels(cache="user", result="hit").inc()
+        # Chaque requête reçoit sa copie, les vues peuvent la modifier
+        return copy.deepcopy(entry[1])
+
+    def load_user(self, user_id):
+        """
+        Charge un utilisateur actif avec son profil.
+        :param user_id: Identifiant de l'utilisateur
+        :return: Utilisateur, ou None
+        """
+        try:
+            user = UserModel._default_manager.select_related("profile").get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
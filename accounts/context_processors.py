@@ -0,0 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
+from .decorators import get_capability
+
+
+def capability(request):
+    """
+    Expose les capacités de l'utilisateur aux gabarits.
+    :return: Contexte contenant "capability"
+    """
+    capabilities = getattr(request, "capability", None)
+    if capabilities is None:
+        capabilities = SimpleLazyObject(lambda: get_capability(request.user))
+    return {"capability": capabilities}
@@ -1,101 +1,149 @@
+import asyncio
+import functools
 from functools import wraps
+from types import MappingProxyType
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
 from django.shortcuts import redirect
 from django.utils.translation import gettext_lazy as _
 
+# Ordre hiérarchique des types d'utilisateur
+USER_TYPE_LEVELS = {"new": 0, "client": 1, "member": 2, "manager": 3, "admin": 4}
+
+
+def _check_user_type(request, minimum_user_type):
+    """
+    Vérifie le niveau d'accès de l'utilisateur.
+    :return: None si l'accès est autorisé, sinon la redirection à renvoyer
+    """
+    # Vérifier si l'utilisateur est connecté
+    if not request.user.is_authenticated:
+        messages.error(
+            request,
+            _("Vous devez être connecté pour accéder à cette page."),
+        )
+        return redirect("ui:home")
+
+    # Si c'est un superutilisateur, lui donner toujours accès
+    if request.user.is_superuser:
+        return None
+
+    # Vérifier le niveau d'accès
+    user_level = USER_TYPE_LEVELS.get(request.user.profile.user_type, -1)
+    required_level = USER_TYPE_LEVELS.get(minimum_user_type, 0)
+
+    if user_level >= required_level:
+        return None
+    messages.error(
+        request,
+        _("Accès refusé. Votre compte ne dispose pas des permissions suffisantes."),
+    )
+    return redirect("ui:home")
+
 
 def user_type_required(minimum_user_type):
     """
     Décorateur qui vérifie si le type d'utilisateur a un niveau d'accès suffisant.
     La hiérarchie des types est: new < client < member < manager < admin
+    Fonctionne avec les vues synchrones et asynchrones.
     """
 
     def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # Le chargement de l'utilisateur et de son profil interroge la base
+                denied = await sync_to_async(_check_user_type)(
+                    request, minimum_user_type
+                )
+                if denied is not None:
+                    return denied
+                return await view_func(request, *args, **kwargs)
+
+            return async_wrapper
+
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
-            # Définir l'ordre hiérarchique des types d'utilisateur
-            hierarchy = {"new": 0, "client": 1, "member": 2, "manager": 3, "admin": 4}
-
-            # Vérifier si l'utilisateur est connecté
-            if not request.user.is_authenticated:
-                messages.error(
-                    request,
-                    _("Vous devez être connecté pour accéder à cette page."),
-                )
-                return redirect("ui:home")
-
-            # Si c'est un superutilisateur, lui donner toujours accès
-            if request.user.is_superuser:
-                return view_func(request, *args, **kwargs)
-
-            # Vérifier le niveau d'accès
-            user_level = hierarchy.get(request.user.profile.user_type, -1)
-            required_level = hierarchy.get(minimum_user_type, 0)
-
-            if user_level >= required_level:
-                return view_func(request, *args, **kwargs)
-            else:
-                messages.error(
-                    request,
-                    _(
-                        "Accès refusé. Votre compte ne dispose pas des permissions suffisantes."
-                    ),
-                )
-                return redirect("ui:home")
+            denied = _check_user_type(request, minimum_user_type)
+            if denied is not None:
+                return denied
+            return view_func(request, *args, **kwargs)
 
         return wrapper
 
     return decorator
 
 
+def async_login_required(view_func):
+    """
+    Équivalent de login_required pour les vues asynchrones
+    (celui de Django 4.2 ne prend en charge que les vues synchrones).
+    """
+
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+
+    return wrapper
+
+
+# Types d'utilisateur ayant chaque capacité
+CAPABILITY_USER_TYPES = {
+    # articles
+    "can_add_articles": ["admin"],
+    "can_edit_articles": ["admin", "manager"],
+    "can_delete_articles": ["admin"],
+    "can_view_articles": ["admin", "manager", "member"],
+    # customers
+    "can_view_customers": ["admin", "manager"],
+    "can_add_customers": ["admin", "manager"],
+    "can_edit_customers": ["admin", "manager"],
+    "can_delete_customers": ["admin"],
+    # categories
+    "can_add_categories": ["admin"],
+    "can_edit_categories": ["admin"],
+    "can_delete_categories": ["admin"],
+    "can_view_categories": ["admin", "manager", "member"],
+    # reservations
+    "can_add_reservations": ["admin", "manager"],
+    "can_edit_reservations": ["admin", "manager"],
+    "can_view_reservations": ["admin", "manager", "member"],
+    "can_delete_reservations": ["admin", "manager"],
+    # donations
+    "can_view_donations": ["admin", "manager"],
+    "can_add_donations": ["admin", "manager"],
+    "can_edit_donations": ["admin", "manager"],
+    "can_delete_donations": ["admin", "manager"],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def capabilities_for(user_type):
+    """
+    Capacités d'un type d'utilisateur, calculées une seule fois par type.
+    :param user_type: Type d'utilisateur, None pour un visiteur anonyme
+    :return: Dictionnaire en lecture seule des capacités
+    """
+    return MappingProxyType(
+        {
+            name: user_type in user_types
+            for name, user_types in CAPABILITY_USER_TYPES.items()
+        }
+    )
+
+
 def get_capability(user):
+    """
+    Capacités d'un utilisateur.
+    :param user: Utilisateur, éventuellement anonyme
+    :return: Dictionnaire en lecture seule des capacités
+    """
     if not user.is_authenticated:
-        return {
-            "can_add_articles": False,
-            "can_edit_articles": False,
-            "can_delete_articles": False,
-            "can_view_articles": False,
-            "can_add_categories": False,
-            "can_edit_categories": False,
-            "can_delete_categories": False,
-            "can_view_customers": False,
-            "can_add_customers": False,
-            "can_edit_customers": False,
-            "can_delete_customers": False,
-            "can_view_categories": False,
-            "can_add_reservations": False,
-            "can_view_reservations": False,
-            "can_view_donations": False,
-            "can_add_donations": False,
-            "can_edit_donations": False,
-            "can_delete_donations": False,
-        }
-    return {
-        # articles
-        "can_add_articles": user.profile.user_type in ["admin"],
-        "can_edit_articles": user.profile.user_type in ["admin", "manager"],
-        "can_delete_articles": user.profile.user_type == "admin",
-        "can_view_articles": user.profile.user_type in ["admin", "manager", "member"],
-        # customers
-        "can_view_customers": user.profile.user_type in ["admin", "manager"],
-        "can_add_customers": user.profile.user_type in ["admin", "manager"],
-        "can_edit_customers": user.profile.user_type in ["admin", "manager"],
-        "can_delete_customers": user.profile.user_type in ["admin"],
-        # categories
-        "can_add_categories": user.profile.user_type == "admin",
-        "can_edit_categories": user.profile.user_type == "admin",
-        "can_delete_categories": user.profile.user_type == "admin",
-        "can_view_categories": user.profile.user_type in ["admin", "manager", "member"],
-        # reservations
-        "can_add_reservations": user.profile.user_type in ["admin", "manager"],
-        "can_edit_reservations": user.profile.user_type in ["admin", "manager"],
-        "can_view_reservations": user.profile.user_type
-        in ["admin", "manager", "member"],
-        "can_delete_reservations": user.profile.user_type in ["admin", "manager"],
-        # donations
-        "can_view_donations": user.profile.user_type in ["admin", "manager"],
-        "can_add_donations": user.profile.user_type in ["admin", "manager"],
-        "can_edit_donations": user.profile.user_type in ["admin", "manager"],
-        "can_delete_donations": user.profile.user_type in ["admin", "manager"],
-    }
+        return capabilities_for(None)
+    return capabilities_for(user.profile.user_type)
@@ -0,0 +1,25 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+
+from .decorators import get_capability
+
+
+class CapabilityMiddleware:
+    """
+    Attache à la requête les capacités de l'utilisateur, calculées à la
+    première utilisation puis partagées par les vues et les gabarits.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Paresseux : rien n'est calculé ici, la même méthode sert aux
+        # requêtes synchrones et asynchrones
+        request.capability = SimpleLazyObject(lambda: get_capability(request.user))
+        return self.get_response(request)
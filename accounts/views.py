@@ -5,7 +5,7 @@ from django.contrib.auth.models import User
 from django.shortcuts import render, redirect
 from django.utils.translation import gettext_lazy as _
 
-from .decorators import user_type_required, get_capability
+from .decorators import user_type_required
 from .forms import SignUpForm, UserUpdateForm, ProfileUpdateForm
 from .models import UserProfile
 
@@ -35,7 +35,6 @@ def signup(request):
         "accounts/signup.html",
         {
             "form": form,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -74,7 +73,6 @@ def user_profile(request):
         "profile_form": profile_form,
         "is_admin": admin,
         "is_superuser": is_superuser,
-        "capability": get_capability(request.user),
     }
     return render(request, "accounts/profile.html", context)
 
@@ -88,7 +86,6 @@ def manage_users(request):
         "accounts/manage_users.html",
         {
             "users": users,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -128,7 +125,6 @@ def edit_user(request, user_id):
         "accounts/edit_user.html",
         {
             "user_profile": user_profile_local,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -205,7 +201,6 @@ def create_user(request):
         "accounts/create_user.html",
         {
             "user_types": user_types,
-            "capability": get_capability(request.user),
         },
     )
 
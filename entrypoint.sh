@@ -12,14 +12,9 @@ run_cmd() {
 }
 
 # Créer les répertoires nécessaires s'ils n'existent pas
-for dir in /app/data/migrations_data /app/staticfiles; do
+for dir in /app/data /app/data/metrics /app/staticfiles; do
     [[ -d $dir ]] || mkdir -p $dir
 done
-touch /app/data/migrations_data/__init__.py
-for module in admin auth contenttypes sessions ui accounts; do
-    [[ -d /app/data/migrations_data/$module ]] || mkdir -p /app/data/migrations_data/$module
-    touch /app/data/migrations_data/$module/__init__.py
-done
 
 # Créer le groupe et l'utilisateur avec les PUID/PGID fournis
 if [ ! -z "${PUID}" ] && [ ! -z "${PGID}" ]; then
@@ -53,48 +48,32 @@ fi
 
 # Attendre que la base de données soit disponible
 echo "Wait PostgreSQL available..."
-while ! nc -z db 5432; do
+while ! nc -z "${DB_HOST:-db}" "${DB_PORT:-5432}"; do
   sleep 0.5
 done
 echo "PostgreSQL now available !"
 
-
-# Appliquer les migrations
-
-echo "Saving clients informations..."
-run_cmd python -m ui.custom_migrations.migrate_customertype
-
-echo "Generating migrations"
-run_cmd python manage.py makemigrations
-echo "Applying migrations"
-run_cmd python manage.py migrate
-
-echo "Restore client informations..."
-run_cmd python -m ui.custom_migrations.migrate_customertype restore
-
-echo "Compile messages"
-chmod -R 777 /app/locale
-run_cmd django-admin compilemessages
-
-# Créer un superutilisateur si aucun n'existe
-run_cmd echo "Check superuser exist..."
-run_cmd python manage.py shell -c "
-from django.contrib.auth import get_user_model;
-User = get_user_model();
-if not User.objects.filter(is_superuser=True).exists():
-    User.objects.create_superuser('${SUPERUSER_LOGIN}', '${SUPERUSER_EMAIL}', '${SUPERUSER_PASSWORD}');
-    print('Superuser created');
-else:
-    print('Superuser already exist');
-"
-
-# Collecter les fichiers statiques
-run_cmd python manage.py collectstatic --no-input --clear || echo "Collectstatic failed, continuing anyway"
+# Préparer l'application en un seul processus : migrations seulement si leur état a changé,
+# migrations de données non encore enregistrées, superutilisateur.
+# Les traductions et fichiers statiques sont construits avec l'image.
+# STARTUP_MODE=full exécute toutes les étapes, quel que soit l'état enregistré.
+if [ "${STARTUP_MODE}" = "full" ]; then
+    run_cmd python manage.py boot --full
+else
+    run_cmd python manage.py boot
+fi
 
 # Démarrer l'application
+# SERVER_MODE=asgi sert l'application avec des workers uvicorn (vues JSON asynchrones)
+if [ "${SERVER_MODE}" = "asgi" ]; then
+    SERVER_ARGS="PretLoc.asgi:application --bind 0.0.0.0:8000 --workers=3 --worker-class uvicorn.workers.UvicornWorker"
+else
+    SERVER_ARGS="PretLoc.wsgi:application --bind 0.0.0.0:8000 --workers=3 --threads=2"
+fi
+# Hooks des workers (métriques Prometheus des workers arrêtés)
+SERVER_ARGS="${SERVER_ARGS} --config PretLoc/gunicorn.conf.py"
 if [ ! -z "${PUID}" ] && [ ! -z "${PGID}" ]; then
-    exec gosu appuser gunicorn PretLoc.wsgi:application --bind 0.0.0.0:8000 --workers=3 --threads=2
+    exec gosu appuser gunicorn ${SERVER_ARGS}
 else
-    exec gunicorn PretLoc.wsgi:application --bind 0.0.0.0:8000 --workers=3 --threads=2
+    exec gunicorn ${SERVER_ARGS}
 fi
-
@@ -8,3 +8,5 @@ import_module(".stock.admin", package=__package__)
 import_module(".reservation.admin", package=__package__)
 import_module(".customer.admin", package=__package__)
 import_module(".donation.admin", package=__package__)
+import_module(".custom_migrations.admin", package=__package__)
+import_module(".idempotency.admin", package=__package__)
@@ -0,0 +1,223 @@
+"""
+Benchmark suite for the hot paths of the application.
+
+Each benchmark is a function taking a :class:`BenchmarkContext` and running one
+iteration of the measured code path. Benchmarks are registered with the
+:func:`benchmark` decorator and run by the ``run_benchmarks`` management command.
+"""
+
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ui.reservation.models import Reservation
+from ui.reservation.pdf import render_summary_pdf, summary_queryset
+from ui.stock.models import Asset
+from utils.computations import (
+    analyze_asset_availability,
+    check_reservation_availability,
+    check_reservations_availability,
+)
+from utils.period import Period
+from utils.query_profiler import QueryProfile
+
+BENCHMARK_USERNAME = "benchmark"
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Register a benchmark function under the given name.
+    :param name: Name of the benchmark
+    :return: Decorator registering the function
+    """
+
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+class BenchmarkContext:
+    """
+    Shared inputs of the benchmarks: a logged-in client and samples of the dataset.
+    """
+
+    def __init__(self, sample_size=20):
+        """
+        Load the samples used by the benchmarks.
+        :param sample_size: Number of assets and reservations to sample
+        """
+        now = timezone.now()
+        self.period = Period(now, now + timedelta(days=30))
+        self.assets = list(Asset.objects.order_by("pk")[:sample_size])
+        self.reservations = list(
+            Reservation.objects.filter(status__in=["created", "validated"]).order_by(
+                "pk"
+            )[:sample_size]
+        )
+        self.reservation = (
+            Reservation.objects.filter(items__isnull=False).order_by("-pk").first()
+        )
+        self.client = Client(HTTP_HOST="localhost")
+        self.client.force_login(self.get_user())
+        self.session_clients = {}
+
+    @staticmethod
+    def get_user():
+        """
+        Return the superuser the benchmarks log in with, creating it if needed.
+        :return: User instance
+        """
+        user = User.objects.filter(username=BENCHMARK_USERNAME).first()
+        if user is None:
+            user = User(username=BENCHMARK_USERNAME, is_staff=True, is_superuser=True)
+            user.set_unusable_password()
+            user.save()
+        return user
+
+    def session_client(self, engine):
+        """
+        Return a client logged in with the given session engine.
+        Its middleware, and so its session engine, is loaded by its first request.
+        :param engine: Session engine module
+        :return: Client instance
+        """
+        if engine not in self.session_clients:
+            with override_settings(SESSION_ENGINE=engine):
+                client = Client(HTTP_HOST="localhost")
+                client.force_login(self.get_user())
+            self.session_clients[engine] = client
+        return self.session_clients[engine]
+
+    def get(self, url, data=None, client=None):
+        """
+        Request a URL with the benchmark client.
+        :param url: URL to request
+        :param data: Query parameters
+        :param client: Client to use instead of the default one
+        :return: HTTP response
+        """
+        response = (client or self.client).get(url, data)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        if getattr(response, "streaming", False):
+            b"".join(response.streaming_content)
+        return response
+
+
+@benchmark("analyze_asset_availability")
+def bench_analyze_asset_availability(context):
+    for asset in context.assets:
+        analyze_asset_availability(asset, context.period)
+
+
+@benchmark("check_reservation_availability")
+def bench_check_reservation_availability(context):
+    for reservation in context.reservations:
+        check_reservation_availability(reservation)
+
+
+@benchmark("check_reservations_availability")
+def bench_check_reservations_availability(context):
+    check_reservations_availability(context.reservations)
+
+
+@benchmark("search_assets")
+def bench_search_assets(context):
+    context.get(reverse("ui:search_assets"), {"q": ""})
+
+
+def search_customers(context, engine, user_cache_ttl):
+    """
+    Request the customer search with a session engine and user cache, to
+    compare the session and authentication overhead of the JSON endpoints.
+    """
+    with override_settings(SESSION_ENGINE=engine, AUTH_USER_CACHE_TTL=user_cache_ttl):
+        context.get(
+            reverse("ui:search_customers"),
+            {"q": "a"},
+            client=context.session_client(engine),
+        )
+
+
+@benchmark("search_customers_db_sessions")
+def bench_search_customers_db_sessions(context):
+    search_customers(context, "django.contrib.sessions.backends.db", 0)
+
+
+@benchmark("search_customers_cached_db_sessions")
+def bench_search_customers_cached_db_sessions(context):
+    search_customers(context, "django.contrib.sessions.backends.cached_db", 10)
+
+
+@benchmark("search_customers_signed_cookie_sessions")
+def bench_search_customers_signed_cookie_sessions(context):
+    search_customers(context, "django.contrib.sessions.backends.signed_cookies", 10)
+
+
+@benchmark("reservation_list")
+def bench_reservation_list(context):
+    context.get(reverse("ui:reservations"))
+
+
+@benchmark("stock_view")
+def bench_stock_view(context):
+    context.get(reverse("ui:stock"))
+
+
+@benchmark("reservation_calendar_data")
+def bench_reservation_calendar_data(context):
+    context.get(reverse("ui:reservation_calendar_data"), {"active_only": "true"})
+
+
+@benchmark("reservation_pdf")
+def bench_reservation_pdf(context):
+    # Served from the PDF cache after the first iteration
+    if context.reservation is not None:
+        context.get(reverse("ui:reservation_pdf", args=[context.reservation.pk]))
+
+
+@benchmark("reservation_pdf_render")
+def bench_reservation_pdf_render(context):
+    if context.reservation is not None:
+        reservation = summary_queryset().get(pk=context.reservation.pk)
+        render_summary_pdf(reservation, "http://localhost/", "http://localhost/")
+
+
+def run_benchmark(func, context, repeat=5, warmup=1):
+    """
+    Time a benchmark and count the queries of one iteration.
+    :param func: Benchmark function
+    :param context: Benchmark context
+    :param repeat: Number of timed iterations
+    :param warmup: Number of untimed iterations run first
+    :return: Dict of timings in milliseconds and query count
+    """
+    for _ in range(warmup):
+        func(context)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(context)
+        timings.append((time.perf_counter() - start) * 1000)
+    profile = QueryProfile()
+    with connection.execute_wrapper(profile):
+        func(context)
+    return {
+        "runs": repeat,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "queries": profile.count,
+        "duplicated_queries": sum(profile.duplicates().values()),
+    }
@@ -0,0 +1,9 @@
+"""
+Data migrations of the application, run in batches by the data migration
+framework (see utils/data_migrations.py) after the schema migrations.
+"""
+
+from .migrate_customertype import CustomerTypeMigration
+
+# Data migrations run at boot, in order
+DATA_MIGRATIONS = [CustomerTypeMigration]
@@ -0,0 +1,27 @@
+"""
+Admin configuration for the data migration checkpoints.
+"""
+
+from django.contrib import admin
+
+from .models import DataMigrationCheckpoint
+
+
+@admin.register(DataMigrationCheckpoint)
+class DataMigrationCheckpointAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the DataMigrationCheckpoint model, read only.
+    """
+
+    list_display = ("name", "processed", "updated", "started_at", "completed_at")
+    readonly_fields = (
+        "name",
+        "last_pk",
+        "processed",
+        "updated",
+        "started_at",
+        "completed_at",
+    )
+
+    def has_add_permission(self, request):
+        return False
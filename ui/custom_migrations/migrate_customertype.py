@@ -1,25 +1,18 @@
-#!/usr/bin/env python3
 """
-Script to safely migrate customer types from string to foreign key.
-This must be run BEFORE Django migrations to prevent data loss.
-"""
-import json
-import os
-from pathlib import Path
-from sys import stderr, path, argv
-
-# Setup Django environment
-path.append("/app")
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PretLoc.settings")
+Data migration of the customer types from strings to foreign keys.
 
-import django
+Databases of the first versions store the type of a customer as a string in
+the ``customer_type`` column of ui_customer. The migration creates the
+matching CustomerType objects, sets the foreign key of the customers in
+batches from the legacy column, then drops it.
+"""
 
-django.setup()
+from django.db import connection, models
 
-from django.db import connection, transaction
+from ui.customer.models import Customer, CustomerType
+from utils.data_migrations import DataMigration
 
-# Backup file path
-BACKUP_FILE = Path("/app/data/customer_type_backup.json")
+LEGACY_COLUMN = "customer_type"
 
 # Type mapping from old values to new CustomerType data
 TYPE_MAPPING = {
@@ -68,75 +61,41 @@ TYPE_MAPPING = {
 }
 
 
-def backup_data():
-    """Backup existing customer_type values and prepare for migration"""
-    try:
-        with connection.cursor() as cursor:
-            # Check if column exists in its original form
-            cursor.execute(
-                """
-                SELECT column_name FROM information_schema.columns
-                WHERE table_name = 'ui_customer' AND column_name = 'customer_type'
-            """
-            )
-            if not cursor.fetchone():
-                print("Column 'customer_type' not found, assuming already migrated")
-                return True
-
-            # Backup data
-            cursor.execute(
-                "SELECT id, customer_type FROM ui_customer WHERE customer_type IS NOT NULL"
-            )
-            customers = cursor.fetchall()
-
-            if not customers:
-                print("No data to backup")
-                return True
-
-            backup_data = [{"id": cust[0], "type": cust[1]} for cust in customers]
-
-            BACKUP_FILE.parent.mkdir(parents=True, exist_ok=True)
-            with open(BACKUP_FILE, "w") as f:
-                json.dump(backup_data, f, indent=2)
-
-            print(f"Backed up {len(backup_data)} customers to {BACKUP_FILE}")
-
-            # First remove the NOT NULL constraint
-            with transaction.atomic():
-                cursor.execute(
-                    "ALTER TABLE ui_customer ALTER COLUMN customer_type DROP NOT NULL"
-                )
-                print("Removed NOT NULL constraint from customer_type column")
-
-            # Now we can set values to NULL
-            with transaction.atomic():
-                cursor.execute("UPDATE ui_customer SET customer_type = NULL")
-                print("Set all customer_type values to NULL for safe migration")
-
-            return True
-    except Exception as e:
-        print(f"Error during backup: {e}")
-        return False
-
-
-def restore_data():
-    """Restore data after Django has performed the migrations"""
-    if not BACKUP_FILE.exists():
-        print("Backup file not found")
-        return False
-
-    try:
-        with open(BACKUP_FILE, "r") as f:
-            loaded_data = json.load(f)
-
-        from django.apps import apps
-
-        customer_type = apps.get_model("ui", "CustomerType")
-
-        # Create CustomerTypes
-        type_mapping = {}
+def legacy_column_exists():
+    """
+    Check whether the customers table still has the legacy type column.
+    :return: True when the column exists
+    """
+    table = Customer._meta.db_table
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return False
+        return LEGACY_COLUMN in [
+            column.name
+            for column in connection.introspection.get_table_description(cursor, table)
+        ]
+
+
+class CustomerTypeMigration(DataMigration):
+    """
+    Set the customer type foreign key from the legacy string column.
+    """
+
+    name = "customertype"
+    fields = ["customer_type"]
+
+    def get_queryset(self):
+        if not self.enabled:
+            return Customer.objects.none()
+        return Customer.objects.filter(customer_type__isnull=True).only("pk")
+
+    def before(self):
+        self.enabled = legacy_column_exists()
+        self.type_ids = {}
+        if not self.enabled:
+            return
         for old_type, data in TYPE_MAPPING.items():
-            customer_type, created = customer_type.objects.get_or_create(
+            customer_type, _ = CustomerType.objects.get_or_create(
                 code=data["code"],
                 defaults={
                     "name": data["name"],
@@ -145,53 +104,29 @@ def restore_data():
                     "color": data["color"],
                 },
             )
-            type_mapping[old_type] = customer_type.id
+            self.type_ids[old_type] = customer_type.pk
 
-        # Update customers directly through SQL to avoid ORM conflicts
+    def prepare_batch(self, rows):
         with connection.cursor() as cursor:
-            updated_count = 0
-            for item in loaded_data:
-                old_type = item["type"]
-                if old_type in type_mapping:
-                    cursor.execute(
-                        "UPDATE ui_customer SET customer_type_id = %s WHERE id = %s",
-                        [type_mapping[old_type], item["id"]],
-                    )
-                    updated_count += 1
-
-            # Clean up the old column if it still exists
-            try:
-                cursor.execute("ALTER TABLE ui_customer DROP COLUMN old_customer_type")
-                print("Dropped old_customer_type column")
-            except Exception as e:
-                print(f"old_customer_type column already removed {e}", file=stderr)
+            cursor.execute(
+                f"SELECT id, {connection.ops.quote_name(LEGACY_COLUMN)} "
+                f"FROM {connection.ops.quote_name(Customer._meta.db_table)} "
+                f"WHERE id IN ({', '.join(['%s'] * len(rows))})",
+                [row.pk for row in rows],
+            )
+            self.legacy_types = dict(cursor.fetchall())
 
-        print(f"Restoration completed for {updated_count} customers")
+    def migrate_row(self, row):
+        type_id = self.type_ids.get(self.legacy_types.get(row.pk))
+        if type_id is None:
+            return False
+        row.customer_type_id = type_id
         return True
-    except Exception as e:
-        print(f"Error during restoration: {e}")
-        return False
-
 
-def main():
-    """Main function to handle backup or restoration"""
-    if len(argv) > 1 and argv[1] == "restore":
-        if not BACKUP_FILE.exists():
-            print("Backup file not found, skipping restoration")
+    def after(self):
+        if not self.enabled:
             return
-        print("Restoration mode.")
-        success = restore_data()
-        BACKUP_FILE.unlink()
-    else:
-        print("Backup mode...")
-        success = backup_data()
-
-    if success:
-        print("Operation successful")
-    else:
-        print("Operation failed", file=stderr)
-        exit(1)
-
-
-if __name__ == "__main__":
-    main()
+        legacy_field = models.CharField(max_length=20, db_column=LEGACY_COLUMN)
+        legacy_field.set_attributes_from_name("legacy_customer_type")
+        with connection.schema_editor() as editor:
+            editor.remove_field(Customer, legacy_field)
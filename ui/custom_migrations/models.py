@@ -0,0 +1,43 @@
+"""
+Models recording the progress of the data migrations.
+"""
+
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class DataMigrationCheckpoint(models.Model):
+    """
+    Progress of a data migration: the last processed primary key, so that an
+    interrupted run resumes after it, and the number of processed rows.
+    """
+
+    name = models.CharField(max_length=100, unique=True, verbose_name=_("Nom"))
+    last_pk = models.BigIntegerField(
+        null=True, blank=True, verbose_name=_("Dernière clé traitée")
+    )
+    processed = models.PositiveBigIntegerField(
+        default=0, verbose_name=_("Lignes traitées")
+    )
+    updated = models.PositiveBigIntegerField(
+        default=0, verbose_name=_("Lignes modifiées")
+    )
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Début"))
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Fin"))
+
+    class Meta:
+        """
+        Meta information for the DataMigrationCheckpoint model.
+        """
+
+        verbose_name = _("Migration de données")
+        verbose_name_plural = _("Migrations de données")
+        ordering = ["name"]
+
+    def __str__(self):
+        """
+        String representation of the DataMigrationCheckpoint instance.
+        :return: Name of the data migration
+        """
+        return self.name
@@ -3,16 +3,22 @@ Views for managing customers and customer types.
 """
 
 from datetime import datetime
+from itertools import chain
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.db.models.deletion import ProtectedError
 from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.translation import gettext_lazy as _
 
-from accounts.decorators import user_type_required, get_capability
+from accounts.decorators import (
+    async_login_required,
+    user_type_required,
+)
+from ui.donation.models import Donation
+from utils.query_profiler import query_budget
 from .forms import (
     CustomerForm,
     CustomerTypeForm,
@@ -34,7 +40,6 @@ def customer_type_list(request):
     customer_types = CustomerType.objects.all().order_by("name")
     context = {
         "customer_types": customer_types,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/customers/customer_type_list.html", context)
 
@@ -60,7 +65,6 @@ def customer_type_create(request):
         "ui/customers/customer_type_form.html",
         {
             "form": form,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -89,7 +93,6 @@ def customer_type_update(request, pk):
         {
             "form": form,
             "customer_type": customer_type,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -118,11 +121,11 @@ def customer_type_delete(request, pk):
         "ui/customers/customer_type_confirm_delete.html",
         {
             "customer_type": customer_type,
-            "capability": get_capability(request.user),
         },
     )
 
 
+@query_budget(4)
 @login_required
 @user_type_required("manager")
 def customers_view(request):
@@ -159,8 +162,19 @@ def customers_view(request):
         )
     else:
         filters_q = None
+    current_year = datetime.now().year
+    # Cotisation de l'année payée, calculée par la requête de la liste
+    customers = Customer.objects.select_related("customer_type").annotate(
+        has_paid_membership=Exists(
+            Donation.objects.filter(
+                customer=OuterRef("pk"),
+                date__year=current_year,
+                includes_membership=True,
+            )
+        )
+    )
     if search_query:
-        customers = Customer.objects.filter(
+        customers = customers.filter(
             Q(first_name__icontains=search_query)
             | Q(last_name__icontains=search_query)
             | Q(company_name__icontains=search_query)
@@ -169,15 +183,14 @@ def customers_view(request):
             **filters,
         ).order_by(order_by)
     else:
-        customers = Customer.objects.filter(**filters).order_by(order_by)
+        customers = customers.filter(**filters).order_by(order_by)
     if filters_q is not None:
         customers = customers.filter(filters_q)
 
-    current_year = datetime.now().year
+    customers = list(customers)
     for customer in customers:
         customer.is_membership_up_to_date = (
-            customer.is_exempted_from_donation()
-            or customer.get_has_paid_membership_fee(current_year)
+            customer.is_exempted_from_donation() or customer.has_paid_membership
         )
 
     customer_types = CustomerType.objects.all().order_by("name")
@@ -191,7 +204,6 @@ def customers_view(request):
         "donation_exemption": donation_exemption,
         "sort": sort,
         "direction": direction,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/customers/list.html", context)
 
@@ -207,15 +219,22 @@ def customer_detail(request, pk):
     """
     customer = get_object_or_404(Customer, pk=pk)
 
-    # Récupérer les réservations du client
-    reservations = customer.reservations.all().order_by("-checkout_date")
+    # Récupérer les réservations du client, archivées comprises
+    reservations = sorted(
+        chain(
+            customer.reservations.all(),
+            customer.archived_reservations.all(),
+        ),
+        key=lambda reservation: reservation.checkout_date,
+        reverse=True,
+    )
 
     # Récupérer les dons du client
     donations = customer.donations.all().order_by("-date")
 
     # Calculer les statistiques
     total_donations = customer.get_total_donation_amount()
-    total_reservations = reservations.count()
+    total_reservations = len(reservations)
     current_year = datetime.now().year
     is_membership_up_to_date = customer.get_has_paid_membership_fee(current_year)
 
@@ -225,7 +244,6 @@ def customer_detail(request, pk):
         "donations": donations,
         "total_donations": total_donations,
         "total_reservations": total_reservations,
-        "capability": get_capability(request.user),
         "is_membership_up_to_date": is_membership_up_to_date,
     }
     return render(request, "ui/customers/detail.html", context)
@@ -252,7 +270,6 @@ def customer_create(request):
         "ui/customers/customer_form.html",
         {
             "form": form,
-            "capability": get_capability(request.user),
             "customer_types": CustomerType.objects.all().order_by("name"),
         },
     )
@@ -282,7 +299,6 @@ def customer_update(request, pk):
         {
             "form": form,
             "customer": customer,
-            "capability": get_capability(request.user),
             "customer_types": CustomerType.objects.all().order_by("name"),
         },
     )
@@ -307,14 +323,14 @@ def customer_delete(request, pk):
         "ui/customers/customer_confirm_delete.html",
         {
             "customer": customer,
-            "capability": get_capability(request.user),
         },
     )
 
 
-@login_required
+@query_budget(4)
+@async_login_required
 @user_type_required("manager")
-def search_customers(request):
+async def search_customers(request):
     """
     Search customers for AJAX requests (e.g., Select2).
     :param request: HTTP request object
@@ -326,12 +342,17 @@ def search_customers(request):
 
     offset = (page - 1) * page_size
 
-    customers = Customer.objects.filter(
-        Q(last_name__icontains=search_query)
-        | Q(first_name__icontains=search_query)
-        | Q(company_name__icontains=search_query)
-        | Q(email__icontains=search_query)
-    ).order_by("last_name", "company_name")[offset : offset + page_size + 1]
+    customers = [
+        customer
+        async for customer in Customer.objects.select_related("customer_type")
+        .filter(
+            Q(last_name__icontains=search_query)
+            | Q(first_name__icontains=search_query)
+            | Q(company_name__icontains=search_query)
+            | Q(email__icontains=search_query)
+        )
+        .order_by("last_name", "company_name")[offset : offset + page_size + 1]
+    ]
 
     has_more = len(customers) > page_size
     if has_more:
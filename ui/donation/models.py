@@ -3,10 +3,11 @@ Models for managing donations.
 """
 
 from django.db import models
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 
 from ui.customer.models import Customer
-from ui.reservation.models import Reservation
+from ui.reservation.models import Reservation, ReservationArchive
 
 
 class Donation(models.Model):
@@ -35,6 +36,14 @@ class Donation(models.Model):
         related_name="donations",
         verbose_name=_("Réservation associée"),
     )
+    archived_reservation = models.ForeignKey(
+        ReservationArchive,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="donations",
+        verbose_name=_("Réservation archivée associée"),
+    )
 
     class Meta:
         """
@@ -44,6 +53,17 @@ class Donation(models.Model):
         verbose_name = _("Don")
         verbose_name_plural = _("Dons")
         ordering = ["-date"]
+        indexes = [
+            models.Index(
+                fields=["customer", "date", "includes_membership"],
+                name="ui_donation_customer_date_idx",
+            ),
+            models.Index(
+                fields=["customer", "date"],
+                condition=Q(includes_membership=True),
+                name="ui_donation_membership_idx",
+            ),
+        ]
 
     def __str__(self):
         """
@@ -51,3 +71,13 @@ class Donation(models.Model):
         :return: String combining amount, customer and date
         """
         return _(f"Don de {self.amount}€ par {self.customer} le {self.date}")
+
+    @property
+    def linked_reservation(self):
+        """
+        Reservation of the donation, archived or not.
+        :return: Reservation or ReservationArchive instance, or None
+        """
+        if self.reservation_id:
+            return self.reservation
+        return self.archived_reservation
@@ -10,8 +10,9 @@ from django.db.models import Q
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.translation import gettext_lazy as _
 
-from accounts.decorators import user_type_required, get_capability
+from accounts.decorators import user_type_required
 from ui.customer.models import Customer
+from utils.idempotency import idempotent
 from .forms import DonationForm
 from .models import Donation
 
@@ -30,7 +31,9 @@ def donation_list(request):
     includes_membership = request.GET.get("includes_membership", "")
     sort = request.GET.get("sort", "-date")
 
-    donations = Donation.objects.select_related("customer", "reservation")
+    donations = Donation.objects.select_related(
+        "customer", "reservation", "archived_reservation"
+    )
 
     # Filtres
     if includes_membership:
@@ -59,13 +62,13 @@ def donation_list(request):
         "includes_membership": includes_membership,
         "sort": sort,
         "total_donations": total_donations,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/donations/list.html", context)
 
 
 @login_required
 @user_type_required("manager")
+@idempotent
 def donation_create(request):
     """
     Create a new donation.
@@ -87,8 +90,7 @@ def donation_create(request):
                 customer = Customer.objects.get(pk=customer_id)
                 initial_data["customer"] = customer
             except Customer.DoesNotExist:
-                logger.warning(f"Customer not found for ID {customer_id}")
-                pass
+                logger.warning("Customer not found for ID %s", customer_id)
         else:
             logger.debug("No customer_id provided in GET parameters")
         form = DonationForm(initial=initial_data)
@@ -96,13 +98,13 @@ def donation_create(request):
     context = {
         "form": form,
         "title": _("Créer un don"),
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/donations/form.html", context)
 
 
 @login_required
 @user_type_required("manager")
+@idempotent
 def donation_update(request, pk):
     """
     Update an existing donation.
@@ -125,13 +127,13 @@ def donation_update(request, pk):
         "form": form,
         "donation": donation,
         "title": _("Modifier le don"),
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/donations/form.html", context)
 
 
 @login_required
 @user_type_required("manager")
+@idempotent
 def donation_delete(request, pk):
     """
     Delete a donation.
@@ -148,6 +150,5 @@ def donation_delete(request, pk):
 
     context = {
         "donation": donation,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/donations/confirm_delete.html", context)
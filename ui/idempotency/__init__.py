@@ -0,0 +1,4 @@
+"""
+Results of the state-changing requests, replayed for their duplicates
+(see utils/idempotency.py).
+"""
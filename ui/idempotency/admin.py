@@ -0,0 +1,31 @@
+"""
+Admin configuration for the idempotency keys.
+"""
+
+from django.contrib import admin
+
+from .models import IdempotencyKey
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the IdempotencyKey model, read only.
+    """
+
+    list_display = ("key", "user", "path", "status_code", "created_at")
+    list_filter = ("path",)
+    search_fields = ("key", "path")
+    readonly_fields = (
+        "user",
+        "key",
+        "path",
+        "status_code",
+        "content_type",
+        "location",
+        "created_at",
+    )
+    exclude = ("content",)
+
+    def has_add_permission(self, request):
+        return False
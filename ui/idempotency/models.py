@@ -0,0 +1,44 @@
+"""
+Model recording the result of the requests made with an idempotency key.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    """
+    Result of a state-changing request, returned again to the requests of the
+    same user with the same key instead of running the view again.
+    """
+
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, related_name="+"
+    )
+    key = models.CharField(max_length=64)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=255, blank=True)
+    content = models.BinaryField(blank=True)
+    cookies = models.TextField(blank=True)
+    messages = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        """
+        Meta information for the IdempotencyKey model.
+        """
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="ui_idempotencykey_user_key_uniq"
+            )
+        ]
+
+    def __str__(self):
+        """
+        String representation of the IdempotencyKey instance.
+        :return: Key and path of the request
+        """
+        return f"{self.key} {self.path}"
@@ -0,0 +1,48 @@
+"""
+Management command moving the old closed reservations to the archive
+(see ui/reservation/archive.py).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ui.reservation.archive import archive_cutoff, archive_reservations
+
+
+class Command(BaseCommand):
+    help = "Move the reservations returned or cancelled long ago to the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=settings.RESERVATION_ARCHIVE_MONTHS,
+            help="Age in months of the reservations to archive "
+            "(default RESERVATION_ARCHIVE_MONTHS).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of reservations per batch.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options["months"])
+        start = time.perf_counter()
+        archived = archive_reservations(
+            cutoff, batch_size=options["batch_size"], progress=self.report
+        )
+        self.stdout.write(
+            f"{archived} reservations closed before {cutoff:%Y-%m-%d} archived "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+
+    def report(self, archived):
+        """
+        Print the progress of the archiving after a batch.
+        :param archived: Number of reservations archived so far
+        """
+        self.stdout.write(f"{archived} reservations archived")
@@ -0,0 +1,71 @@
+"""
+Management command auditing the stock quantities of the assets against their
+movements (see ui/stock/audit.py).
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ui.stock.audit import audit_stock, correct_stock, init_baselines
+
+
+class Command(BaseCommand):
+    help = "List the assets whose stock quantity differs from their movements."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Set the stock back to the expected quantity, recording the "
+            "differences as inventory adjustment events.",
+        )
+        parser.add_argument(
+            "--init-baseline",
+            action="store_true",
+            help="Record the reference quantity of the assets which have none, "
+            "taking their current stock quantity as correct.",
+        )
+
+    def handle(self, *args, **options):
+        if options["fix"] and options["init_baseline"]:
+            raise CommandError("--fix and --init-baseline are exclusive.")
+        start = time.perf_counter()
+        if options["init_baseline"]:
+            count = init_baselines()
+            self.stdout.write(
+                f"{count} reference quantities recorded "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+            return
+        if options["fix"]:
+            discrepancies = correct_stock()
+        else:
+            discrepancies = audit_stock()
+        elapsed = time.perf_counter() - start
+
+        for discrepancy in discrepancies:
+            if discrepancy["expected"] is None:
+                self.stdout.write(
+                    f"{discrepancy['name']} (#{discrepancy['asset']}): "
+                    f"stock {discrepancy['stock_quantity']}, no reference quantity"
+                )
+                continue
+            self.stdout.write(
+                f"{discrepancy['name']} (#{discrepancy['asset']}): "
+                f"stock {discrepancy['stock_quantity']}, "
+                f"expected {discrepancy['expected']} "
+                f"({discrepancy['difference']:+d})"
+            )
+        missing = sum(discrepancy["expected"] is None for discrepancy in discrepancies)
+        action = "corrected" if options["fix"] else "found"
+        self.stdout.write(
+            f"{len(discrepancies) - missing} discrepancies {action} in {elapsed:.2f}s"
+        )
+        if missing:
+            self.stdout.write(
+                f"{missing} assets have no reference quantity: check their stock, "
+                "then run with --init-baseline to audit them."
+            )
+        if len(discrepancies) > missing and not options["fix"]:
+            self.stdout.write("Run with --fix to record them as inventory adjustments.")
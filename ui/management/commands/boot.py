@@ -0,0 +1,254 @@
+"""
+Management command preparing the application when the container starts.
+
+Everything runs in a single process, so Django is set up only once. The
+migrations are applied only when their state hash changed: the hash covers
+the migration files and the Django version, and is stored in ``BOOT_STATE_FILE`` with the number of migrations
+recorded in the database, so that a new or restored database is migrated
+even when the hash is unchanged. The translations and static files are
+built with the image; they are only built here when they are missing.
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import time
+from pathlib import Path
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+
+from ui.custom_migrations import DATA_MIGRATIONS
+from utils import metrics
+
+
+def migration_files():
+    """
+    Migration files of every application.
+    :return: Sorted list of Path
+    """
+    files = set()
+    for app_config in apps.get_app_configs():
+        module_name, _ = MigrationLoader.migrations_module(app_config.label)
+        if module_name is None:
+            continue
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        for directory in getattr(module, "__path__", []):
+            files.update(Path(directory).glob("*.py"))
+    return sorted(files)
+
+
+def migration_state_hash():
+    """
+    Hash of the migration files and the Django version.
+    :return: Hexadecimal digest
+    """
+    digest = hashlib.sha256(django.get_version().encode())
+    for path in migration_files():
+        digest.update(str(path).encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+# Applications whose migrations were generated at boot in data/migrations_data
+LEGACY_MIGRATION_APPS = ["admin", "auth", "contenttypes", "sessions"]
+
+
+def take_over_legacy_history():
+    """
+    Record as applied the migrations of the Django applications on a
+    database created by the migrations formerly generated at boot. These
+    created the tables of the Django applications in their final state with
+    a single recorded initial migration, so their later migrations (removal
+    of the name of the content types, changes of the auth fields, ...) must
+    not run.
+    :return: List of the recorded (app_label, name)
+    """
+    recorder = MigrationRecorder(connection)
+    if not recorder.has_table():
+        return []
+    applied = recorder.applied_migrations()
+    if ("contenttypes", "0001_initial") not in applied or (
+        "contenttypes",
+        "0002_remove_content_type_name",
+    ) in applied:
+        return []
+    # Created by the real initial migration, the name column is only removed
+    # by the second one
+    with connection.cursor() as cursor:
+        columns = connection.introspection.get_table_description(
+            cursor, "django_content_type"
+        )
+    if "name" in {column.name for column in columns}:
+        return []
+
+    loader = MigrationLoader(connection, ignore_no_migrations=True)
+    missing = sorted(
+        key
+        for key in loader.graph.nodes
+        if key[0] in LEGACY_MIGRATION_APPS and key not in applied
+    )
+    for app_label, name in missing:
+        recorder.record_applied(app_label, name)
+    return missing
+
+
+def applied_migrations_count():
+    """
+    Number of migrations recorded in the database.
+    :return: Count, or None when the migrations table does not exist
+    """
+    recorder = MigrationRecorder(connection)
+    if not recorder.has_table():
+        return None
+    return recorder.migration_qs.count()
+
+
+class Command(BaseCommand):
+    help = "Prepare the database, translations and static files before starting the server."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Run every step, whatever the recorded state.",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        state = self.load_state()
+        self.migrate(state, options["full"])
+        self.ensure_superuser()
+        self.build_assets(options["full"])
+        # Metrics of the worker processes of the previous run
+        metrics.reset()
+        self.stdout.write(
+            f"Boot completed in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+
+    def load_state(self):
+        """
+        Read the state recorded by the previous boot.
+        :return: State dict
+        """
+        try:
+            return json.loads(Path(settings.BOOT_STATE_FILE).read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save_state(self, state):
+        """
+        Record the state of this boot.
+        :param state: State dict
+        """
+        path = Path(settings.BOOT_STATE_FILE)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".tmp")
+        temporary.write_text(json.dumps(state, indent=2))
+        os.replace(temporary, path)
+
+    def migrate(self, state, full):
+        """
+        Apply the migrations when their state changed, and run
+        the data migrations not recorded yet.
+        :param state: State recorded by the previous boot
+        :param full: Ignore the recorded state
+        """
+        done = set(state.get("data_migrations", []))
+        pending = [
+            migration
+            for migration in DATA_MIGRATIONS
+            if full or migration.name not in done
+        ]
+        if (
+            not full
+            and not pending
+            and state.get("hash") == migration_state_hash()
+            and state.get("applied") == applied_migrations_count()
+        ):
+            self.stdout.write("Migrations up to date")
+            return
+
+        self.stdout.write("Applying migrations")
+        legacy = take_over_legacy_history()
+        if legacy:
+            self.stdout.write(
+                f"{len(legacy)} migrations of the Django applications recorded "
+                "as applied (database created by the generated migrations)"
+            )
+        # Databases created by the migrations formerly generated at boot
+        # already have the tables of the initial migrations
+        call_command("migrate", interactive=False, fake_initial=True, verbosity=0)
+        for migration in pending:
+            self.stdout.write(f"Running data migration {migration.name}")
+            checkpoint = migration().run()
+            self.stdout.write(
+                f"{checkpoint.processed} rows processed, {checkpoint.updated} updated"
+            )
+
+        self.save_state(
+            {
+                "hash": migration_state_hash(),
+                "applied": applied_migrations_count(),
+                "data_migrations": sorted(
+                    done | {migration.name for migration in pending}
+                ),
+            }
+        )
+
+    def ensure_superuser(self):
+        """
+        Create the superuser from the SUPERUSER_* environment variables
+        when there is none.
+        """
+        User = get_user_model()
+        if User.objects.filter(is_superuser=True).exists():
+            self.stdout.write("Superuser already exist")
+            return
+        login = os.environ.get("SUPERUSER_LOGIN")
+        if not login:
+            self.stderr.write("No superuser and SUPERUSER_LOGIN is not set")
+            return
+        User.objects.create_superuser(
+            login,
+            os.environ.get("SUPERUSER_EMAIL", ""),
+            os.environ.get("SUPERUSER_PASSWORD"),
+        )
+        self.stdout.write("Superuser created")
+
+    def build_assets(self, full):
+        """
+        Compile the translations and collect the static files when the image
+        does not contain them already.
+        :param full: Build them anyway
+        """
+        stale = [
+            po
+            for locale_path in settings.LOCALE_PATHS
+            for po in Path(locale_path).glob("*/LC_MESSAGES/*.po")
+            if not po.with_suffix(".mo").exists()
+            or po.with_suffix(".mo").stat().st_mtime < po.stat().st_mtime
+        ]
+        if full or stale:
+            self.stdout.write("Compile messages")
+            try:
+                call_command("compilemessages", verbosity=0)
+            except Exception as e:
+                self.stderr.write(f"Compilemessages failed, continuing anyway: {e}")
+        if full or not (Path(settings.STATIC_ROOT) / "staticfiles.json").exists():
+            self.stdout.write("Collect static files")
+            try:
+                call_command("collectstatic", interactive=False, verbosity=0)
+            except Exception as e:
+                self.stderr.write(f"Collectstatic failed, continuing anyway: {e}")
@@ -0,0 +1,162 @@
+"""
+Management command flagging the migrations which would lock a large table.
+
+Run it against the production database before a deployment: it lists the
+operations of the unapplied migrations (or of the given migrations) that
+block the reads or writes of a table while they run, when that table holds
+more than ``--large-table-rows`` rows.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.migrations import operations
+from django.db.migrations.executor import MigrationExecutor
+
+from utils.migration_operations import AddIndexConcurrently, PartitionByYear
+
+
+def locking_reason(operation):
+    """
+    Describe how an operation locks its table.
+    :param operation: Migration operation
+    :return: Reason, or None when the operation does not lock a table
+    """
+    if isinstance(operation, AddIndexConcurrently):
+        return None
+    if isinstance(operation, PartitionByYear):
+        return "copies the table under an exclusive lock"
+    if isinstance(operation, operations.AddIndex):
+        return "blocks writes while the index is built, use AddIndexConcurrently"
+    if isinstance(operation, operations.AddConstraint):
+        return "blocks writes while the constraint is validated"
+    if isinstance(
+        operation, (operations.AlterUniqueTogether, operations.AlterIndexTogether)
+    ):
+        return "blocks writes while the index is built"
+    if isinstance(operation, operations.AlterField):
+        return "may rewrite the table under an exclusive lock"
+    if isinstance(operation, operations.AddField):
+        field = operation.field
+        if not field.null and not field.has_default():
+            return "adds a NOT NULL column without default, add it nullable and use BackfillField"
+        if field.unique or field.db_index or field.remote_field:
+            return "blocks writes while the index or foreign key is created"
+    return None
+
+
+def operation_table(operation, state, app_label):
+    """
+    Table changed by an operation.
+    :param operation: Migration operation
+    :param state: Project state before the operation
+    :param app_label: Label of the application of the migration
+    :return: Table name, or None for operations not bound to an existing model
+    """
+    model_name = getattr(operation, "model_name", None)
+    if isinstance(
+        operation, (operations.AlterUniqueTogether, operations.AlterIndexTogether)
+    ):
+        model_name = operation.name
+    if model_name is None:
+        return None
+    try:
+        model_state = state.models[app_label, model_name.lower()]
+    except KeyError:
+        return None
+    return (
+        model_state.options.get("db_table") or f"{app_label}_{model_state.name_lower}"
+    )
+
+
+def estimated_rows(table):
+    """
+    Estimate the number of rows of a table.
+    :param table: Table name
+    :return: Number of rows, 0 when the table does not exist yet
+    """
+    if table not in connection.introspection.table_names():
+        return 0
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE relname = %s AND pg_table_is_visible(oid)",
+                [table],
+            )
+            row = cursor.fetchone()
+            # -1 when the table was never analyzed
+            if row and row[0] >= 0:
+                return row[0]
+        cursor.execute(f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}")
+        return cursor.fetchone()[0]
+
+
+def unsafe_operations(plan, loader, large_table_rows):
+    """
+    Find the locking operations on large tables.
+    :param plan: List of Migration to check, in order
+    :param loader: Migration loader
+    :param large_table_rows: Minimal number of rows of a large table
+    :return: List of (migration, operation, table, rows, reason)
+    """
+    found = []
+    for migration in plan:
+        state = loader.project_state(
+            (migration.app_label, migration.name), at_end=False
+        )
+        for operation in migration.operations:
+            reason = locking_reason(operation)
+            table = operation_table(operation, state, migration.app_label)
+            if reason and table:
+                rows = estimated_rows(table)
+                if rows >= large_table_rows:
+                    found.append((migration, operation, table, rows, reason))
+            operation.state_forwards(migration.app_label, state)
+    return found
+
+
+class Command(BaseCommand):
+    help = "Flag the migration operations which lock large tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "migrations",
+            nargs="*",
+            help="Migrations to check (app_label.migration_name), all unapplied migrations by default.",
+        )
+        parser.add_argument(
+            "--large-table-rows",
+            type=int,
+            default=10000,
+            help="Number of rows from which a table is considered large.",
+        )
+
+    def handle(self, *args, **options):
+        executor = MigrationExecutor(connection)
+        loader = executor.loader
+        if options["migrations"]:
+            plan = []
+            for label in options["migrations"]:
+                app_label, _, name = label.partition(".")
+                try:
+                    plan.append(loader.get_migration_by_prefix(app_label, name))
+                except (KeyError, ValueError) as e:
+                    raise CommandError(f"Unknown migration {label}: {e}")
+        else:
+            plan = [
+                migration
+                for migration, backwards in executor.migration_plan(
+                    loader.graph.leaf_nodes()
+                )
+                if not backwards
+            ]
+
+        found = unsafe_operations(plan, loader, options["large_table_rows"])
+        for migration, operation, table, rows, reason in found:
+            self.stdout.write(
+                f"{migration.app_label}.{migration.name}: {operation.describe()} "
+                f"on {table} (~{rows} rows): {reason}"
+            )
+        if found:
+            raise CommandError(f"{len(found)} locking operation(s) on large tables")
+        self.stdout.write(f"{len(plan)} migration(s) checked, no locking operation")
@@ -0,0 +1,48 @@
+"""
+Management command compacting the stock events older than the retention
+horizon (see ui/stock/compaction.py).
+"""
+
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ui.stock.compaction import compact_stock_events
+
+
+class Command(BaseCommand):
+    help = "Replace the old stock events by their sum per asset, archiving them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=settings.STOCK_EVENT_RETENTION_DAYS,
+            help="Age in days of the events to compact "
+            "(default STOCK_EVENT_RETENTION_DAYS).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="Number of assets per batch."
+        )
+
+    def handle(self, *args, **options):
+        horizon = timezone.now() - datetime.timedelta(days=options["retention_days"])
+        start = time.perf_counter()
+        archived, compacted = compact_stock_events(
+            horizon, batch_size=options["batch_size"], progress=self.report
+        )
+        self.stdout.write(
+            f"{archived} events before {horizon:%Y-%m-%d} archived, "
+            f"{compacted} assets compacted in {time.perf_counter() - start:.2f}s"
+        )
+
+    def report(self, archived, compacted):
+        """
+        Print the progress of the compaction after a batch.
+        :param archived: Number of events archived so far
+        :param compacted: Number of assets compacted so far
+        """
+        self.stdout.write(f"{archived} events archived, {compacted} assets compacted")
@@ -0,0 +1,51 @@
+"""
+Management command creating the yearly partitions of the stock events in
+advance (see utils/partitioning.py). Run it once a year, before the new
+year: the events of a year without partition go to the default partition,
+whose rows are read by every query.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from ui.stock.models import StockEvent
+from utils.partitioning import (
+    create_year_partition,
+    default_partition_years,
+    is_partitioned,
+    partition_name,
+)
+
+
+class Command(BaseCommand):
+    help = "Create the yearly partitions of the stock events of the coming years."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--years",
+            type=int,
+            default=2,
+            help="Number of years after the current one to create a partition for.",
+        )
+
+    def handle(self, *args, **options):
+        table = StockEvent._meta.db_table
+        column = StockEvent._meta.get_field("date").column
+        if not is_partitioned(connection, table):
+            raise CommandError(f"{table} is not a partitioned PostgreSQL table")
+
+        current = timezone.now().year
+        years = set(range(current, current + options["years"] + 1))
+        # Years whose events fell into the default partition
+        years |= default_partition_years(connection, table, column)
+        created = 0
+        for year in sorted(years):
+            moved = create_year_partition(connection, table, column, year)
+            if moved is None:
+                continue
+            created += 1
+            self.stdout.write(
+                f"{partition_name(table, year)} created, {moved} events moved"
+            )
+        self.stdout.write(f"{created} partition(s) created")
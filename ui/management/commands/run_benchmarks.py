@@ -0,0 +1,81 @@
+"""
+Management command running the benchmark suite and reporting the results as JSON.
+"""
+
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from ui.benchmarks import BENCHMARKS, BenchmarkContext, run_benchmark
+from ui.customer.models import Customer
+from ui.donation.models import Donation
+from ui.reservation.models import Reservation, ReservationItem
+from ui.stock.models import Asset, Category, StockEvent
+
+
+class Command(BaseCommand):
+    help = "Time the hot paths of the application and report timings and query counts as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Timed iterations per benchmark."
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=1, help="Untimed iterations per benchmark."
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=20,
+            help="Number of assets and reservations sampled by the benchmarks.",
+        )
+        parser.add_argument(
+            "--only",
+            action="append",
+            choices=sorted(BENCHMARKS),
+            help="Run only this benchmark (can be repeated).",
+        )
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+
+        context = BenchmarkContext(sample_size=options["sample"])
+        names = options["only"] or list(BENCHMARKS)
+        results = {}
+        for name in names:
+            self.stderr.write(f"Running {name}...")
+            results[name] = run_benchmark(
+                BENCHMARKS[name],
+                context,
+                repeat=options["repeat"],
+                warmup=options["warmup"],
+            )
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "dataset": {
+                "categories": Category.objects.count(),
+                "assets": Asset.objects.count(),
+                "customers": Customer.objects.count(),
+                "reservations": Reservation.objects.count(),
+                "reservation_items": ReservationItem.objects.count(),
+                "stock_events": StockEvent.objects.count(),
+                "donations": Donation.objects.count(),
+            },
+            "benchmarks": results,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
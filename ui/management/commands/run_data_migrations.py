@@ -0,0 +1,55 @@
+"""
+Management command running the data migrations, with their throughput.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ui.custom_migrations import DATA_MIGRATIONS
+from ui.custom_migrations.models import DataMigrationCheckpoint
+
+
+class Command(BaseCommand):
+    help = "Run the data migrations not completed yet, resuming interrupted ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "names",
+            nargs="*",
+            help="Data migrations to run, all of them by default.",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Forget the progress of the data migrations and run them from the start.",
+        )
+        parser.add_argument("--batch-size", type=int, help="Number of rows per batch.")
+
+    def handle(self, *args, **options):
+        migrations = {migration.name: migration for migration in DATA_MIGRATIONS}
+        names = options["names"] or list(migrations)
+        unknown = set(names) - set(migrations)
+        if unknown:
+            raise CommandError(f"Unknown data migrations: {', '.join(sorted(unknown))}")
+        if options["reset"]:
+            DataMigrationCheckpoint.objects.filter(name__in=names).delete()
+
+        for name in names:
+            migration = migrations[name]()
+            if options["batch_size"]:
+                migration.batch_size = options["batch_size"]
+            checkpoint = migration.run(progress=self.report)
+            self.stdout.write(
+                f"{name}: completed, {checkpoint.processed} rows processed, "
+                f"{checkpoint.updated} updated"
+            )
+
+    def report(self, checkpoint, rate):
+        """
+        Print the progress of a data migration after a batch.
+        :param checkpoint: DataMigrationCheckpoint instance
+        :param rate: Throughput of the run (rows per second)
+        """
+        self.stdout.write(
+            f"{checkpoint.name}: {checkpoint.processed} rows processed, "
+            f"{checkpoint.updated} updated ({rate:.0f} rows/s)"
+        )
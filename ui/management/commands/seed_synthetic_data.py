@@ -0,0 +1,344 @@
+"""
+Management command seeding a synthetic dataset for benchmarks and load tests.
+"""
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ui.customer.models import Customer, CustomerType
+from ui.donation.models import Donation
+from ui.reservation.models import Reservation, ReservationItem
+from ui.stock.models import Asset, Category, StockEvent
+
+CUSTOMER_TYPES = [
+    # code, name, entity type, donation exemption, donation coefficient
+    ("MEMBER", "Membre du CA", "physical", True, 1.0),
+    ("PHYSICAL", "Personne physique", "physical", False, 1.0),
+    ("PHYS_EXT", "Personne physique extérieure", "physical", False, 2.0),
+    ("LEGAL", "Personne morale", "legal", False, 1.0),
+    ("ASSO", "Association", "legal", False, 0.5),
+]
+
+RESERVATION_STATUSES = ["created", "validated", "checked_out", "returned", "cancelled"]
+STATUS_WEIGHTS = [2, 3, 2, 10, 2]
+
+EVENT_TYPES = ["ACQUISITION", "INVENTORY_ADJUSTMENT", "SALE", "DESTRUCTION"]
+EVENT_WEIGHTS = [4, 3, 1, 1]
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic dataset of categories, assets, customers, reservations, stock events and donations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--assets", type=int, default=200)
+        parser.add_argument("--customers", type=int, default=300)
+        parser.add_argument("--reservations", type=int, default=1000)
+        parser.add_argument("--stock-events", type=int, default=2000)
+        parser.add_argument("--donations", type=int, default=500)
+        parser.add_argument(
+            "--years",
+            type=int,
+            default=3,
+            help="Number of years of history to spread the data over.",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete existing stock, customer, reservation and donation data first.",
+        )
+        parser.add_argument(
+            "--append",
+            action="store_true",
+            help="Add the synthetic data to an existing dataset.",
+        )
+
+    def handle(self, *args, **options):
+        if options["flush"]:
+            self.flush()
+        elif Asset.objects.exists() and not options["append"]:
+            raise CommandError(
+                "The database already contains assets, use --flush or --append."
+            )
+        if options["assets"] and not options["categories"]:
+            raise CommandError("Assets need at least one category.")
+
+        self.random = random.Random(options["seed"])
+        self.now = timezone.now().replace(second=0, microsecond=0)
+        self.history = timedelta(days=365 * max(options["years"], 1))
+
+        with transaction.atomic():
+            categories = self.create_categories(options["categories"])
+            assets = self.create_assets(options["assets"], categories)
+            customers = self.create_customers(options["customers"])
+            reservations = self.create_reservations(
+                options["reservations"], customers, assets
+            )
+            self.create_stock_events(options["stock_events"], assets)
+            self.create_donations(options["donations"], customers, reservations)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(categories)} categories, {len(assets)} assets, "
+                f"{len(customers)} customers, {len(reservations)} reservations, "
+                f"{options['stock_events']} stock events and "
+                f"{options['donations']} donations."
+            )
+        )
+
+    def flush(self):
+        """
+        Delete the existing business data.
+        """
+        with transaction.atomic():
+            Donation.objects.all().delete()
+            Reservation.objects.all().delete()
+            StockEvent.objects.all().delete()
+            Asset.objects.all().delete()
+            Category.objects.all().delete()
+            Customer.objects.all().delete()
+
+    def random_date(self, start, end):
+        """
+        Pick a random date, at minute resolution, between two dates.
+        :param start: Lower bound
+        :param end: Upper bound
+        :return: Random date
+        """
+        minutes = max(int((end - start).total_seconds() // 60), 0)
+        return start + timedelta(minutes=self.random.randint(0, minutes))
+
+    def create_categories(self, count):
+        """
+        Create the categories.
+        :param count: Number of categories
+        :return: List of Category instances
+        """
+        return Category.objects.bulk_create(
+            [
+                Category(
+                    name=f"Catégorie {i}", description=f"Catégorie synthétique {i}"
+                )
+                for i in range(count)
+            ]
+        )
+
+    def create_assets(self, count, categories):
+        """
+        Create the assets.
+        :param count: Number of assets
+        :param categories: Categories to spread the assets over
+        :return: List of Asset instances
+        """
+        assets = []
+        for i in range(count):
+            replacement_value = Decimal(self.random.randint(5, 500))
+            assets.append(
+                Asset(
+                    name=f"Article {i}",
+                    description=f"Article synthétique {i}",
+                    category=self.random.choice(categories),
+                    stock_quantity=self.random.randint(1, 50),
+                    replacement_value=replacement_value,
+                    rental_value=(replacement_value / 10).quantize(Decimal("0.01")),
+                )
+            )
+        return Asset.objects.bulk_create(assets, batch_size=1000)
+
+    def create_customers(self, count):
+        """
+        Create the customers, spread over the standard customer types.
+        :param count: Number of customers
+        :return: List of Customer instances
+        """
+        customer_types = []
+        for code, name, entity_type, exemption, coefficient in CUSTOMER_TYPES:
+            customer_type, _ = CustomerType.objects.get_or_create(
+                code=code,
+                defaults={
+                    "name": name,
+                    "entity_type": entity_type,
+                    "donation_exemption": exemption,
+                    "donation_coefficient": coefficient,
+                },
+            )
+            customer_types.append(customer_type)
+
+        customers = []
+        for i in range(count):
+            customer_type = customer_types[i % len(customer_types)]
+            customers.append(
+                Customer(
+                    customer_type=customer_type,
+                    first_name=f"Prénom {i}",
+                    last_name=f"Nom {i}",
+                    company_name=(
+                        f"Société {i}" if customer_type.entity_type == "legal" else ""
+                    ),
+                    email=f"client{i}@example.com",
+                    phone=f"06{i:08d}",
+                    address=f"{i} rue de la Paix",
+                )
+            )
+        return Customer.objects.bulk_create(customers, batch_size=1000)
+
+    def reservation_dates(self, status):
+        """
+        Pick planned and actual dates consistent with a reservation status.
+        :param status: Reservation status
+        :return: Tuple (checkout, return, actual checkout, actual return)
+        """
+        duration = timedelta(
+            days=self.random.randint(0, 7), hours=self.random.randint(1, 12)
+        )
+        future = self.now + timedelta(days=180)
+        if status == "returned":
+            checkout = self.random_date(self.now - self.history, self.now - duration)
+        elif status == "checked_out":
+            checkout = self.random_date(self.now - timedelta(days=14), self.now)
+        elif status == "cancelled":
+            checkout = self.random_date(self.now - self.history, future)
+        else:
+            checkout = self.random_date(self.now - timedelta(days=7), future)
+        return_date = checkout + duration
+
+        actual_checkout = actual_return = None
+        if status in ["checked_out", "returned"]:
+            actual_checkout = checkout + timedelta(minutes=self.random.randint(-60, 60))
+        if status == "returned":
+            actual_return = return_date + timedelta(
+                minutes=self.random.randint(-120, 600)
+            )
+        return checkout, return_date, actual_checkout, actual_return
+
+    def create_reservations(self, count, customers, assets):
+        """
+        Create the reservations in every status, with their items.
+        :param count: Number of reservations
+        :param customers: Customers making the reservations
+        :param assets: Assets to reserve
+        :return: List of Reservation instances
+        """
+        if not customers or not assets:
+            return []
+        reservations = []
+        for i in range(count):
+            if i < len(RESERVATION_STATUSES):
+                status = RESERVATION_STATUSES[i]
+            else:
+                status = self.random.choices(RESERVATION_STATUSES, STATUS_WEIGHTS)[0]
+            checkout, return_date, actual_checkout, actual_return = (
+                self.reservation_dates(status)
+            )
+            reservations.append(
+                Reservation(
+                    customer=self.random.choice(customers),
+                    status=status,
+                    checkout_date=checkout,
+                    return_date=return_date,
+                    actual_checkout_date=actual_checkout,
+                    actual_return_date=actual_return,
+                    validated_at=checkout if status != "created" else None,
+                    cancelled_at=checkout if status == "cancelled" else None,
+                )
+            )
+        reservations = Reservation.objects.bulk_create(reservations, batch_size=1000)
+
+        items = []
+        for reservation in reservations:
+            for asset in self.random.sample(assets, min(len(assets), 6))[
+                : self.random.randint(1, 6)
+            ]:
+                reserved = self.random.randint(1, 3)
+                item = ReservationItem(
+                    reservation=reservation, asset=asset, quantity_reserved=reserved
+                )
+                if reservation.status in ["checked_out", "returned"]:
+                    item.quantity_checked_out = reserved
+                if reservation.status == "returned":
+                    item.quantity_damaged = int(self.random.random() < 0.05)
+                    item.quantity_returned = reserved - item.quantity_damaged
+                items.append(item)
+        ReservationItem.objects.bulk_create(items, batch_size=1000)
+        return reservations
+
+    def create_stock_events(self, count, assets):
+        """
+        Create the stock events; issues are usually followed by a repair.
+        :param count: Number of stock events
+        :param assets: Assets concerned by the events
+        """
+        if not assets:
+            return
+        events = []
+        while len(events) < count:
+            asset = self.random.choice(assets)
+            date = self.random_date(self.now - self.history, self.now)
+            if self.random.random() < 0.3:
+                quantity = self.random.randint(1, 2)
+                events.append(
+                    StockEvent(
+                        asset=asset, event_type="ISSUE", quantity=quantity, date=date
+                    )
+                )
+                if self.random.random() < 0.8 and len(events) < count:
+                    events.append(
+                        StockEvent(
+                            asset=asset,
+                            event_type="REPAIR",
+                            quantity=quantity,
+                            date=self.random_date(date, date + timedelta(days=60)),
+                        )
+                    )
+            else:
+                events.append(
+                    StockEvent(
+                        asset=asset,
+                        event_type=self.random.choices(EVENT_TYPES, EVENT_WEIGHTS)[0],
+                        quantity=self.random.randint(1, 5),
+                        date=date,
+                    )
+                )
+        StockEvent.objects.bulk_create(events, batch_size=1000)
+
+    def create_donations(self, count, customers, reservations):
+        """
+        Create the donations, some of them linked to returned reservations.
+        :param count: Number of donations
+        :param customers: Customers making the donations
+        :param reservations: Reservations the donations may be linked to
+        """
+        if not customers:
+            return
+        returned = [r for r in reservations if r.status == "returned"]
+        donations = []
+        dates = []
+        for _ in range(count):
+            reservation = None
+            if returned and self.random.random() < 0.5:
+                reservation = self.random.choice(returned)
+                customer = reservation.customer
+                date = reservation.actual_return_date.date()
+            else:
+                customer = self.random.choice(customers)
+                date = self.random_date(self.now - self.history, self.now).date()
+            donations.append(
+                Donation(
+                    customer=customer,
+                    amount=Decimal(self.random.randint(5, 200)),
+                    includes_membership=self.random.random() < 0.3,
+                    reservation=reservation,
+                )
+            )
+            dates.append(date)
+        donations = Donation.objects.bulk_create(donations, batch_size=1000)
+        # auto_now_add overrides the date on creation, restore the synthetic one
+        for donation, date in zip(donations, dates):
+            donation.date = date
+        Donation.objects.bulk_update(donations, ["date"], batch_size=1000)
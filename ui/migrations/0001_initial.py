@@ -0,0 +1,535 @@
+# Generated by Django 4.2.10 on 2026-10-19 12:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Category",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, verbose_name="Nom")),
+                (
+                    "description",
+                    models.TextField(blank=True, verbose_name="Description"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Catégorie",
+                "verbose_name_plural": "Catégories",
+            },
+        ),
+        migrations.CreateModel(
+            name="Customer",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "first_name",
+                    models.CharField(blank=True, max_length=100, verbose_name="Prénom"),
+                ),
+                (
+                    "last_name",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="Nom de famille"
+                    ),
+                ),
+                (
+                    "company_name",
+                    models.CharField(
+                        blank=True, max_length=200, verbose_name="Raison sociale"
+                    ),
+                ),
+                (
+                    "legal_rep_first_name",
+                    models.CharField(
+                        blank=True,
+                        max_length=100,
+                        verbose_name="Prénom du représentant",
+                    ),
+                ),
+                (
+                    "legal_rep_last_name",
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name="Nom du représentant"
+                    ),
+                ),
+                ("email", models.EmailField(max_length=254, verbose_name="Email")),
+                (
+                    "phone",
+                    models.CharField(
+                        blank=True, max_length=20, verbose_name="Téléphone"
+                    ),
+                ),
+                ("address", models.TextField(verbose_name="Adresse")),
+                (
+                    "donation_exemption",
+                    models.BooleanField(
+                        default=False, verbose_name="Exonération de don"
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Notes")),
+                (
+                    "donation_coefficient",
+                    models.FloatField(
+                        default=0.0,
+                        help_text="Coefficient appliqué aux dons effectués par ce client, 0 applique le coefficient pour son type.",
+                        verbose_name="Coefficient de don",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Client",
+                "verbose_name_plural": "Clients",
+                "ordering": ["last_name", "company_name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="CustomerType",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, verbose_name="Nom")),
+                (
+                    "code",
+                    models.CharField(max_length=20, unique=True, verbose_name="Code"),
+                ),
+                (
+                    "description",
+                    models.TextField(blank=True, verbose_name="Description"),
+                ),
+                (
+                    "entity_type",
+                    models.CharField(
+                        choices=[
+                            ("physical", "Personne physique"),
+                            ("legal", "Personne morale"),
+                        ],
+                        max_length=10,
+                        verbose_name="Type d'entité",
+                    ),
+                ),
+                (
+                    "color",
+                    models.CharField(
+                        default="#3498db", max_length=20, verbose_name="Couleur"
+                    ),
+                ),
+                (
+                    "donation_exemption",
+                    models.BooleanField(
+                        default=False, verbose_name="Exonération de don"
+                    ),
+                ),
+                (
+                    "donation_coefficient",
+                    models.FloatField(default=1.0, verbose_name="Coefficient de don"),
+                ),
+                (
+                    "reservation_period_days",
+                    models.IntegerField(
+                        default=360,
+                        verbose_name="Période de réservation (jours avant manifestation)",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Type de client",
+                "verbose_name_plural": "Types de clients",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="Reservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "checkout_date",
+                    models.DateTimeField(verbose_name="Date de sortie prévue"),
+                ),
+                (
+                    "return_date",
+                    models.DateTimeField(verbose_name="Date de retour prévue"),
+                ),
+                (
+                    "actual_checkout_date",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Date de sortie réelle"
+                    ),
+                ),
+                (
+                    "actual_return_date",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Date de retour réelle"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("created", "Créée"),
+                            ("validated", "Validée"),
+                            ("checked_out", "Sortie"),
+                            ("returned", "Rendue"),
+                            ("cancelled", "Annulée"),
+                        ],
+                        default="created",
+                        max_length=20,
+                        verbose_name="Statut",
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Notes")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("validated_at", models.DateTimeField(blank=True, null=True)),
+                ("cancelled_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "cancelled_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="cancelled_reservations",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Annulé par",
+                    ),
+                ),
+                (
+                    "checkout_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="checkedout_reservations",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Sortie par",
+                    ),
+                ),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="created_reservations",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Créé par",
+                    ),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservations",
+                        to="ui.customer",
+                        verbose_name="Client",
+                    ),
+                ),
+                (
+                    "returned_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="returned_reservations",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Retour par",
+                    ),
+                ),
+                (
+                    "validated_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="validated_reservations",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Validé par",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Réservation",
+                "verbose_name_plural": "Réservations",
+                "ordering": ["-checkout_date", "-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="Donation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "date",
+                    models.DateField(auto_now_add=True, verbose_name="Date du don"),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="Montant"
+                    ),
+                ),
+                (
+                    "includes_membership",
+                    models.BooleanField(
+                        default=False, verbose_name="Inclut l'adhésion annuelle"
+                    ),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="donations",
+                        to="ui.customer",
+                        verbose_name="Client",
+                    ),
+                ),
+                (
+                    "reservation",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="donations",
+                        to="ui.reservation",
+                        verbose_name="Réservation associée",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Don",
+                "verbose_name_plural": "Dons",
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.AddField(
+            model_name="customer",
+            name="customer_type",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="customers",
+                to="ui.customertype",
+                verbose_name="Type de client",
+            ),
+        ),
+        migrations.CreateModel(
+            name="Asset",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, verbose_name="Nom")),
+                ("description", models.TextField(verbose_name="Description")),
+                (
+                    "stock_quantity",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Quantité en stock"
+                    ),
+                ),
+                (
+                    "replacement_value",
+                    models.DecimalField(
+                        decimal_places=2,
+                        max_digits=10,
+                        verbose_name="Valeur de remplacement",
+                    ),
+                ),
+                (
+                    "rental_value",
+                    models.DecimalField(
+                        decimal_places=2,
+                        max_digits=10,
+                        verbose_name="Don minimum exigé",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="assets",
+                        to="ui.category",
+                        verbose_name="Catégorie",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Article",
+                "verbose_name_plural": "Articles",
+            },
+        ),
+        migrations.CreateModel(
+            name="StockEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "event_type",
+                    models.CharField(
+                        choices=[
+                            ("ISSUE", "Panne réparable"),
+                            ("DESTRUCTION", "Destruction"),
+                            ("ACQUISITION", "Acquisition"),
+                            ("SALE", "Vente"),
+                            ("INVENTORY_ADJUSTMENT", "Ajustement d'inventaire"),
+                            ("REPAIR", "Réparation"),
+                        ],
+                        max_length=20,
+                        verbose_name="Type d'événement",
+                    ),
+                ),
+                ("quantity", models.IntegerField(default=1, verbose_name="Quantité")),
+                ("date", models.DateTimeField(verbose_name="Date")),
+                (
+                    "description",
+                    models.TextField(blank=True, verbose_name="Description"),
+                ),
+                (
+                    "asset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="ui.asset",
+                        verbose_name="Article",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Utilisateur responsable",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Événement de stock",
+                "verbose_name_plural": "Événements de stock",
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ReservationItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity_reserved",
+                    models.PositiveIntegerField(
+                        default=1, verbose_name="Quantité réservée"
+                    ),
+                ),
+                (
+                    "quantity_checked_out",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Quantité sortie"
+                    ),
+                ),
+                (
+                    "quantity_returned",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Quantité rendue"
+                    ),
+                ),
+                (
+                    "quantity_damaged",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Quantité en panne"
+                    ),
+                ),
+                (
+                    "asset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservation_items",
+                        to="ui.asset",
+                        verbose_name="Article",
+                    ),
+                ),
+                (
+                    "reservation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="ui.reservation",
+                        verbose_name="Réservation",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Élément de réservation",
+                "verbose_name_plural": "Éléments de réservation",
+                "unique_together": {("reservation", "asset")},
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations, models
+
+from utils.migration_operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently, outside of a transaction, so that the
+    # tables stay writable. Databases already having them are left untouched.
+    atomic = False
+
+    dependencies = [
+        ("ui", "0001_initial"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="stockevent",
+            index=models.Index(
+                fields=["asset", "date"], name="ui_stockevent_asset_date_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="reservationitem",
+            index=models.Index(
+                fields=["asset", "reservation"], name="ui_resitem_asset_res_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="reservation",
+            index=models.Index(
+                fields=["status", "checkout_date"], name="ui_reservation_status_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="reservation",
+            index=models.Index(
+                fields=["customer", "checkout_date"], name="ui_reservation_customer_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="reservation",
+            index=models.Index(
+                condition=models.Q(
+                    ("status__in", ["created", "validated", "checked_out"])
+                ),
+                fields=["checkout_date"],
+                name="ui_reservation_active_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="donation",
+            index=models.Index(
+                fields=["customer", "date", "includes_membership"],
+                name="ui_donation_customer_date_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="donation",
+            index=models.Index(
+                condition=models.Q(("includes_membership", True)),
+                fields=["customer", "date"],
+                name="ui_donation_membership_idx",
+            ),
+        ),
+    ]
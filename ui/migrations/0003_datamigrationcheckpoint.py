@@ -0,0 +1,63 @@
+# Generated by Django 4.2.10 on 2026-10-19 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ui", "0002_performance_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataMigrationCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(max_length=100, unique=True, verbose_name="Nom"),
+                ),
+                (
+                    "last_pk",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Dernière clé traitée"
+                    ),
+                ),
+                (
+                    "processed",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Lignes traitées"
+                    ),
+                ),
+                (
+                    "updated",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="Lignes modifiées"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Début"),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "completed_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="Fin"),
+                ),
+            ],
+            options={
+                "verbose_name": "Migration de données",
+                "verbose_name_plural": "Migrations de données",
+                "ordering": ["name"],
+            },
+        ),
+    ]
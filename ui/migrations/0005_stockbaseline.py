@@ -0,0 +1,43 @@
+# Generated by Django 4.2.10 on 2026-10-19 13:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ui", "0004_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockBaseline",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.IntegerField(verbose_name="Quantité de référence")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "asset",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stock_baseline",
+                        to="ui.asset",
+                        verbose_name="Article",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Référence de stock",
+                "verbose_name_plural": "Références de stock",
+            },
+        ),
+    ]
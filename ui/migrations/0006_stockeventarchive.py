@@ -0,0 +1,81 @@
+# Generated by Django 4.2.10 on 2026-10-19 13:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("ui", "0005_stockbaseline"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockEventArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "event_type",
+                    models.CharField(
+                        choices=[
+                            ("ISSUE", "Panne réparable"),
+                            ("DESTRUCTION", "Destruction"),
+                            ("ACQUISITION", "Acquisition"),
+                            ("SALE", "Vente"),
+                            ("INVENTORY_ADJUSTMENT", "Ajustement d'inventaire"),
+                            ("REPAIR", "Réparation"),
+                        ],
+                        max_length=20,
+                        verbose_name="Type d'événement",
+                    ),
+                ),
+                ("quantity", models.IntegerField(verbose_name="Quantité")),
+                ("date", models.DateTimeField(verbose_name="Date")),
+                (
+                    "description",
+                    models.TextField(blank=True, verbose_name="Description"),
+                ),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "asset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_events",
+                        to="ui.asset",
+                        verbose_name="Article",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Utilisateur responsable",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Événement de stock archivé",
+                "verbose_name_plural": "Événements de stock archivés",
+                "ordering": ["-date"],
+                "indexes": [
+                    models.Index(
+                        fields=["asset", "date"], name="ui_evarchive_asset_date_idx"
+                    )
+                ],
+            },
+        ),
+    ]
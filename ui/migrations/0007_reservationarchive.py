@@ -0,0 +1,222 @@
+# Generated by Django 4.2.10 on 2026-10-19 13:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("ui", "0006_stockeventarchive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReservationArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "checkout_date",
+                    models.DateTimeField(verbose_name="Date de sortie prévue"),
+                ),
+                (
+                    "return_date",
+                    models.DateTimeField(verbose_name="Date de retour prévue"),
+                ),
+                (
+                    "actual_checkout_date",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Date de sortie réelle"
+                    ),
+                ),
+                (
+                    "actual_return_date",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Date de retour réelle"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("created", "Créée"),
+                            ("validated", "Validée"),
+                            ("checked_out", "Sortie"),
+                            ("returned", "Rendue"),
+                            ("cancelled", "Annulée"),
+                        ],
+                        default="created",
+                        max_length=20,
+                        verbose_name="Statut",
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Notes")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("validated_at", models.DateTimeField(blank=True, null=True)),
+                ("cancelled_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "cancelled_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Annulé par",
+                    ),
+                ),
+                (
+                    "checkout_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Sortie par",
+                    ),
+                ),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Créé par",
+                    ),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_reservations",
+                        to="ui.customer",
+                        verbose_name="Client",
+                    ),
+                ),
+                (
+                    "returned_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Retour par",
+                    ),
+                ),
+                (
+                    "validated_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Validé par",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Réservation archivée",
+                "verbose_name_plural": "Réservations archivées",
+                "ordering": ["-checkout_date", "-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="donation",
+            name="archived_reservation",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="donations",
+                to="ui.reservationarchive",
+                verbose_name="Réservation archivée associée",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ReservationItemArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity_reserved",
+                    models.PositiveIntegerField(
+                        default=1, verbose_name="Quantité réservée"
+                    ),
+                ),
+                (
+                    "quantity_checked_out",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Quantité sortie"
+                    ),
+                ),
+                (
+                    "quantity_returned",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Quantité rendue"
+                    ),
+                ),
+                (
+                    "quantity_damaged",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Quantité en panne"
+                    ),
+                ),
+                (
+                    "asset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_reservation_items",
+                        to="ui.asset",
+                        verbose_name="Article",
+                    ),
+                ),
+                (
+                    "reservation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="ui.reservationarchive",
+                        verbose_name="Réservation",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Élément de réservation archivée",
+                "verbose_name_plural": "Éléments de réservation archivée",
+                "indexes": [
+                    models.Index(
+                        fields=["asset", "reservation"],
+                        name="ui_resitemarch_asset_res_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="reservationarchive",
+            index=models.Index(
+                fields=["customer", "checkout_date"], name="ui_resarchive_customer_idx"
+            ),
+        ),
+    ]
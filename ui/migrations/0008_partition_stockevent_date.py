@@ -0,0 +1,16 @@
+from django.db import migrations
+
+from utils.migration_operations import PartitionByYear
+
+
+class Migration(migrations.Migration):
+    # The events are copied into the partitioned table under an exclusive
+    # lock: compact the old events first (compact_stock_events).
+
+    dependencies = [
+        ("ui", "0007_reservationarchive"),
+    ]
+
+    operations = [
+        PartitionByYear(model_name="stockevent", name="date"),
+    ]
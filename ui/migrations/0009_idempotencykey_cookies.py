@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-19 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ui", "0008_partition_stockevent_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="cookies",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="idempotencykey",
+            name="messages",
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -7,7 +7,9 @@ from django.utils.translation import gettext_lazy as _
 
 from .models import (
     Reservation,
+    ReservationArchive,
     ReservationItem,
+    ReservationItemArchive,
 )
 
 
@@ -105,3 +107,55 @@ class ReservationAdmin(admin.ModelAdmin):
         """
         qs = super().get_queryset(request)
         return qs.prefetch_related("donations")
+
+
+class ReservationItemArchiveInline(admin.TabularInline):
+    """
+    Inline admin interface for ReservationItemArchive model, read only.
+    """
+
+    model = ReservationItemArchive
+    extra = 0
+    fields = [
+        "asset",
+        "quantity_reserved",
+        "quantity_checked_out",
+        "quantity_returned",
+        "quantity_damaged",
+    ]
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReservationArchive)
+class ReservationArchiveAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the ReservationArchive model, read only.
+    """
+
+    list_display = (
+        "customer",
+        "status",
+        "checkout_date",
+        "actual_checkout_date",
+        "return_date",
+        "actual_return_date",
+    )
+    list_filter = ("status", "checkout_date")
+    search_fields = (
+        "customer__last_name",
+        "customer__first_name",
+        "customer__company_name",
+        "notes",
+    )
+    date_hierarchy = "checkout_date"
+    inlines = [ReservationItemArchiveInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
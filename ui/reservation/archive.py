@@ -0,0 +1,115 @@
+"""
+Archiving of the closed reservations.
+
+The returned and cancelled reservations pile up over the years in the tables
+read by the daily work (reservation list, calendar, availability
+computations). The archiving moves the reservations closed for more than
+``RESERVATION_ARCHIVE_MONTHS`` months, with their items, to tables of the
+same columns (:class:`~ui.reservation.models.ReservationArchive` and
+:class:`~ui.reservation.models.ReservationItemArchive`), with their own
+indexes, so that the queries of the active reservations only read the
+reservations which may still change.
+
+The reservations are moved by batches, each in its own transaction: their
+rows are copied with ``INSERT ... SELECT``, keeping their primary keys, then
+deleted. Their donations are linked to the archived reservation, and the
+movements of their items are taken out of the reference quantities of the
+stock audit. Archived reservations are read only, from the customer page,
+the history of the assets or their number.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from ui.donation.models import Donation
+from ui.stock.audit import shift_baselines
+from .models import (
+    Reservation,
+    ReservationArchive,
+    ReservationItem,
+    ReservationItemArchive,
+)
+
+# Statuses of the reservations which cannot change anymore
+CLOSED_STATUSES = ["returned", "cancelled"]
+
+
+def archive_cutoff(months=None):
+    """
+    Date before which the closed reservations are archived.
+    :param months: Age in months (defaults to RESERVATION_ARCHIVE_MONTHS)
+    :return: Date
+    """
+    if months is None:
+        months = settings.RESERVATION_ARCHIVE_MONTHS
+    return timezone.now() - datetime.timedelta(days=30 * months)
+
+
+def _copy_rows(source, target, column, pks):
+    """
+    Copy rows between two tables of the same columns.
+    :param source: Model of the source table
+    :param target: Model of the target table
+    :param column: Column selecting the copied rows
+    :param pks: Values of the column
+    """
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in target._meta.concrete_fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(target._meta.db_table)} ({columns}) "
+            f"SELECT {columns} FROM {quote(source._meta.db_table)} "
+            f"WHERE {quote(column)} IN ({', '.join(['%s'] * len(pks))})",
+            pks,
+        )
+
+
+def archive_reservations(cutoff, batch_size=500, progress=None):
+    """
+    Move the reservations closed before a date to the archive.
+    :param cutoff: Date before which the reservations were returned (or
+        planned to be returned, for the cancelled ones)
+    :param batch_size: Number of reservations per batch
+    :param progress: Function called after each batch with the number of
+        reservations archived so far (optional)
+    :return: Number of archived reservations
+    """
+    closed = Reservation.objects.filter(status__in=CLOSED_STATUSES).filter(
+        Q(actual_return_date__lt=cutoff)
+        | Q(actual_return_date__isnull=True, return_date__lt=cutoff)
+    )
+    archived = 0
+    while True:
+        with transaction.atomic():
+            pks = list(
+                closed.order_by("pk")
+                .select_for_update()
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            _copy_rows(Reservation, ReservationArchive, "id", pks)
+            _copy_rows(ReservationItem, ReservationItemArchive, "reservation_id", pks)
+
+            items = ReservationItem.objects.filter(reservation_id__in=pks)
+            shift_baselines(
+                {
+                    row["asset_id"]: -row["out"]
+                    for row in items.values("asset_id").annotate(
+                        out=Sum(F("quantity_checked_out") - F("quantity_returned"))
+                    )
+                }
+            )
+            Donation.objects.filter(reservation_id__in=pks).update(
+                archived_reservation_id=F("reservation_id"), reservation=None
+            )
+            # Deletes their items too
+            Reservation.objects.filter(pk__in=pks).delete()
+        archived += len(pks)
+        if progress:
+            progress(archived)
+    return archived
@@ -0,0 +1,194 @@
+"""
+Batch export of reservation summaries, with a warehouse pick list.
+
+The HTML of the documents is built in the request process, which owns the
+database connection. The WeasyPrint layout, which is the costly part, runs
+in parallel in the pool of spawned processes of the web worker, created by
+its first export and kept for the next ones, each process loading the
+stylesheet and fonts once through the PDF rendering service.
+"""
+
+import io
+import itertools
+import time
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+from pypdf import PdfWriter
+
+from utils import pdf_service
+from utils.executors import discard_executor, get_pdf_batch_executor
+from utils.metrics import PDF_RENDER_DURATION
+from .pdf import (
+    LOGO_PATH,
+    SUMMARY_STYLESHEET,
+    summary_html,
+    summary_queryset,
+)
+
+PICK_LIST_TEMPLATE = "ui/reservations/pdf_pick_list.html"
+PICK_LIST_FILENAME = "liste_de_preparation.pdf"
+
+
+def batch_queryset(start_date=None, end_date=None, ids=None):
+    """
+    Reservations of a batch export: the given reservations and those leaving
+    between two dates, cancelled reservations excluded.
+    :param start_date: First checkout day (date, optional)
+    :param end_date: Last checkout day (date, optional)
+    :param ids: Primary keys of reservations (optional)
+    :return: QuerySet of Reservation ordered by checkout date
+    """
+    selection = Q(pk__in=ids or [])
+    if start_date and end_date:
+        selection |= Q(
+            checkout_date__date__gte=start_date, checkout_date__date__lte=end_date
+        )
+    return (
+        summary_queryset()
+        .filter(selection)
+        .exclude(status="cancelled")
+        .order_by("checkout_date", "pk")
+    )
+
+
+def pick_list(reservations):
+    """
+    Aggregate the reserved quantities per checkout day and asset.
+    :param reservations: Reservations loaded with summary_queryset
+    :return: List of (day, rows) sorted by day, rows being dicts with the
+        category, asset, total quantity and number of reservations
+    """
+    days = {}
+    for reservation in reservations:
+        rows = days.setdefault(timezone.localdate(reservation.checkout_date), {})
+        for item in reservation.items.all():
+            row = rows.setdefault(
+                item.asset_id,
+                {
+                    "category": item.asset.category.name,
+                    "asset": item.asset.name,
+                    "quantity": 0,
+                    "reservations": 0,
+                },
+            )
+            row["quantity"] += item.quantity_reserved
+            row["reservations"] += 1
+    return [
+        (day, sorted(rows.values(), key=lambda row: (row["category"], row["asset"])))
+        for day, rows in sorted(days.items())
+    ]
+
+
+def render_batch(reservations, qr_url, base_url):
+    """
+    Render the pick list and the summaries of the reservations.
+    :param reservations: Reservations loaded with summary_queryset
+    :param qr_url: Function returning the absolute URL encoded in the QR code of a reservation pk
+    :param base_url: Base URL used to resolve relative links
+    :return: Iterator of (file name, PDF content), pick list first, in order
+    """
+    names = [PICK_LIST_FILENAME]
+    documents = [
+        render_to_string(
+            PICK_LIST_TEMPLATE,
+            {
+                "days": pick_list(reservations),
+                "logo_path": pdf_service.image_uri(LOGO_PATH),
+            },
+        )
+    ]
+    for reservation in reservations:
+        names.append(f"reservation_{reservation.pk}.pdf")
+        documents.append(summary_html(reservation, qr_url(reservation.pk)))
+
+    start = time.perf_counter()
+    processes = min(settings.PDF_BATCH_PROCESSES, len(documents))
+    if processes < 1:
+        for name, html in zip(names, documents):
+            yield name, pdf_service.render_document(
+                html, [SUMMARY_STYLESHEET], base_url
+            )
+    else:
+        pool = get_pdf_batch_executor(
+            pdf_service.warm_up, ([SUMMARY_STYLESHEET], [LOGO_PATH])
+        )
+        try:
+            # Closing the generator (aborted download) cancels the documents
+            # not started yet
+            yield from zip(
+                names,
+                pool.map(
+                    pdf_service.render_document,
+                    documents,
+                    itertools.repeat([SUMMARY_STYLESHEET]),
+                    itertools.repeat(base_url),
+                    chunksize=max(1, len(documents) // (processes * 4)),
+                ),
+            )
+        except BrokenProcessPool:
+            # A process died (killed, out of memory): the next export starts
+            # a new pool
+            discard_executor("pdf_batch")
+            raise
+    # Whole batch, its documents are rendered in other processes
+    PDF_RENDER_DURATION.labels(document="batch").observe(time.perf_counter() - start)
+
+
+def merge_pdfs(documents):
+    """
+    Merge PDF documents into a single file.
+    :param documents: Iterable of (file name, PDF content)
+    :return: Merged PDF content (bytes)
+    """
+    writer = PdfWriter()
+    for _, content in documents:
+        writer.append(io.BytesIO(content))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Write-only file collecting the bytes written by zipfile until they are sent.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        """
+        Return and forget the bytes written so far.
+        :return: Bytes
+        """
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(documents):
+    """
+    Build a ZIP archive of documents, yielding each part as soon as the
+    document is rendered.
+    :param documents: Iterable of (file name, PDF content)
+    :return: Iterator of bytes
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in documents:
+            archive.writestr(name, content)
+            yield buffer.pop()
+    yield buffer.pop()
@@ -0,0 +1,101 @@
+"""
+Saving of the reservations without overbooking the assets.
+
+Checking the availability before saving is not enough: two managers may book
+the last units of an asset at the same time, both checks passing before
+either reservation is saved. A reservation is therefore saved in a
+transaction which, after writing it:
+
+* takes a PostgreSQL advisory lock per reserved asset, in asset order, held
+  until the end of the transaction, so that the reservations of the same
+  assets are committed one after the other while those of other assets are
+  not delayed;
+* checks the availability of the reserved assets again, over the period of
+  the reservation, which now sees the reservations committed by the other
+  transactions holding these locks.
+
+An overbooking rolls the transaction back, or is only reported when
+``RESERVATION_OVERBOOKING`` is ``flag`` (the reservation is then shown as
+problematic like any other).
+"""
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.translation import gettext as _
+
+from utils.computations import check_reservations_availability
+from .models import ACTIVE_STATUSES
+
+# First key of the advisory locks of the assets, the second one being the
+# asset id, so that they do not collide with other advisory locks
+ASSET_LOCK_NAMESPACE = 7301
+
+
+class OverbookingError(Exception):
+    """
+    Raised when saving a reservation would overbook assets. Nothing was saved.
+    """
+
+    def __init__(self, problematic_items):
+        """
+        :param problematic_items: dict of asset name to the reserved and
+            available quantities, as returned by check_reservation_availability
+        """
+        self.problematic_items = problematic_items
+        self.errors = overbooking_messages(problematic_items)
+        super().__init__("; ".join(self.errors))
+
+
+def overbooking_messages(problematic_items):
+    """
+    Messages describing the overbooked assets.
+    :param problematic_items: dict of asset name to the reserved and available quantities
+    :return: List of messages
+    """
+    return [
+        _("Quantité insuffisante pour %(asset)s (disponible: %(available)s)")
+        % {"asset": name, "available": quantities["available_quantity"]}
+        for name, quantities in problematic_items.items()
+    ]
+
+
+def lock_assets_bookings(asset_pks):
+    """
+    Take the advisory locks of assets until the end of the transaction,
+    waiting for the transactions holding them. Only PostgreSQL has advisory
+    locks; the other databases serialize the writing transactions anyway.
+    :param asset_pks: Primary keys of the assets
+    """
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        # Always in the same order, so that two transactions cannot deadlock
+        for pk in sorted(set(asset_pks)):
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s, %s)", [ASSET_LOCK_NAMESPACE, pk]
+            )
+
+
+def commit_reservation(save, reject=None):
+    """
+    Save a reservation and its items, then check that it does not overbook
+    its assets, in one transaction.
+    :param save: Function saving the reservation and its items, returning the
+        Reservation
+    :param reject: Roll back on overbooking (defaults to
+        ``RESERVATION_OVERBOOKING != "flag"``)
+    :return: Tuple (Reservation, dict of the overbooked assets as returned by
+        check_reservation_availability, empty when the reservation is ok)
+    :raises OverbookingError: When rejected
+    """
+    if reject is None:
+        reject = settings.RESERVATION_OVERBOOKING != "flag"
+    with transaction.atomic():
+        reservation = save()
+        if reservation.status not in ACTIVE_STATUSES:
+            return reservation, {}
+        lock_assets_bookings(reservation.items.values_list("asset_id", flat=True))
+        result = check_reservations_availability([reservation])[reservation.pk]
+        if not result["is_ok"] and reject:
+            raise OverbookingError(result["problematic_items"])
+    return reservation, result["problematic_items"]
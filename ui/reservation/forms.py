@@ -3,6 +3,7 @@ Forms for managing reservations and reservation items.
 """
 
 from django import forms
+from django.utils.translation import gettext_lazy as _
 
 from ui.stock.models import Asset
 from .models import (
@@ -44,3 +45,77 @@ class ReservationItemForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields["asset"].queryset = Asset.objects.filter(stock_quantity__gt=0)
+
+
+class ReservationBatchForm(forms.Form):
+    """
+    Form selecting the reservations of a batch export, by checkout dates or by numbers.
+    """
+
+    start_date = forms.DateField(
+        required=False,
+        label=_("Sorties à partir du"),
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+    end_date = forms.DateField(
+        required=False,
+        label=_("Sorties jusqu'au"),
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+    reservations = forms.CharField(
+        required=False,
+        label=_("Numéros de réservation"),
+        help_text=_("Numéros séparés par des virgules"),
+    )
+    output = forms.ChoiceField(
+        choices=[("pdf", _("PDF unique")), ("zip", _("Archive ZIP"))],
+        initial="pdf",
+        label=_("Format"),
+    )
+
+    def clean_reservations(self):
+        """
+        Parse the reservation numbers.
+        :return: List of reservation primary keys
+        """
+        value = self.cleaned_data["reservations"]
+        try:
+            return [int(pk) for pk in value.replace(" ", "").split(",") if pk]
+        except ValueError:
+            raise forms.ValidationError(_("Numéros de réservation invalides."))
+
+    def clean(self):
+        """
+        Check that the reservations to export are selected.
+        :return: Cleaned data
+        """
+        cleaned_data = super().clean()
+        start_date = cleaned_data.get("start_date")
+        end_date = cleaned_data.get("end_date")
+        if bool(start_date) != bool(end_date):
+            raise forms.ValidationError(_("Indiquez les deux dates de la période."))
+        if start_date and end_date < start_date:
+            raise forms.ValidationError(
+                _("La date de fin doit être postérieure à la date de début.")
+            )
+        if not start_date and not cleaned_data.get("reservations"):
+            raise forms.ValidationError(
+                _("Indiquez une période ou des numéros de réservation.")
+            )
+        return cleaned_data
+
+
+class ReservationDeskForm(forms.Form):
+    """
+    Form selecting the reservations of the desk screen, by day and movement.
+    """
+
+    mode = forms.ChoiceField(
+        choices=[("checkout", _("Sorties")), ("return", _("Retours"))],
+        initial="checkout",
+        label=_("Mouvement"),
+    )
+    date = forms.DateField(
+        label=_("Jour"),
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
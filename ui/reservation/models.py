@@ -6,6 +6,7 @@ from decimal import Decimal
 
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -13,10 +14,13 @@ from ui.customer.models import Customer
 from ui.stock.models import Asset
 from utils.period import Period
 
+# Statuses of the reservations still holding stock
+ACTIVE_STATUSES = ["created", "validated", "checked_out"]
 
-class Reservation(models.Model):
+
+class AbstractReservation(models.Model):
     """
-    Model representing a reservation made by a customer.
+    Fields and behaviour shared by the reservations and their archive.
     """
 
     STATUS_CHOICES = (
@@ -42,65 +46,18 @@ class Reservation(models.Model):
         default="created",
         verbose_name=_("Statut"),
     )
-    customer = models.ForeignKey(
-        Customer,
-        on_delete=models.CASCADE,
-        related_name="reservations",
-        verbose_name=_("Client"),
-    )
     notes = models.TextField(blank=True, verbose_name=_("Notes"))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     validated_at = models.DateTimeField(null=True, blank=True)
     cancelled_at = models.DateTimeField(null=True, blank=True)
-    created_by = models.ForeignKey(
-        get_user_model(),
-        on_delete=models.SET_NULL,
-        null=True,
-        related_name="created_reservations",
-        verbose_name=_("Créé par"),
-    )
-    validated_by = models.ForeignKey(
-        get_user_model(),
-        on_delete=models.SET_NULL,
-        null=True,
-        blank=True,
-        related_name="validated_reservations",
-        verbose_name=_("Validé par"),
-    )
-    cancelled_by = models.ForeignKey(
-        get_user_model(),
-        on_delete=models.SET_NULL,
-        null=True,
-        blank=True,
-        related_name="cancelled_reservations",
-        verbose_name=_("Annulé par"),
-    )
-    checkout_by = models.ForeignKey(
-        get_user_model(),
-        on_delete=models.SET_NULL,
-        null=True,
-        blank=True,
-        related_name="checkedout_reservations",
-        verbose_name=_("Sortie par"),
-    )
-    returned_by = models.ForeignKey(
-        get_user_model(),
-        on_delete=models.SET_NULL,
-        null=True,
-        blank=True,
-        related_name="returned_reservations",
-        verbose_name=_("Retour par"),
-    )
 
     class Meta:
         """
-        Meta information for the Reservation model.
+        Meta information for the AbstractReservation model.
         """
 
-        verbose_name = _("Réservation")
-        verbose_name_plural = _("Réservations")
-        ordering = ["-checkout_date", "-created_at"]
+        abstract = True
 
     def __str__(self):
         """
@@ -168,23 +125,85 @@ class Reservation(models.Model):
         return Period(self.true_start_date, self.true_return_date)
 
 
-class ReservationItem(models.Model):
+class Reservation(AbstractReservation):
     """
-    Model representing an item within a reservation.
+    Model representing a reservation made by a customer.
     """
 
-    reservation = models.ForeignKey(
-        Reservation,
+    customer = models.ForeignKey(
+        Customer,
         on_delete=models.CASCADE,
-        related_name="items",
-        verbose_name=_("Réservation"),
+        related_name="reservations",
+        verbose_name=_("Client"),
     )
-    asset = models.ForeignKey(
-        Asset,
-        on_delete=models.CASCADE,
-        related_name="reservation_items",
-        verbose_name=_("Article"),
+    created_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="created_reservations",
+        verbose_name=_("Créé par"),
+    )
+    validated_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="validated_reservations",
+        verbose_name=_("Validé par"),
     )
+    cancelled_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="cancelled_reservations",
+        verbose_name=_("Annulé par"),
+    )
+    checkout_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="checkedout_reservations",
+        verbose_name=_("Sortie par"),
+    )
+    returned_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="returned_reservations",
+        verbose_name=_("Retour par"),
+    )
+
+    class Meta:
+        """
+        Meta information for the Reservation model.
+        """
+
+        verbose_name = _("Réservation")
+        verbose_name_plural = _("Réservations")
+        ordering = ["-checkout_date", "-created_at"]
+        indexes = [
+            models.Index(
+                fields=["status", "checkout_date"], name="ui_reservation_status_idx"
+            ),
+            models.Index(
+                fields=["customer", "checkout_date"], name="ui_reservation_customer_idx"
+            ),
+            models.Index(
+                fields=["checkout_date"],
+                condition=Q(status__in=ACTIVE_STATUSES),
+                name="ui_reservation_active_idx",
+            ),
+        ]
+
+
+class AbstractReservationItem(models.Model):
+    """
+    Fields and behaviour shared by the reservation items and their archive.
+    """
+
     quantity_reserved = models.PositiveIntegerField(
         default=1, verbose_name=_("Quantité réservée")
     )
@@ -200,12 +219,10 @@ class ReservationItem(models.Model):
 
     class Meta:
         """
-        Meta information for the ReservationItem model.
+        Meta information for the AbstractReservationItem model.
         """
 
-        verbose_name = _("Élément de réservation")
-        verbose_name_plural = _("Éléments de réservation")
-        unique_together = [["reservation", "asset"]]
+        abstract = True
 
     def __str__(self):
         """
@@ -221,3 +238,135 @@ class ReservationItem(models.Model):
         :return: Expected donation amount
         """
         return self.quantity_reserved * self.asset.rental_value
+
+
+class ReservationItem(AbstractReservationItem):
+    """
+    Model representing an item within a reservation.
+    """
+
+    reservation = models.ForeignKey(
+        Reservation,
+        on_delete=models.CASCADE,
+        related_name="items",
+        verbose_name=_("Réservation"),
+    )
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name="reservation_items",
+        verbose_name=_("Article"),
+    )
+
+    class Meta:
+        """
+        Meta information for the ReservationItem model.
+        """
+
+        verbose_name = _("Élément de réservation")
+        verbose_name_plural = _("Éléments de réservation")
+        unique_together = [["reservation", "asset"]]
+        indexes = [
+            models.Index(
+                fields=["asset", "reservation"], name="ui_resitem_asset_res_idx"
+            ),
+        ]
+
+
+class ReservationArchive(AbstractReservation):
+    """
+    Returned or cancelled reservation moved out of the reservations by the
+    archiving (see ui/reservation/archive.py), keeping its primary key.
+    """
+
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name="archived_reservations",
+        verbose_name=_("Client"),
+    )
+    created_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="+",
+        verbose_name=_("Créé par"),
+    )
+    validated_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name=_("Validé par"),
+    )
+    cancelled_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name=_("Annulé par"),
+    )
+    checkout_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name=_("Sortie par"),
+    )
+    returned_by = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name=_("Retour par"),
+    )
+
+    class Meta:
+        """
+        Meta information for the ReservationArchive model.
+        """
+
+        verbose_name = _("Réservation archivée")
+        verbose_name_plural = _("Réservations archivées")
+        ordering = ["-checkout_date", "-created_at"]
+        indexes = [
+            models.Index(
+                fields=["customer", "checkout_date"], name="ui_resarchive_customer_idx"
+            ),
+        ]
+
+
+class ReservationItemArchive(AbstractReservationItem):
+    """
+    Item of an archived reservation.
+    """
+
+    reservation = models.ForeignKey(
+        ReservationArchive,
+        on_delete=models.CASCADE,
+        related_name="items",
+        verbose_name=_("Réservation"),
+    )
+    asset = models.ForeignKey(
+        Asset,
+        on_delete=models.CASCADE,
+        related_name="archived_reservation_items",
+        verbose_name=_("Article"),
+    )
+
+    class Meta:
+        """
+        Meta information for the ReservationItemArchive model.
+        """
+
+        verbose_name = _("Élément de réservation archivée")
+        verbose_name_plural = _("Éléments de réservation archivée")
+        indexes = [
+            models.Index(
+                fields=["asset", "reservation"], name="ui_resitemarch_asset_res_idx"
+            ),
+        ]
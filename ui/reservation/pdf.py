@@ -0,0 +1,275 @@
+"""
+Rendering and caching of the reservation summary PDFs.
+
+Rendered PDFs are stored in ``PDF_CACHE_DIR`` under a version computed from
+everything the summary displays (the reservation, its customer, items and
+donations), so that a cached PDF is served as long as the reservation is
+unchanged. Renders run in the background PDF pool; small marker files next
+to the PDFs record the pending and failed renders, so that every worker
+process sees the same state.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+import qrcode
+from django.conf import settings
+from django.db.models import Prefetch
+from django.template.loader import get_template, render_to_string
+from django.utils import translation
+
+from utils import pdf_service
+from utils.executors import get_pdf_executor, submit_in_background
+from utils.metrics import CACHE_REQUESTS, PDF_RENDER_DURATION
+from .models import Reservation, ReservationItem
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_TEMPLATE = "ui/reservations/pdf_summary.html"
+SUMMARY_STYLESHEET = Path(settings.BASE_DIR) / "static" / "css" / "pdf_summary.css"
+LOGO_PATH = Path(settings.BASE_DIR) / "static" / "images" / "cdf_black.png"
+
+STATUS_READY = "ready"
+STATUS_PENDING = "pending"
+STATUS_FAILED = "failed"
+STATUS_MISSING = "missing"
+
+
+def summary_queryset():
+    """
+    Reservations with everything the summary displays loaded in advance.
+    :return: QuerySet of Reservation
+    """
+    return Reservation.objects.select_related(
+        "customer__customer_type"
+    ).prefetch_related(
+        Prefetch(
+            "items",
+            queryset=ReservationItem.objects.select_related("asset__category").order_by(
+                "asset__category__name", "asset__name"
+            ),
+        ),
+        "donations",
+    )
+
+
+def summary_version(reservation, qr_url):
+    """
+    Compute the version of the summary of a reservation.
+    :param reservation: Reservation loaded with summary_queryset
+    :param qr_url: Absolute URL encoded in the QR code
+    :return: Version string
+    """
+    template = get_template(SUMMARY_TEMPLATE).origin.name
+    parts = [
+        str(os.path.getmtime(template)),
+        str(os.path.getmtime(SUMMARY_STYLESHEET)),
+        translation.get_language() or "",
+        qr_url,
+        reservation.updated_at.isoformat(),
+        str(reservation.customer),
+        str(reservation.total_expected_donation),
+    ]
+    parts += [
+        f"item:{item.pk}:{item.asset.category.name}:{item.asset.name}:{item.quantity_reserved}"
+        for item in reservation.items.all()
+    ]
+    parts += [
+        f"donation:{donation.pk}:{donation.amount}"
+        for donation in reservation.donations.all()
+    ]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:20]
+
+
+def cache_path(reservation_pk, version, suffix=".pdf"):
+    """
+    Path of a cached PDF or of one of its marker files.
+    :param reservation_pk: Primary key of the reservation
+    :param version: Version of the summary
+    :param suffix: File suffix (.pdf, .pending or .failed)
+    :return: Path
+    """
+    return (
+        Path(settings.PDF_CACHE_DIR) / f"reservation_{reservation_pk}_{version}{suffix}"
+    )
+
+
+def summary_html(reservation, qr_url):
+    """
+    Build the HTML of the summary of a reservation.
+    :param reservation: Reservation loaded with summary_queryset
+    :param qr_url: Absolute URL encoded in the QR code
+    :return: HTML document
+    """
+    qr = qrcode.make(qr_url)
+    buffer = BytesIO()
+    qr.save(buffer, format="PNG")
+    qr_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+    context = {
+        "reservation": reservation,
+        "items": reservation.items.all(),
+        "qr_base64": qr_base64,
+        "logo_path": pdf_service.image_uri(LOGO_PATH),
+    }
+    return render_to_string(SUMMARY_TEMPLATE, context)
+
+
+def render_summary_pdf(reservation, qr_url, base_url):
+    """
+    Render the summary PDF of a reservation.
+    :param reservation: Reservation loaded with summary_queryset
+    :param qr_url: Absolute URL encoded in the QR code
+    :param base_url: Base URL used to resolve relative links
+    :return: PDF content (bytes)
+    """
+    with PDF_RENDER_DURATION.labels(document="summary").time():
+        return pdf_service.render_document(
+            summary_html(reservation, qr_url), [SUMMARY_STYLESHEET], base_url
+        )
+
+
+def render_to_cache(reservation_pk, qr_url, base_url, language, requested_version):
+    """
+    Render the summary PDF of a reservation into the cache.
+    Run by the PDF pool; older versions of the PDF are removed.
+    :param reservation_pk: Primary key of the reservation
+    :param qr_url: Absolute URL encoded in the QR code
+    :param base_url: Base URL used to resolve relative links
+    :param language: Language of the request, pool threads do not inherit it
+    :param requested_version: Version whose pending marker to clear
+    :return: Path of the cached PDF
+    """
+    start = time.perf_counter()
+    try:
+        with translation.override(language):
+            reservation = summary_queryset().get(pk=reservation_pk)
+            version = summary_version(reservation, qr_url)
+            path = cache_path(reservation_pk, version)
+            if not path.exists():
+                pdf = render_summary_pdf(reservation, qr_url, base_url)
+                temporary = path.with_suffix(f".{os.getpid()}.tmp")
+                temporary.write_bytes(pdf)
+                os.replace(temporary, path)
+            for suffix in [".pdf", ".failed"]:
+                for old in path.parent.glob(f"reservation_{reservation_pk}_*{suffix}"):
+                    if old != path:
+                        old.unlink(missing_ok=True)
+        logger.info(
+            "Rendered reservation %s PDF in %.0f ms",
+            reservation_pk,
+            (time.perf_counter() - start) * 1000,
+        )
+        return path
+    except Exception as e:
+        logger.exception("Rendering reservation %s PDF failed", reservation_pk)
+        cache_path(reservation_pk, requested_version, ".failed").write_text(str(e))
+        raise
+    finally:
+        cache_path(reservation_pk, requested_version, ".pending").unlink(
+            missing_ok=True
+        )
+
+
+def pdf_status(reservation_pk, version):
+    """
+    State of the cached PDF of a reservation.
+    :param reservation_pk: Primary key of the reservation
+    :param version: Current version of the summary
+    :return: One of STATUS_READY, STATUS_PENDING, STATUS_FAILED and STATUS_MISSING
+    """
+    if cache_path(reservation_pk, version).exists():
+        return STATUS_READY
+    pending = cache_path(reservation_pk, version, ".pending")
+    try:
+        if time.time() - pending.stat().st_mtime < settings.PDF_RENDER_TIMEOUT:
+            return STATUS_PENDING
+    except FileNotFoundError:
+        pass
+    if cache_path(reservation_pk, version, ".failed").exists():
+        return STATUS_FAILED
+    return STATUS_MISSING
+
+
+def request_render(reservation_pk, version, qr_url, base_url):
+    """
+    Start the background render of a reservation PDF, unless it is cached
+    or already being rendered. A previous failure is retried.
+    :param reservation_pk: Primary key of the reservation
+    :param version: Current version of the summary
+    :param qr_url: Absolute URL encoded in the QR code
+    :param base_url: Base URL used to resolve relative links
+    :return: State of the PDF after the request
+    """
+    status = pdf_status(reservation_pk, version)
+    if status != STATUS_PENDING:
+        CACHE_REQUESTS.labels(
+            cache="pdf", result="hit" if status == STATUS_READY else "miss"
+        ).inc()
+    if status in [STATUS_READY, STATUS_PENDING]:
+        return status
+    Path(settings.PDF_CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    pending = cache_path(reservation_pk, version, ".pending")
+    # Remove the marker of a render that did not complete in time
+    pending.unlink(missing_ok=True)
+    try:
+        # Exclusive creation: only one worker process starts the render
+        os.close(os.open(pending, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return STATUS_PENDING
+    cache_path(reservation_pk, version, ".failed").unlink(missing_ok=True)
+    future = submit_in_background(
+        get_pdf_executor(_warm_up_thread),
+        render_to_cache,
+        reservation_pk,
+        qr_url,
+        base_url,
+        translation.get_language(),
+        version,
+    )
+    if future.done():
+        return STATUS_FAILED if future.exception() else STATUS_READY
+    return STATUS_PENDING
+
+
+def _warm_up_thread():
+    """
+    Preload the resources of the summaries for the current thread, the font
+    configuration and the parsed stylesheets being kept per thread by the
+    PDF rendering service. Run by each thread of the PDF pool when it starts,
+    unless ``PDF_WARM_UP`` is disabled.
+    """
+    if not settings.PDF_WARM_UP:
+        return
+    start = time.perf_counter()
+    try:
+        pdf_service.warm_up([SUMMARY_STYLESHEET], [LOGO_PATH])
+    except Exception:
+        # The first render will load the resources, or report the error
+        logger.exception("PDF rendering warm-up failed")
+        return
+    logger.info(
+        "PDF rendering thread warmed up in %.0f ms",
+        (time.perf_counter() - start) * 1000,
+    )
+
+
+def warm_up():
+    """
+    Start the threads of the PDF pool, which warm up in the background,
+    unless ``PDF_WARM_UP`` is disabled. Called when a web worker starts.
+    """
+    if not settings.PDF_WARM_UP:
+        return
+    executor = get_pdf_executor(_warm_up_thread)
+    # A thread waiting at the barrier is not idle: each task starts a new
+    # thread, which warms up before running it
+    barrier = threading.Barrier(settings.PDF_RENDER_WORKERS)
+    for _ in range(settings.PDF_RENDER_WORKERS):
+        executor.submit(barrier.wait, settings.PDF_RENDER_TIMEOUT)
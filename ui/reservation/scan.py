@@ -0,0 +1,104 @@
+"""
+Desk scans of the QR codes of the reservation summaries.
+
+The QR code holds a short signed token of the reservation instead of its
+number, so that the scan URL cannot be guessed from another reservation.
+The scan looks up the reservation and its items in one query and reports
+what the desk does next with it.
+"""
+
+import base64
+
+from django.core import signing
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import Reservation, ReservationItem
+
+TOKEN_SALT = "ui.reservation.scan"
+# Length of the signature in the token (base64 characters, 6 bits each)
+SIGNATURE_LENGTH = 12
+
+# Next action of the desk by reservation status: (action, URL name)
+NEXT_ACTIONS = {
+    "created": ("validate", "ui:reservation_validate"),
+    "validated": ("checkout", "ui:reservation_checkout"),
+    "checked_out": ("return", "ui:reservation_return"),
+}
+
+
+def _signature(value):
+    digest = salted_hmac(TOKEN_SALT, value, algorithm="sha256").digest()
+    return base64.urlsafe_b64encode(digest).decode()[:SIGNATURE_LENGTH]
+
+
+def make_token(reservation_pk):
+    """
+    Build the scan token of a reservation.
+    :param reservation_pk: Primary key of the reservation
+    :return: Token
+    """
+    value = signing.b62_encode(reservation_pk)
+    return f"{value}.{_signature(value)}"
+
+
+def read_token(token):
+    """
+    Read a scan token.
+    :param token: Token
+    :return: Primary key of the reservation, or None when the token is invalid
+    """
+    value, _, signature = token.partition(".")
+    if not value or not constant_time_compare(signature, _signature(value)):
+        return None
+    try:
+        return signing.b62_decode(value)
+    except ValueError:
+        return None
+
+
+def scan_reservation(reservation_pk):
+    """
+    State of a reservation at the desk, loaded in one query.
+    :param reservation_pk: Primary key of the reservation
+    :return: Dict with the reservation, its status, items and next action,
+        or None when the reservation does not exist
+    """
+    items = list(
+        ReservationItem.objects.filter(reservation_id=reservation_pk)
+        .select_related("reservation__customer__customer_type", "asset")
+        .order_by("asset__name")
+    )
+    if items:
+        reservation = items[0].reservation
+    else:
+        reservation = (
+            Reservation.objects.select_related("customer__customer_type")
+            .filter(pk=reservation_pk)
+            .first()
+        )
+        if reservation is None:
+            return None
+
+    action, url_name = NEXT_ACTIONS.get(reservation.status, (None, None))
+    return {
+        "reservation": reservation.pk,
+        "customer": str(reservation.customer),
+        "status": reservation.status,
+        "status_display": str(reservation.get_status_display()),
+        "checkout_date": reservation.checkout_date.isoformat(),
+        "return_date": reservation.return_date.isoformat(),
+        "items": [
+            {
+                "asset": item.asset.name,
+                "reserved": item.quantity_reserved,
+                "checked_out": item.quantity_checked_out,
+                "returned": item.quantity_returned,
+                "damaged": item.quantity_damaged,
+            }
+            for item in items
+        ],
+        "next_action": action,
+        "next_action_url": reverse(url_name, args=[reservation.pk]) if action else None,
+        "detail_url": reverse("ui:reservation_detail", args=[reservation.pk]),
+    }
@@ -0,0 +1,296 @@
+"""
+Stock movements of the reservations: checkout and return of their items.
+
+Several desk operators may move the same assets at once, so a movement of
+one or several reservations runs in a single transaction which:
+
+* locks the reservation rows, then the rows of the moved assets, in primary
+  key order, so that concurrent movements on overlapping assets wait for
+  each other instead of deadlocking;
+* checks the quantities against the locked stock, and leaves unchanged the
+  reservations having an invalid quantity;
+* applies the stock deltas with one UPDATE of the asset table, relative to
+  the stored value (F expressions), and saves the reservation items and the
+  reservations with one bulk UPDATE each.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from ui.stock.models import Asset
+from .models import Reservation, ReservationItem
+
+
+class StockError(Exception):
+    """
+    Raised when a stock movement cannot be applied. Nothing was changed.
+    """
+
+    def __init__(self, errors):
+        """
+        :param errors: List of messages to display
+        """
+        super().__init__("; ".join(str(error) for error in errors))
+        self.errors = list(errors)
+
+
+def lock_reservations(reservation_pks):
+    """
+    Lock reservation rows in primary key order.
+    Must be called inside a transaction.
+    :param reservation_pks: Primary keys of the reservations
+    :return: dict of pk to locked Reservation
+    """
+    return {
+        reservation.pk: reservation
+        for reservation in Reservation.objects.filter(pk__in=reservation_pks)
+        .order_by("pk")
+        .select_for_update()
+    }
+
+
+def lock_assets(asset_pks):
+    """
+    Lock asset rows in primary key order and read their stock.
+    Must be called inside a transaction.
+    :param asset_pks: Primary keys of the assets
+    :return: dict of asset pk to stock quantity
+    """
+    return dict(
+        Asset.objects.filter(pk__in=asset_pks)
+        .order_by("pk")
+        .select_for_update()
+        .values_list("pk", "stock_quantity")
+    )
+
+
+def apply_stock_deltas(deltas):
+    """
+    Add deltas to the stock of assets, in one UPDATE statement.
+    :param deltas: dict of asset pk to the quantity to add (negative to remove)
+    :return: Number of updated assets
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    return Asset.objects.filter(pk__in=deltas).update(
+        stock_quantity=F("stock_quantity")
+        + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def _raise_errors(results, reservation_pk):
+    """
+    Raise the errors of a single reservation movement.
+    :param results: Results of a batch movement
+    :param reservation_pk: Primary key of the moved reservation
+    """
+    if results[reservation_pk]:
+        raise StockError(results[reservation_pk])
+
+
+def checkout_reservation(reservation_pk, quantities, user, date=None, notes=None):
+    """
+    Check out the items of a reservation, removing them from the stock.
+    :param reservation_pk: Primary key of the reservation
+    :param quantities: dict of ReservationItem pk to the quantity checked out;
+        the other items are left unchanged
+    :param user: User checking out the items
+    :param date: Actual checkout date (defaults to now)
+    :param notes: New notes of the reservation (unchanged when None)
+    :return: Updated Reservation
+    :raises StockError: When the reservation cannot be checked out or a
+        quantity exceeds the stock
+    """
+    results = checkout_reservations(
+        {reservation_pk: quantities},
+        user,
+        date,
+        notes=None if notes is None else {reservation_pk: notes},
+    )
+    _raise_errors(results, reservation_pk)
+    return Reservation.objects.get(pk=reservation_pk)
+
+
+def checkout_reservations(quantities, user, date=None, notes=None):
+    """
+    Check out the items of several reservations at once. The quantities are
+    checked against one locked snapshot of the stock, in the order of the
+    reservations, and the reservations having an invalid quantity are left
+    unchanged.
+    :param quantities: dict of reservation pk to dict of ReservationItem pk to
+        the quantity checked out
+    :param user: User checking out the items
+    :param date: Actual checkout date (defaults to now)
+    :param notes: dict of reservation pk to its new notes (optional)
+    :return: dict of reservation pk to the list of its errors, empty when it
+        was checked out
+    """
+    now = timezone.now()
+    notes = notes or {}
+    with transaction.atomic():
+        reservations = lock_reservations(quantities)
+        items = defaultdict(list)
+        for item in (
+            ReservationItem.objects.filter(
+                reservation__in=reservations,
+                pk__in=[pk for group in quantities.values() for pk in group],
+            )
+            .select_related("asset")
+            .order_by("pk")
+        ):
+            if item.pk in quantities[item.reservation_id]:
+                items[item.reservation_id].append(item)
+        stock = lock_assets(
+            [item.asset_id for group in items.values() for item in group]
+        )
+
+        results = {}
+        moved = []
+        deltas = defaultdict(int)
+        for pk in quantities:
+            reservation = reservations.get(pk)
+            if reservation is None or reservation.status not in [
+                "created",
+                "validated",
+            ]:
+                results[pk] = [_("Cette réservation ne peut pas être sortie")]
+                continue
+            errors = []
+            needed = defaultdict(int)
+            for item in items[pk]:
+                quantity = quantities[pk][item.pk]
+                available = stock[item.asset_id] - needed[item.asset_id]
+                if quantity < 0 or quantity > available:
+                    errors.append(
+                        _(
+                            "Quantité insuffisante pour %(asset)s (disponible: %(available)s)"
+                        )
+                        % {"asset": item.asset.name, "available": available}
+                    )
+                    continue
+                needed[item.asset_id] += quantity
+            results[pk] = errors
+            if errors:
+                continue
+            for item in items[pk]:
+                item.quantity_checked_out = quantities[pk][item.pk]
+            for asset_pk, quantity in needed.items():
+                stock[asset_pk] -= quantity
+                deltas[asset_pk] -= quantity
+            reservation.status = "checked_out"
+            reservation.checkout_by = user
+            reservation.actual_checkout_date = date or now
+            reservation.notes = notes.get(pk, reservation.notes)
+            reservation.updated_at = now
+            moved.append(reservation)
+
+        ReservationItem.objects.bulk_update(
+            [item for reservation in moved for item in items[reservation.pk]],
+            ["quantity_checked_out"],
+        )
+        apply_stock_deltas(deltas)
+        Reservation.objects.bulk_update(
+            moved,
+            ["status", "checkout_by", "actual_checkout_date", "notes", "updated_at"],
+        )
+    return results
+
+
+def return_reservation(reservation_pk, returns, user, date=None):
+    """
+    Record the return of the items of a reservation, putting the returned
+    items back into the stock. Damaged and destroyed items are not returned
+    to the stock.
+    :param reservation_pk: Primary key of the reservation
+    :param returns: dict of ReservationItem pk to a tuple (returned, damaged,
+        destroyed) of quantities; the other items are left unchanged
+    :param user: User recording the return
+    :param date: Actual return date (defaults to now)
+    :return: Updated Reservation
+    :raises StockError: When the reservation cannot be returned or the
+        quantities of an item exceed its checked out quantity
+    """
+    results = return_reservations({reservation_pk: returns}, user, date)
+    _raise_errors(results, reservation_pk)
+    return Reservation.objects.get(pk=reservation_pk)
+
+
+def return_reservations(returns, user, date=None):
+    """
+    Record the return of the items of several reservations at once. The
+    reservations having invalid quantities are left unchanged.
+    :param returns: dict of reservation pk to dict of ReservationItem pk to a
+        tuple (returned, damaged, destroyed) of quantities
+    :param user: User recording the return
+    :param date: Actual return date (defaults to now)
+    :return: dict of reservation pk to the list of its errors, empty when it
+        was returned
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        reservations = lock_reservations(returns)
+        items = defaultdict(list)
+        for item in (
+            ReservationItem.objects.filter(
+                reservation__in=reservations,
+                pk__in=[pk for group in returns.values() for pk in group],
+            )
+            .select_related("asset")
+            .order_by("pk")
+        ):
+            if item.pk in returns[item.reservation_id]:
+                items[item.reservation_id].append(item)
+        lock_assets([item.asset_id for group in items.values() for item in group])
+
+        results = {}
+        moved = []
+        deltas = defaultdict(int)
+        for pk in returns:
+            reservation = reservations.get(pk)
+            if reservation is None or reservation.status != "checked_out":
+                results[pk] = [_("Cette réservation ne peut pas être retournée")]
+                continue
+            errors = []
+            for item in items[pk]:
+                returned, damaged, destroyed = returns[pk][item.pk]
+                if (
+                    min(returned, damaged, destroyed) < 0
+                    or returned + damaged + destroyed > item.quantity_checked_out
+                ):
+                    errors.append(
+                        _("Quantités invalides pour %(asset)s")
+                        % {"asset": item.asset.name}
+                    )
+            results[pk] = errors
+            if errors:
+                continue
+            for item in items[pk]:
+                returned, damaged, _destroyed = returns[pk][item.pk]
+                item.quantity_returned = returned
+                item.quantity_damaged = damaged
+                deltas[item.asset_id] += returned
+            reservation.status = "returned"
+            reservation.returned_by = user
+            reservation.actual_return_date = date or now
+            reservation.updated_at = now
+            moved.append(reservation)
+
+        ReservationItem.objects.bulk_update(
+            [item for reservation in moved for item in items[reservation.pk]],
+            ["quantity_returned", "quantity_damaged"],
+        )
+        apply_stock_deltas(deltas)
+        Reservation.objects.bulk_update(
+            moved, ["status", "returned_by", "actual_return_date", "updated_at"]
+        )
+    return results
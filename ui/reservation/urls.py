@@ -35,9 +35,25 @@ urlpatterns = [
         views.reservation_return,
         name="reservation_return",
     ),
+    path(
+        "reservations/scan/<str:token>/",
+        views.reservation_scan,
+        name="reservation_scan",
+    ),
+    path("reservations/desk/", views.reservation_desk, name="reservation_desk"),
     path("reservations/search_assets/", views.search_assets, name="search_assets"),
     path("reservations/check/", views.check_reservation, name="check_reservation"),
     path("reservations/<int:pk>/pdf/", views.reservation_pdf, name="reservation_pdf"),
+    path(
+        "reservations/batch/",
+        views.reservation_batch_export,
+        name="reservation_batch_export",
+    ),
+    path(
+        "reservations/<int:pk>/pdf/status/",
+        views.reservation_pdf_status,
+        name="reservation_pdf_status",
+    ),
     path(
         "reservations/calendar_data/",
         views.reservation_calendar_data,
@@ -2,47 +2,57 @@
 Views for managing reservations.
 """
 
-import base64
 import datetime
+from collections import defaultdict
 from io import BytesIO
-from pathlib import Path
 
-import qrcode
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
-from django.db.models import IntegerField, Value, Q
+from django.db.models import IntegerField, Prefetch, Value, Q, Sum
 from django.db.models.expressions import Case, When
 from django.forms import inlineformset_factory
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import gettext_lazy as _
-from weasyprint import HTML
 
-from accounts.decorators import user_type_required, get_capability
+from accounts.decorators import (
+    async_login_required,
+    user_type_required,
+)
 from ui.donation.models import Donation
 from ui.stock.models import Category
 from utils.computations import (
+    analyze_assets_availability,
     check_reservation_availability,
-    analyze_asset_availability,
-    get_asset_status_at_date,
+    check_reservations_availability,
+    get_assets_status_at_date,
 )
+from utils.executors import run_availability
+from utils.idempotency import idempotent
 from utils.period import Period
+from utils.query_profiler import query_budget
+from . import batch, booking, pdf, scan, stock
 from .forms import (
+    ReservationBatchForm,
+    ReservationDeskForm,
     ReservationForm,
     ReservationItemForm,
 )
 from .models import (
+    ACTIVE_STATUSES,
     Asset,
     Reservation,
+    ReservationArchive,
     ReservationItem,
 )
 
 
+@query_budget(8)
 @login_required
 @user_type_required("manager")
 def reservation_list(request):
@@ -58,6 +68,13 @@ def reservation_list(request):
     active_only = request.GET.get("active_only", "false")
 
     order_by = sort
+    # Client, articles et dons affichés par la liste, chargés en une fois
+    reservations_query = Reservation.objects.select_related(
+        "customer__customer_type"
+    ).prefetch_related(
+        Prefetch("items", queryset=ReservationItem.objects.select_related("asset")),
+        "donations",
+    )
 
     if sort == "status":
         status_order = {
@@ -76,10 +93,9 @@ def reservation_list(request):
         if direction == "desc":
             status_ordering = status_ordering.desc()
 
-        reservations_query = Reservation.objects.annotate(status_order=status_ordering)
+        reservations_query = reservations_query.annotate(status_order=status_ordering)
         order_by = "status_order"
     else:
-        reservations_query = Reservation.objects.all()
         if direction == "desc" and sort != "status":
             order_by = f"-{order_by}"
 
@@ -95,7 +111,7 @@ def reservation_list(request):
             else:
                 active_only = "false"
         else:
-            filters["status__in"] = ["created", "validated", "checked_out"]
+            filters["status__in"] = ACTIVE_STATUSES
 
     if search_query:
         reservations = reservations_query.filter(
@@ -109,13 +125,19 @@ def reservation_list(request):
     else:
         reservations = reservations_query.filter(**filters).order_by(order_by)
 
+    reservations = list(reservations)
+    # Calculer la disponibilité des articles des réservations en cours, en une fois
+    availability = check_reservations_availability(
+        reservation
+        for reservation in reservations
+        if reservation.status in ["created", "validated"]
+    )
     for reservation in reservations:
-        if reservation.status in ["created", "validated"]:
-            # Calculer la disponibilité des articles pour les réservations en cours
-            check_result = check_reservation_availability(reservation)
-            reservation.is_ok = check_result["is_ok"]
-        else:
-            reservation.is_ok = True
+        reservation.is_ok = (
+            availability[reservation.pk]["is_ok"]
+            if reservation.pk in availability
+            else True
+        )
 
     context = {
         "reservations": reservations,
@@ -124,7 +146,6 @@ def reservation_list(request):
         "sort": sort,
         "direction": direction,
         "active_only": active_only,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/reservations/list.html", context)
 
@@ -138,7 +159,10 @@ def reservation_detail(request, pk):
     :param pk: Primary key of the reservation to display
     :return: Rendered reservation detail page
     """
-    reservation = get_object_or_404(Reservation, pk=pk)
+    # Les réservations archivées restent consultables par leur numéro
+    reservation = Reservation.objects.filter(pk=pk).first() or get_object_or_404(
+        ReservationArchive, pk=pk
+    )
     items = reservation.items.all().order_by("asset__category__name", "asset__name")
 
     if reservation.status in ["created", "validated"]:
@@ -162,8 +186,8 @@ def reservation_detail(request, pk):
 
     context = {
         "reservation": reservation,
+        "archived": isinstance(reservation, ReservationArchive),
         "items": items,
-        "capability": get_capability(request.user),
         "customer_membership": customer_membership,
         "customer_membership_fee": customer_membership_fee,
     }
@@ -172,6 +196,7 @@ def reservation_detail(request, pk):
 
 @login_required
 @user_type_required("manager")
+@idempotent
 def reservation_create(request):
     """
     Create a new reservation.
@@ -207,19 +232,34 @@ def reservation_create(request):
                         _("Veuillez ajouter au moins un article à la réservation."),
                     )
                     return redirect("ui:reservation_create")
-                with transaction.atomic():
+
+                def save():
                     reservation = form.save()
                     reservation.created_by = request.user
                     reservation.save()
-                    for form in formset:
-                        if form.is_valid() and not form.cleaned_data.get("DELETE"):
+                    for item_form in formset:
+                        if item_form.is_valid() and not item_form.cleaned_data.get(
+                            "DELETE"
+                        ):
                             # Ne pas enregistrer les articles avec quantité 0
-                            if form.cleaned_data.get("quantity_reserved", 0) > 0:
-                                form.save()
-                    if formset.is_valid():
-                        formset.save()
-                        messages.success(request, _("Réservation créée avec succès"))
-                        return redirect("ui:reservation_detail", pk=reservation.pk)
+                            if item_form.cleaned_data.get("quantity_reserved", 0) > 0:
+                                item_form.save()
+                    formset.save()
+                    return reservation
+
+                try:
+                    reservation, overbooked = booking.commit_reservation(save)
+                except booking.OverbookingError as e:
+                    for error in e.errors:
+                        messages.error(request, error)
+                    # Les instances ont reçu des clés annulées avec la transaction
+                    form = ReservationForm(request.POST)
+                    formset = ReservationItemFormSet(request.POST)
+                else:
+                    messages.success(request, _("Réservation créée avec succès"))
+                    for warning in booking.overbooking_messages(overbooked):
+                        messages.warning(request, warning)
+                    return redirect("ui:reservation_detail", pk=reservation.pk)
         else:
             formset = ReservationItemFormSet(request.POST)
     else:
@@ -230,13 +270,13 @@ def reservation_create(request):
         "form": form,
         "formset": formset,
         "categories": Category.objects.all(),
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/reservations/reservation_form.html", context)
 
 
 @login_required
 @user_type_required("manager")
+@idempotent
 def reservation_validate(request, pk):
     """
     Validate a reservation, changing its status to 'validated'.
@@ -260,13 +300,13 @@ def reservation_validate(request, pk):
 
     context = {
         "reservation": reservation,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/reservations/reservation_confirm_validate.html", context)
 
 
 @login_required
 @user_type_required("manager")
+@idempotent
 def reservation_update(request, pk):
     """
     Update an existing reservation.
@@ -296,26 +336,41 @@ def reservation_update(request, pk):
                     request, _("Veuillez ajouter au moins un article à la réservation.")
                 )
                 return redirect("ui:reservation_update", pk=reservation.pk)
-            with transaction.atomic():
-                reservation = form.save()
+
+            def save():
+                saved = form.save()
                 submitted_ids = [
-                    form.cleaned_data.get("id").pk
-                    for form in formset.forms
-                    if form.cleaned_data.get("id")
+                    item_form.cleaned_data.get("id").pk
+                    for item_form in formset.forms
+                    if item_form.cleaned_data.get("id")
                 ]
 
-                ReservationItem.objects.filter(reservation=reservation).exclude(
+                ReservationItem.objects.filter(reservation=saved).exclude(
                     pk__in=submitted_ids
                 ).delete()
 
-                for form in formset:
-                    if form.is_valid() and not form.cleaned_data.get("DELETE"):
-                        if form.cleaned_data.get("quantity_reserved", 0) > 0:
-                            form.save()
-                if formset.is_valid():
-                    formset.save()
-                    messages.success(request, _("Réservation modifiée avec succès"))
-                    return redirect("ui:reservation_detail", pk=reservation.pk)
+                for item_form in formset:
+                    if item_form.is_valid() and not item_form.cleaned_data.get(
+                        "DELETE"
+                    ):
+                        if item_form.cleaned_data.get("quantity_reserved", 0) > 0:
+                            item_form.save()
+                formset.save()
+                return saved
+
+            try:
+                reservation, overbooked = booking.commit_reservation(save)
+            except booking.OverbookingError as e:
+                for error in e.errors:
+                    messages.error(request, error)
+                reservation = get_object_or_404(Reservation, pk=pk)
+                form = ReservationForm(request.POST, instance=reservation)
+                formset = ReservationItemFormSet(request.POST, instance=reservation)
+            else:
+                messages.success(request, _("Réservation modifiée avec succès"))
+                for warning in booking.overbooking_messages(overbooked):
+                    messages.warning(request, warning)
+                return redirect("ui:reservation_detail", pk=reservation.pk)
     else:
         form = ReservationForm(instance=reservation)
         formset = ReservationItemFormSet(instance=reservation)
@@ -325,13 +380,13 @@ def reservation_update(request, pk):
         "formset": formset,
         "reservation": reservation,
         "categories": Category.objects.all(),
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/reservations/reservation_form.html", context)
 
 
 @login_required
 @user_type_required("manager")
+@idempotent
 def reservation_cancel(request, pk):
     """
     Cancel a reservation, changing its status to 'cancelled'.
@@ -360,13 +415,26 @@ def reservation_cancel(request, pk):
 
     context = {
         "reservation": reservation,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/reservations/reservation_confirm_cancel.html", context)
 
 
+def posted_datetime(request, name):
+    """
+    Read a date and time of a POST form, in the current time zone.
+    :param request: HTTP request object
+    :param name: Name of the field
+    :return: Aware datetime, or None when missing or invalid
+    """
+    value = parse_datetime(request.POST.get(name, ""))
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
 @login_required
 @user_type_required("manager")
+@idempotent
 def reservation_checkout(request, pk):
     """
     Check out items for a reservation, updating stock and reservation status.
@@ -391,41 +459,25 @@ def reservation_checkout(request, pk):
     )
 
     if request.method == "POST":
-        with transaction.atomic():
-            errors = False
-            for item in items:
-                quantity_key = f"checkout_{item.id}"
-                if quantity_key in request.POST:
-                    quantity = int(request.POST.get(quantity_key, 0))
-                    if quantity > item.asset.stock_quantity:
-                        messages.error(
-                            request,
-                            _(
-                                f"Quantité insuffisante pour {item.asset.name} (disponible: {item.asset.stock_quantity})"
-                            ),
-                        )
-                        errors = True
-                    else:
-                        item.quantity_checked_out = quantity
-                        item.save()
-
-                        asset = item.asset
-                        asset.stock_quantity -= quantity
-                        asset.save()
-
-            if not errors:
-                reservation.status = "checked_out"
-                reservation.checkout_by = request.user
-                actual_date = request.POST.get("actual_checkout_date")
-                if actual_date:
-                    reservation.actual_checkout_date = actual_date
-                else:
-                    reservation.actual_checkout_date = timezone.now()
-                reservation.notes = request.POST.get("notes", reservation.notes)
-                reservation.save()
-
-                messages.success(request, _("Sortie de matériel effectuée avec succès"))
-                return redirect("ui:reservation_detail", pk=reservation.pk)
+        quantities = {
+            item.id: int(request.POST.get(f"checkout_{item.id}", 0))
+            for item in items
+            if f"checkout_{item.id}" in request.POST
+        }
+        try:
+            stock.checkout_reservation(
+                reservation.pk,
+                quantities,
+                request.user,
+                date=posted_datetime(request, "actual_checkout_date"),
+                notes=request.POST.get("notes", reservation.notes),
+            )
+        except stock.StockError as e:
+            for error in e.errors:
+                messages.error(request, error)
+        else:
+            messages.success(request, _("Sortie de matériel effectuée avec succès"))
+            return redirect("ui:reservation_detail", pk=reservation.pk)
 
     context = {
         "reservation": reservation,
@@ -433,13 +485,13 @@ def reservation_checkout(request, pk):
         "total_expected": reservation.total_expected_donation,
         "customer_membership": customer_membership,
         "customer_membership_fee": customer_membership_fee,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/reservations/reservation_checkout.html", context)
 
 
 @login_required
 @user_type_required("manager")
+@idempotent
 def reservation_return(request, pk):
     """
     Process the return of items for a reservation, updating stock and reservation status.
@@ -458,67 +510,43 @@ def reservation_return(request, pk):
     )
 
     if request.method == "POST":
-        with transaction.atomic():
-            for item in items:
-                return_key = f"return_{item.id}"
-                damaged_key = f"damaged_{item.id}"
-                destroyed_key = f"destroyed_{item.id}"
-
-                if (
-                    return_key in request.POST
-                    and damaged_key in request.POST
-                    and destroyed_key in request.POST
-                ):
-                    returned_qty = int(request.POST.get(return_key, 0))
-                    damaged_qty = int(request.POST.get(damaged_key, 0))
-                    destroyed_qty = int(request.POST.get(destroyed_key, 0))
-
-                    total_returned = returned_qty + damaged_qty + destroyed_qty
-                    if total_returned > item.quantity_checked_out:
-                        messages.error(
-                            request, _(f"Quantités invalides pour {item.asset.name}")
-                        )
-                        break
-
-                    item.quantity_returned = returned_qty
-                    item.quantity_damaged = damaged_qty
-                    item.notes = (
-                        f"Détruits: {destroyed_qty}" if destroyed_qty > 0 else ""
-                    )
-                    item.save()
-
-                    asset = item.asset
-                    asset.stock_quantity += returned_qty
-                    asset.save()
-            else:
-                total_donations = float(request.POST.get("total_donations", 0))
-                customer_membership = reservation.customer.get_has_paid_membership_fee(
-                    reservation.true_return_date.year
+        returns = {
+            item.id: (
+                int(request.POST.get(f"return_{item.id}", 0)),
+                int(request.POST.get(f"damaged_{item.id}", 0)),
+                int(request.POST.get(f"destroyed_{item.id}", 0)),
+            )
+            for item in items
+            if all(
+                f"{prefix}_{item.id}" in request.POST
+                for prefix in ["return", "damaged", "destroyed"]
+            )
+        }
+        total_donations = float(request.POST.get("total_donations", 0))
+        customer_membership = reservation.customer.get_has_paid_membership_fee(
+            reservation.true_return_date.year
+        )
+        try:
+            with transaction.atomic():
+                stock.return_reservation(
+                    reservation.pk,
+                    returns,
+                    request.user,
+                    date=posted_datetime(request, "actual_return_date"),
                 )
-
                 if total_donations > 0:
-                    includes_membership = not customer_membership
                     Donation.objects.create(
                         customer=reservation.customer,
                         amount=total_donations,
-                        includes_membership=includes_membership,
+                        includes_membership=not customer_membership,
                         reservation=reservation,
                     )
-                reservation.status = "returned"
-                reservation.returned_by = request.user
-
-                actual_date = request.POST.get("actual_return_date")
-                if actual_date:
-                    reservation.actual_return_date = actual_date
-                else:
-                    reservation.actual_return_date = timezone.now()
-
-                reservation.save()
-
-                messages.success(
-                    request, _("Retour de matériel enregistré avec succès")
-                )
-                return redirect("ui:reservation_detail", pk=reservation.pk)
+        except stock.StockError as e:
+            for error in e.errors:
+                messages.error(request, error)
+        else:
+            messages.success(request, _("Retour de matériel enregistré avec succès"))
+            return redirect("ui:reservation_detail", pk=reservation.pk)
     customer_membership = reservation.customer.get_has_paid_membership_fee(
         reservation.checkout_date.year
     )
@@ -531,52 +559,273 @@ def reservation_return(request, pk):
         "total_expected": reservation.total_expected_donation,
         "customer_membership": customer_membership,
         "customer_membership_fee": customer_membership_fee,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/reservations/reservation_return.html", context)
 
 
+def desk_movements(request, reservations, mode):
+    """
+    Read the quantities of the desk form for the selected reservations.
+    Items without a quantity field are moved entirely.
+    :param request: HTTP request object
+    :param reservations: Selected reservations, with their items prefetched
+    :param mode: "checkout" or "return"
+    :return: dict of reservation pk to the quantities expected by
+        stock.checkout_reservations or stock.return_reservations
+    """
+    movements = {}
+    for reservation in reservations:
+        if mode == "checkout":
+            movements[reservation.pk] = {
+                item.pk: int(
+                    request.POST.get(f"checkout_{item.pk}", item.quantity_reserved)
+                )
+                for item in reservation.items.all()
+            }
+        else:
+            movements[reservation.pk] = {
+                item.pk: (
+                    int(
+                        request.POST.get(f"return_{item.pk}", item.quantity_checked_out)
+                    ),
+                    int(request.POST.get(f"damaged_{item.pk}", 0)),
+                    int(request.POST.get(f"destroyed_{item.pk}", 0)),
+                )
+                for item in reservation.items.all()
+                if item.quantity_checked_out > 0
+            }
+    return movements
+
+
+@login_required
+@user_type_required("manager")
+@idempotent
+def reservation_desk(request):
+    """
+    Check out or return many reservations of a day in one operation.
+    The selected reservations are moved in one transaction, against one
+    locked snapshot of the stock; the result is reported per reservation.
+    :param request: HTTP request object
+    :return: Rendered desk page
+    """
+    data = request.POST if request.method == "POST" else request.GET
+    form = ReservationDeskForm(
+        data if "date" in data else None,
+        initial={"mode": "checkout", "date": timezone.localdate()},
+    )
+    if form.is_valid():
+        mode = form.cleaned_data["mode"]
+        date = form.cleaned_data["date"]
+    else:
+        mode = "checkout"
+        date = timezone.localdate()
+
+    if mode == "checkout":
+        reservations = Reservation.objects.filter(
+            status__in=["created", "validated"], checkout_date__date=date
+        ).order_by("checkout_date", "pk")
+    else:
+        reservations = Reservation.objects.filter(
+            status="checked_out", return_date__date=date
+        ).order_by("return_date", "pk")
+    reservations = reservations.select_related("customer").prefetch_related(
+        Prefetch(
+            "items",
+            queryset=ReservationItem.objects.select_related(
+                "asset", "asset__category"
+            ).order_by("asset__category__name", "asset__name"),
+        )
+    )
+
+    results = []
+    if request.method == "POST" and form.is_valid():
+        selected_pks = {int(pk) for pk in request.POST.getlist("reservations")}
+        selected = [
+            reservation
+            for reservation in reservations
+            if reservation.pk in selected_pks
+        ]
+        movements = desk_movements(request, selected, mode)
+        moved_at = posted_datetime(request, "actual_date")
+        if mode == "checkout":
+            errors = stock.checkout_reservations(movements, request.user, moved_at)
+        else:
+            errors = stock.return_reservations(movements, request.user, moved_at)
+        results = [(reservation, errors[reservation.pk]) for reservation in selected]
+        done = sum(1 for reservation, failures in results if not failures)
+        if done:
+            messages.success(
+                request,
+                _("%(done)s réservation(s) traitée(s) sur %(total)s")
+                % {"done": done, "total": len(results)},
+            )
+        if done < len(results):
+            messages.error(
+                request, _("Certaines réservations n'ont pas pu être traitées")
+            )
+        # Les réservations traitées ne sont plus à traiter ce jour
+        reservations = reservations.all()
+
+    context = {
+        "form": form,
+        "mode": mode,
+        "reservations": reservations,
+        "results": results,
+    }
+    return render(request, "ui/reservations/desk.html", context)
+
+
+def scan_url(request, reservation_pk):
+    """
+    Absolute URL of the desk scan of a reservation, encoded in the QR code of
+    its summary.
+    :param request: HTTP request object
+    :param reservation_pk: Primary key of the reservation
+    :return: URL
+    """
+    return request.build_absolute_uri(
+        reverse("ui:reservation_scan", args=[scan.make_token(reservation_pk)])
+    )
+
+
+@query_budget(3)
+@login_required
+@user_type_required("manager")
+def reservation_scan(request, token):
+    """
+    Desk scan of the QR code of a reservation summary: the status of the
+    reservation, its items with their checked out and returned quantities,
+    and the next action, as JSON when requested, otherwise as a compact page.
+    :param request: HTTP request object
+    :param token: Scan token of the reservation
+    :return: JSON response or rendered scan page
+    """
+    reservation_pk = scan.read_token(token)
+    state = scan.scan_reservation(reservation_pk) if reservation_pk else None
+    if state is None:
+        raise Http404
+    if request.GET.get("format") == "json" or "application/json" in request.headers.get(
+        "Accept", ""
+    ):
+        return JsonResponse(state)
+    return render(request, "ui/reservations/scan.html", {"scan": state})
+
+
 @login_required
 @user_type_required("manager")
 def reservation_pdf(request, pk):
     """
-    Generate a PDF summary of the reservation, including a QR code linking to its detail page.
+    Serve the PDF summary of the reservation, including a QR code linking to its desk scan.
+    The PDF is served from the cache when the reservation is unchanged; otherwise it
+    is rendered in the background while a page waits for it.
     :param request: HTTP request object
     :param pk: Primary key of the reservation to generate PDF for
-    :return: PDF file as HTTP response
+    :return: PDF file, or page waiting for the render, as HTTP response
     """
-    reservation = get_object_or_404(Reservation, pk=pk)
-    items = reservation.items.all().order_by("asset__category__name", "asset__name")
-    detail_url = request.build_absolute_uri(
-        reverse("ui:reservation_detail", args=[reservation.pk])
+    reservation = get_object_or_404(pdf.summary_queryset(), pk=pk)
+    qr_url = scan_url(request, reservation.pk)
+    version = pdf.summary_version(reservation, qr_url)
+    status = pdf.request_render(
+        reservation.pk, version, qr_url, request.build_absolute_uri()
     )
-    qr = qrcode.make(detail_url)
-    buffer = BytesIO()
-    qr.save(buffer, format="PNG")
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-    logo_path = Path(settings.BASE_DIR) / "static" / "images" / "cdf_black.png"
+    if status == pdf.STATUS_READY:
+        return FileResponse(
+            open(pdf.cache_path(reservation.pk, version), "rb"),
+            as_attachment=True,
+            filename=f"reservation_{reservation.pk}.pdf",
+            content_type="application/pdf",
+        )
     context = {
         "reservation": reservation,
-        "items": items,
-        "qr_base64": qr_base64,
-        "logo_path": f"file:{logo_path}",
-        "capability": get_capability(request.user),
+        "status": status,
     }
-    html_string = render_to_string("ui/reservations/pdf_summary.html", context)
-    pdf_file = HTML(
-        string=html_string, base_url=request.build_absolute_uri()
-    ).write_pdf()
-    response = HttpResponse(pdf_file, content_type="application/pdf")
-    response["Content-Disposition"] = (
-        f'attachment; filename="reservation_{reservation.pk}.pdf"'
+    return render(request, "ui/reservations/pdf_pending.html", context)
+
+
+@login_required
+@user_type_required("manager")
+def reservation_pdf_status(request, pk):
+    """
+    Report the state of the background render of a reservation PDF.
+    :param request: HTTP request object
+    :param pk: Primary key of the reservation
+    :return: JSON response with the status and the URL of the PDF
+    """
+    reservation = get_object_or_404(pdf.summary_queryset(), pk=pk)
+    qr_url = scan_url(request, reservation.pk)
+    version = pdf.summary_version(reservation, qr_url)
+    status = pdf.pdf_status(reservation.pk, version)
+    if status == pdf.STATUS_MISSING:
+        # Render lost (e.g. worker restarted) or reservation modified meanwhile
+        status = pdf.request_render(
+            reservation.pk, version, qr_url, request.build_absolute_uri()
+        )
+    return JsonResponse(
+        {
+            "status": status,
+            "url": reverse("ui:reservation_pdf", args=[reservation.pk]),
+        }
     )
-    return response
 
 
-def search_assets(request):
+@login_required
+@user_type_required("manager")
+def reservation_batch_export(request):
+    """
+    Export the PDF summaries of several reservations, preceded by the pick list
+    of the assets to prepare for each checkout day, as one PDF or as a ZIP archive.
+    :param request: HTTP request object
+    :return: PDF or ZIP file, or the selection form, as HTTP response
+    """
+    form = ReservationBatchForm(request.GET or None)
+    if form.is_valid():
+        reservations = list(
+            batch.batch_queryset(
+                form.cleaned_data["start_date"],
+                form.cleaned_data["end_date"],
+                form.cleaned_data["reservations"],
+            )[: settings.PDF_BATCH_MAX_RESERVATIONS + 1]
+        )
+        if not reservations:
+            form.add_error(None, _("Aucune réservation ne correspond à la sélection."))
+        elif len(reservations) > settings.PDF_BATCH_MAX_RESERVATIONS:
+            form.add_error(
+                None,
+                _("Trop de réservations, %(max)d au maximum.")
+                % {"max": settings.PDF_BATCH_MAX_RESERVATIONS},
+            )
+        else:
+            documents = batch.render_batch(
+                reservations,
+                lambda pk: scan_url(request, pk),
+                request.build_absolute_uri(),
+            )
+            if form.cleaned_data["output"] == "zip":
+                response = StreamingHttpResponse(
+                    batch.stream_zip(documents), content_type="application/zip"
+                )
+                response["Content-Disposition"] = (
+                    'attachment; filename="reservations.zip"'
+                )
+                return response
+            return FileResponse(
+                BytesIO(batch.merge_pdfs(documents)),
+                as_attachment=True,
+                filename="reservations.pdf",
+                content_type="application/pdf",
+            )
+
+    context = {
+        "form": form,
+    }
+    return render(request, "ui/reservations/batch_export.html", context)
+
+
+async def search_assets(request):
     """
     Search for assets based on query parameters, returning JSON results.
+    The availabilities of all the matching assets are computed in one pass,
+    outside of the event loop.
     :param request: HTTP request object
     :return: JSON response with search results
     """
@@ -586,7 +835,7 @@ def search_assets(request):
     start_date = request.GET.get("start_date", "")
     end_date = request.GET.get("end_date", None)
 
-    assets = Asset.objects.filter(stock_quantity__gt=0)
+    assets = Asset.objects.filter(stock_quantity__gt=0).select_related("category")
 
     if start_date == "":
         start_date = timezone.now()
@@ -606,30 +855,38 @@ def search_assets(request):
     if excluded_ids:
         assets = assets.exclude(id__in=excluded_ids)
 
-    assets = assets.order_by("category__name", "name")
+    assets = [asset async for asset in assets.order_by("category__name", "name")]
+    if end_date:
+        availabilities = await run_availability(
+            analyze_assets_availability, assets, Period(start_date, end_date)
+        )
+    else:
+        availabilities = await run_availability(
+            get_assets_status_at_date, assets, start_date
+        )
+
     results = []
     for asset in assets:
-        r_asset = {
-            "id": asset.id,
-            "text": asset.name,
-            "category": asset.category.name,
-            "rental_value": float(asset.rental_value),
-        }
-        if end_date:
-            quantities = analyze_asset_availability(asset, Period(start_date, end_date))
-        else:
-            quantities = get_asset_status_at_date(asset, start_date)
-        r_asset["stock"] = quantities["available"]
-        r_asset["stock_total"] = quantities["total"]
-        r_asset["stock_damaged"] = quantities["damaged"]
-        r_asset["stock_checked_out"] = quantities["checked_out"]
-        r_asset["stock_reserved"] = quantities["reserved"]
-        results.append(r_asset)
+        quantities = availabilities[asset.pk]
+        results.append(
+            {
+                "id": asset.id,
+                "text": asset.name,
+                "category": asset.category.name,
+                "rental_value": float(asset.rental_value),
+                "stock": quantities["available"],
+                "stock_total": quantities["total"],
+                "stock_damaged": quantities["damaged"],
+                # The analysis over a period has no checked out count
+                "stock_checked_out": quantities.get("checked_out", 0),
+                "stock_reserved": quantities["reserved"],
+            }
+        )
 
     return JsonResponse({"results": results})
 
 
-def check_reservation(request):
+async def check_reservation(request):
     """
     Check the availability of items in a reservation.
     :param request: HTTP request object
@@ -639,14 +896,17 @@ def check_reservation(request):
     response = {"is_ok": False, "problematic_items": []}
     if not res_pk:
         return JsonResponse(response, status=200)
-    reservation = get_object_or_404(Reservation, pk=res_pk)
-    response = check_reservation_availability(reservation)
-    return JsonResponse(response, status=200)
+    try:
+        reservation = await Reservation.objects.aget(pk=res_pk)
+    except Reservation.DoesNotExist:
+        raise Http404
+    results = await run_availability(check_reservations_availability, [reservation])
+    return JsonResponse(results[reservation.pk], status=200)
 
 
-@login_required
+@async_login_required
 @user_type_required("manager")
-def reservation_calendar_data(request):
+async def reservation_calendar_data(request):
     """
     Provide reservation data in JSON format for calendar display.
     :param request: HTTP request object
@@ -654,38 +914,50 @@ def reservation_calendar_data(request):
     """
 
     active_only = request.GET.get("active_only", "false")
-    reservations_query = Reservation.objects.all()
     filters = {}
 
     if active_only == "true":
-        filters["status__in"] = ["created", "validated", "checked_out"]
+        filters["status__in"] = ACTIVE_STATUSES
     else:
-        filters["status__in"] = ["created", "validated", "checked_out", "returned"]
-
-    reservations = reservations_query.filter(**filters)
+        filters["status__in"] = ACTIVE_STATUSES + ["returned"]
+
+    reservations = [
+        reservation
+        async for reservation in Reservation.objects.filter(**filters)
+        .select_related("customer__customer_type")
+        .annotate(donations_sum=Sum("donations__amount"))
+    ]
+    items = defaultdict(list)
+    async for item in (
+        ReservationItem.objects.filter(reservation__status__in=filters["status__in"])
+        .select_related("asset")
+        .order_by("pk")
+    ):
+        items[item.reservation_id].append(item)
+    checks = await run_availability(check_reservations_availability, reservations)
 
     events = []
 
     for reservation in reservations:
+        reservation_items = items[reservation.pk]
         items_text = ", ".join(
             [
                 f"{item.asset.name} ({item.quantity_reserved})"
-                for item in reservation.items.all()[:3]
+                for item in reservation_items[:3]
             ]
         )
 
-        if reservation.items.count() > 3:
+        if len(reservation_items) > 3:
             items_text += "..."
 
         description = f"""
                 <strong>Client:</strong> {reservation.customer}<br>
                 <strong>Statut:</strong> {reservation.get_status_display()}<br>
                 <strong>Articles:</strong> {items_text}<br>
-                <strong>Don:</strong> {reservation.total_donations} €
+                <strong>Don:</strong> {reservation.donations_sum or 0} €
             """
 
         resource_id = f"customer-{reservation.customer}"
-        check_result = check_reservation_availability(reservation)
         events.append(
             {
                 "id": reservation.id,
@@ -700,7 +972,7 @@ def reservation_calendar_data(request):
                     "status_raw": reservation.status,
                     "items": items_text,
                     "description": description,
-                    "is_problematic": not check_result["is_ok"],
+                    "is_problematic": not checks[reservation.pk]["is_ok"],
                 },
             }
         )
@@ -2,13 +2,16 @@
 Admin configuration for the stock management application.
 """
 
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.utils.translation import gettext_lazy as _
 
+from .audit import correct_stock, init_baselines
 from .models import (
     Category,
     Asset,
+    StockBaseline,
     StockEvent,
+    StockEventArchive,
 )
 
 
@@ -60,6 +63,37 @@ class AssetAdmin(admin.ModelAdmin):
         (_("Gestion du stock"), {"fields": ("stock_quantity",)}),
         (_("Valeurs"), {"fields": ("replacement_value", "rental_value")}),
     )
+    actions = ["apply_stock_audit", "init_stock_baselines"]
+
+    @admin.action(description=_("Corriger le stock selon l'audit"))
+    def apply_stock_audit(self, request, queryset):
+        """
+        Correct the stock of the selected assets differing from their movements.
+        :param request: HTTP request object
+        :param queryset: Selected assets
+        """
+        discrepancies = correct_stock(
+            user=request.user, asset_pks=list(queryset.values_list("pk", flat=True))
+        )
+        self.message_user(
+            request,
+            _("%(count)s article(s) corrigé(s)") % {"count": len(discrepancies)},
+            messages.SUCCESS,
+        )
+
+    @admin.action(description=_("Enregistrer la quantité de référence du stock"))
+    def init_stock_baselines(self, request, queryset):
+        """
+        Record the reference quantity of the selected assets which have none.
+        :param request: HTTP request object
+        :param queryset: Selected assets
+        """
+        count = init_baselines(asset_pks=list(queryset.values_list("pk", flat=True)))
+        self.message_user(
+            request,
+            _("%(count)s quantité(s) de référence enregistrée(s)") % {"count": count},
+            messages.SUCCESS,
+        )
 
 
 @admin.register(StockEvent)
@@ -78,3 +112,41 @@ class StockEventAdmin(admin.ModelAdmin):
         (None, {"fields": ("asset", "event_type", "quantity")}),
         (_("Détails"), {"fields": ("description", "date", "user")}),
     )
+
+
+@admin.register(StockBaseline)
+class StockBaselineAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the StockBaseline model, read only.
+    """
+
+    list_display = ("asset", "quantity", "created_at")
+    search_fields = ("asset__name",)
+    readonly_fields = ("asset", "quantity", "created_at")
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(StockEventArchive)
+class StockEventArchiveAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for the StockEventArchive model, read only.
+    """
+
+    list_display = ("date", "asset", "event_type", "quantity", "user", "archived_at")
+    list_filter = ("event_type", "date")
+    search_fields = ("asset__name", "description")
+    date_hierarchy = "date"
+    readonly_fields = (
+        "asset",
+        "event_type",
+        "quantity",
+        "date",
+        "description",
+        "user",
+        "archived_at",
+    )
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,188 @@
+"""
+Audit of the stock quantities of the assets against their movements.
+
+The checkouts and returns change ``Asset.stock_quantity`` directly, while the
+other changes of the stock are recorded as stock events, which the
+availability computations add to it. A stock quantity changed any other way
+(an edit of the asset, a movement lost before the checkouts were locked)
+silently shifts the availability of the asset.
+
+Each checkout removes from the stock what it adds to the quantities checked
+out of the reservation items, and each return puts back into the stock what
+it adds to their quantities returned. So, for every asset, the stock quantity
+plus the quantities checked out minus the quantities returned does not
+change. This reference quantity is recorded once per asset
+(:class:`~ui.stock.models.StockBaseline`), and the audit expects the stock
+quantity to be this reference minus the quantities still out, computed for
+all the assets with one aggregate query over the reservation items. The
+archiving of reservations takes the movements of their items out of the
+reference.
+
+The reference of an asset is recorded when it is created, before any
+movement. The assets created before the audit, or in bulk, have none and
+are reported as such: there is no starting quantity to replay their
+movements from, so their reference is only recorded on request
+(:func:`init_baselines`), once their stock quantities were checked.
+
+The correction sets the stock quantity of the assets back to the expected
+quantity and records the difference as an inventory adjustment event: the
+availability of the asset is unchanged, and its history shows the
+difference.
+"""
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from ui.reservation.stock import apply_stock_deltas, lock_assets
+from .models import Asset, StockBaseline, StockEvent
+
+
+def _stock_movements(asset_pks=None):
+    """
+    Stock quantity, reference quantity and quantities out of the assets.
+    :param asset_pks: Primary keys of the assets (all of them if None)
+    :return: Queryset of tuples (pk, name, stock quantity, reference quantity
+        or None, quantities checked out, quantities returned), ordered by name
+    """
+    assets = Asset.objects.all()
+    if asset_pks is not None:
+        assets = assets.filter(pk__in=asset_pks)
+    return (
+        assets.annotate(
+            checked_out=Coalesce(Sum("reservation_items__quantity_checked_out"), 0),
+            returned=Coalesce(Sum("reservation_items__quantity_returned"), 0),
+        )
+        .order_by("name", "pk")
+        .values_list(
+            "pk",
+            "name",
+            "stock_quantity",
+            "stock_baseline__quantity",
+            "checked_out",
+            "returned",
+        )
+    )
+
+
+def audit_stock(asset_pks=None):
+    """
+    Compare the stock quantity of the assets with the quantity expected from
+    their movements.
+    :param asset_pks: Primary keys of the assets to audit (all of them if None)
+    :return: List of dicts, one per asset whose stock differs or which has no
+        reference quantity, ordered by name:
+        - asset: primary key of the asset
+        - name: name of the asset
+        - stock_quantity: stock quantity of the asset
+        - expected: stock quantity expected from its movements, None without
+          reference quantity
+        - difference: stock quantity minus expected quantity, None without
+          reference quantity
+    """
+    discrepancies = []
+    for pk, name, stock_quantity, baseline, checked_out, returned in _stock_movements(
+        asset_pks
+    ):
+        expected = None if baseline is None else baseline - (checked_out - returned)
+        if stock_quantity != expected:
+            discrepancies.append(
+                {
+                    "asset": pk,
+                    "name": name,
+                    "stock_quantity": stock_quantity,
+                    "expected": expected,
+                    "difference": (
+                        None if expected is None else stock_quantity - expected
+                    ),
+                }
+            )
+    return discrepancies
+
+
+def init_baselines(asset_pks=None):
+    """
+    Record the reference quantity of the assets which have none, taking
+    their current stock quantity as correct.
+    :param asset_pks: Primary keys of the assets (all of them if None)
+    :return: Number of recorded reference quantities
+    """
+    with transaction.atomic():
+        rows = _stock_movements(asset_pks).filter(stock_baseline__isnull=True)
+        baselines = [
+            StockBaseline(asset_id=pk, quantity=stock_quantity + checked_out - returned)
+            for pk, name, stock_quantity, baseline, checked_out, returned in rows
+        ]
+        return len(StockBaseline.objects.bulk_create(baselines, ignore_conflicts=True))
+
+
+def shift_baselines(deltas):
+    """
+    Add deltas to the reference quantities of assets, in one UPDATE
+    statement, when reservation items leave the audit (archived).
+    :param deltas: dict of asset pk to the quantity to add
+    :return: Number of updated reference quantities
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    return StockBaseline.objects.filter(asset_id__in=deltas).update(
+        quantity=F("quantity")
+        + Case(
+            *[When(asset_id=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def correct_stock(user=None, asset_pks=None):
+    """
+    Set the stock quantity of the assets whose stock differs back to the
+    expected quantity, recording the difference as an inventory adjustment.
+    The expected quantity of an asset having more quantities out than its
+    reference is 0, its reference being raised accordingly. The assets
+    without reference quantity are left out (see init_baselines).
+    :param user: User responsible for the adjustments (optional)
+    :param asset_pks: Primary keys of the assets to correct (all of them if None)
+    :return: List of the corrected discrepancies, as returned by audit_stock
+    """
+    with transaction.atomic():
+        pks = [
+            discrepancy["asset"]
+            for discrepancy in audit_stock(asset_pks)
+            if discrepancy["expected"] is not None
+        ]
+        if not pks:
+            return []
+        # The movements lock the assets they change: once they are locked,
+        # the stock and the movements of the assets are consistent
+        lock_assets(pks)
+        discrepancies = audit_stock(pks)
+
+        now = timezone.now()
+        deltas = {}
+        events = []
+        for discrepancy in discrepancies:
+            if discrepancy["expected"] < 0:
+                StockBaseline.objects.filter(asset_id=discrepancy["asset"]).update(
+                    quantity=F("quantity") - discrepancy["expected"]
+                )
+                discrepancy["difference"] = discrepancy["stock_quantity"]
+                discrepancy["expected"] = 0
+            deltas[discrepancy["asset"]] = -discrepancy["difference"]
+            events.append(
+                StockEvent(
+                    asset_id=discrepancy["asset"],
+                    event_type=StockEvent.EventType.INVENTORY_ADJUSTMENT,
+                    quantity=discrepancy["difference"],
+                    date=now,
+                    description=_("Écart constaté par l'audit du stock"),
+                    user=user,
+                )
+            )
+        StockEvent.objects.bulk_create(events)
+        apply_stock_deltas(deltas)
+    return discrepancies
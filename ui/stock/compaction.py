@@ -0,0 +1,149 @@
+"""
+Compaction of the old stock events.
+
+The stock events are never deleted, and the availability computations read
+all the events of an asset up to the date they look at, so years-old history
+(an issue and its repair) costs as much as recent events while not changing
+the current availability. The compaction replaces the events of an asset
+older than the retention horizon by their sum, with the rules of
+``get_asset_status_at_date``:
+
+* one inventory adjustment of the net change of the total stock;
+* one issue (or repair) of the net change of the damaged count;
+
+each only when it is not zero.
+
+These events are dated like the last compacted event of the asset, so the
+status of the asset at any later date, and thus at any date after the
+horizon, is unchanged. The compacted events are moved to
+:class:`~ui.stock.models.StockEventArchive`, where the history of the asset
+can still be read.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import formats
+from django.utils.translation import gettext as _
+
+from utils.computations import _event_deltas
+from .models import StockEvent, StockEventArchive
+
+EVENT_FIELDS = ["asset_id", "event_type", "quantity", "date", "description", "user_id"]
+
+
+def compacted_events(asset_pk, events):
+    """
+    Events replacing the compacted events of an asset.
+    :param asset_pk: Primary key of the asset
+    :param events: Compacted events, as dicts of EVENT_FIELDS
+    :return: List of unsaved StockEvent instances
+    """
+    total = damaged = 0
+    for event in events:
+        total_delta, damaged_delta = _event_deltas(
+            event["event_type"], event["quantity"]
+        )
+        total += total_delta
+        damaged += damaged_delta
+    date = max(event["date"] for event in events)
+    description = _("Historique compacté jusqu'au %(date)s") % {
+        "date": formats.date_format(date, "SHORT_DATE_FORMAT")
+    }
+
+    replacements = []
+    if total:
+        replacements.append(
+            StockEvent(
+                asset_id=asset_pk,
+                event_type=StockEvent.EventType.INVENTORY_ADJUSTMENT,
+                quantity=total,
+                date=date,
+                description=description,
+            )
+        )
+    if damaged:
+        replacements.append(
+            StockEvent(
+                asset_id=asset_pk,
+                event_type=(
+                    StockEvent.EventType.REPAIRABLE_ISSUE
+                    if damaged > 0
+                    else StockEvent.EventType.REPARATION
+                ),
+                quantity=abs(damaged),
+                date=date,
+                description=description,
+            )
+        )
+    return replacements
+
+
+def compact_stock_events(horizon, batch_size=500, progress=None):
+    """
+    Compact the stock events older than a horizon, one transaction per batch
+    of assets.
+    :param horizon: Date before which the events are compacted
+    :param batch_size: Number of assets per batch
+    :param progress: Function called after each batch with the number of
+        archived events and of compacted assets so far (optional)
+    :return: Tuple (number of archived events, number of compacted assets)
+    """
+    asset_pks = list(
+        StockEvent.objects.filter(date__lt=horizon)
+        .order_by("asset_id")
+        .values_list("asset_id", flat=True)
+        .distinct()
+    )
+    archived = compacted = 0
+    for start in range(0, len(asset_pks), batch_size):
+        with transaction.atomic():
+            events = defaultdict(list)
+            for event in (
+                StockEvent.objects.filter(
+                    asset_id__in=asset_pks[start : start + batch_size],
+                    date__lt=horizon,
+                )
+                .order_by("pk")
+                .select_for_update()
+                .values("pk", *EVENT_FIELDS)
+            ):
+                events[event["asset_id"]].append(event)
+            replacements = {
+                asset_pk: compacted_events(asset_pk, asset_events)
+                for asset_pk, asset_events in events.items()
+            }
+            # Already compacted: nothing to gain
+            events = {
+                asset_pk: asset_events
+                for asset_pk, asset_events in events.items()
+                if len(asset_events) > len(replacements[asset_pk])
+            }
+            if not events:
+                continue
+
+            StockEventArchive.objects.bulk_create(
+                [
+                    StockEventArchive(**{field: event[field] for field in EVENT_FIELDS})
+                    for asset_events in events.values()
+                    for event in asset_events
+                ]
+            )
+            StockEvent.objects.bulk_create(
+                [
+                    replacement
+                    for asset_pk in events
+                    for replacement in replacements[asset_pk]
+                ]
+            )
+            pks = [
+                event["pk"]
+                for asset_events in events.values()
+                for event in asset_events
+            ]
+            StockEvent.objects.filter(pk__in=pks).delete()
+        archived += len(pks)
+        compacted += len(events)
+        if progress:
+            progress(archived, compacted)
+    return archived, compacted
@@ -4,6 +4,8 @@ Models for managing stock, categories, and stock events.
 
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
 
@@ -116,6 +118,11 @@ class StockEvent(models.Model):
         verbose_name = _("Événement de stock")
         verbose_name_plural = _("Événements de stock")
         ordering = ["-date"]
+        # On PostgreSQL, the table is partitioned by year of date
+        # (utils/partitioning.py): each partition has its own index
+        indexes = [
+            models.Index(fields=["asset", "date"], name="ui_stockevent_asset_date_idx"),
+        ]
 
     def __str__(self):
         """
@@ -123,3 +130,93 @@ class StockEvent(models.Model):
         :return: String summarizing the stock event
         """
         return f"{self.get_event_type_display()} - {self.asset.name} ({self.date.strftime('%d/%m/%Y')})"
+
+
+class StockBaseline(models.Model):
+    """
+    Reference quantity of an asset for the stock audit: its stock quantity
+    plus the quantities checked out minus the quantities returned by its
+    reservations (not archived), which the checkouts and returns leave
+    unchanged (see ui/stock/audit.py).
+    """
+
+    asset = models.OneToOneField(
+        "Asset",
+        on_delete=models.CASCADE,
+        related_name="stock_baseline",
+        verbose_name=_("Article"),
+    )
+    quantity = models.IntegerField(verbose_name=_("Quantité de référence"))
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """
+        Meta information for the StockBaseline model.
+        """
+
+        verbose_name = _("Référence de stock")
+        verbose_name_plural = _("Références de stock")
+
+    def __str__(self):
+        """
+        String representation of the StockBaseline instance.
+        :return: Name of the asset and reference quantity
+        """
+        return f"{self.asset.name} ({self.quantity})"
+
+
+@receiver(post_save, sender=Asset)
+def create_stock_baseline(sender, instance, created, raw=False, **kwargs):
+    # Un article créé n'a encore aucune sortie : sa quantité de référence est
+    # sa quantité en stock
+    if created and not raw:
+        StockBaseline.objects.create(asset=instance, quantity=instance.stock_quantity)
+
+
+class StockEventArchive(models.Model):
+    """
+    Stock event older than the retention horizon, replaced in the stock
+    events by the compacted history of its asset (see ui/stock/compaction.py).
+    """
+
+    asset = models.ForeignKey(
+        "Asset",
+        on_delete=models.CASCADE,
+        related_name="archived_events",
+        verbose_name=_("Article"),
+    )
+    event_type = models.CharField(
+        max_length=20,
+        choices=StockEvent.EventType.choices,
+        verbose_name=_("Type d'événement"),
+    )
+    quantity = models.IntegerField(verbose_name=_("Quantité"))
+    date = models.DateTimeField(verbose_name=_("Date"))
+    description = models.TextField(blank=True, verbose_name=_("Description"))
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="+",
+        verbose_name=_("Utilisateur responsable"),
+    )
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """
+        Meta information for the StockEventArchive model.
+        """
+
+        verbose_name = _("Événement de stock archivé")
+        verbose_name_plural = _("Événements de stock archivés")
+        ordering = ["-date"]
+        indexes = [
+            models.Index(fields=["asset", "date"], name="ui_evarchive_asset_date_idx"),
+        ]
+
+    def __str__(self):
+        """
+        String representation of the StockEventArchive instance.
+        :return: String summarizing the archived stock event
+        """
+        return f"{self.get_event_type_display()} - {self.asset.name} ({self.date.strftime('%d/%m/%Y')})"
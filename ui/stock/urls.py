@@ -22,6 +22,7 @@ urlpatterns = [
     path("stock/items/<int:pk>/edit/", views.item_update, name="item_update"),
     path("stock/items/<int:pk>/delete/", views.item_delete, name="item_delete"),
     path("stock/items/<int:pk>/", views.item_detail, name="item_detail"),
+    path("stock/audit/", views.stock_audit, name="stock_audit"),
     path("stock/events/add/", views.stock_event_create, name="stock_event_create"),
     path(
         "stock/events/add/<int:asset_id>/",
@@ -3,6 +3,7 @@ Views for managing stock items, categories, and stock events.
 """
 
 import datetime
+from itertools import chain
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -12,9 +13,12 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from accounts.decorators import user_type_required, get_capability
-from ui.reservation.models import Reservation
-from utils.computations import get_asset_status_at_date
+from accounts.decorators import user_type_required
+from ui.reservation.models import Reservation, ReservationArchive
+from utils.computations import get_asset_status_at_date, get_assets_status_at_date
+from utils.idempotency import idempotent
+from utils.query_profiler import query_budget
+from .audit import audit_stock, correct_stock, init_baselines
 from .forms import (
     CategoryForm,
     AssetForm,
@@ -26,6 +30,7 @@ from .models import (
 )
 
 
+@query_budget(6)
 @login_required
 @user_type_required("member")
 def stock_view(request):
@@ -78,8 +83,10 @@ def stock_view(request):
     else:
         items = Asset.objects.filter(**filters).order_by(order_by)
 
+    items = list(items.select_related("category"))
+    statuses = get_assets_status_at_date(items, stock_date)
     for item in items:
-        item.stock_status = get_asset_status_at_date(item, stock_date)
+        item.stock_status = statuses[item.pk]
 
     context = {
         "items": items,
@@ -90,7 +97,6 @@ def stock_view(request):
         "direction": direction,
         "search_query": search_query,  # Ajouter la recherche au contexte
         "stock_date": stock_date,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/stock/list.html", context)
 
@@ -106,7 +112,6 @@ def category_list(request):
     categories = Category.objects.all().order_by("name")
     context = {
         "categories": categories,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/stock/category_list.html", context)
 
@@ -132,7 +137,6 @@ def category_create(request):
         "ui/stock/category_form.html",
         {
             "form": form,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -161,7 +165,6 @@ def category_update(request, pk):
         {
             "form": form,
             "category": category,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -185,7 +188,6 @@ def category_delete(request, pk):
         "ui/stock/category_confirm_delete.html",
         {
             "category": category,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -211,7 +213,6 @@ def item_create(request):
         "ui/stock/item_form.html",
         {
             "form": form,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -240,7 +241,6 @@ def item_update(request, pk):
         {
             "form": form,
             "item": item,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -264,7 +264,6 @@ def item_delete(request, pk):
         "ui/stock/item_confirm_delete.html",
         {
             "item": item,
-            "capability": get_capability(request.user),
         },
     )
 
@@ -293,10 +292,9 @@ def item_detail(request, pk):
             datetime.datetime.strptime(start_date, "%Y-%m-%dT%H:%M")
         )
         end_date_obj = timezone.make_aware(
-            datetime.datetime.strptime(end_date, "%Y-%m-%dT%H:%M")
-        )
-        end_date_obj = timezone.make_aware(
-            end_date_obj.replace(hour=23, minute=59, second=59)
+            datetime.datetime.strptime(end_date, "%Y-%m-%dT%H:%M").replace(
+                hour=23, minute=59, second=59
+            )
         )
     except ValueError:
         start_date_obj = timezone.now() - datetime.timedelta(days=365)
@@ -307,35 +305,53 @@ def item_detail(request, pk):
     stock_events = item.stockevent_set.filter(
         date__gte=start_date_obj, date__lte=end_date_obj
     ).order_by("-date")
+    # Les événements compactés et les réservations archivées ne sont lus
+    # que sur demande
+    include_archive = request.GET.get("archive") == "1"
+    if include_archive:
+        stock_events = sorted(
+            chain(
+                stock_events,
+                item.archived_events.filter(
+                    date__gte=start_date_obj, date__lte=end_date_obj
+                ),
+            ),
+            key=lambda event: event.date,
+            reverse=True,
+        )
 
-    reservations = (
-        Reservation.objects.filter(
-            items__asset=item,
-            status__in=["checked_out", "returned"],
-            actual_checkout_date__isnull=False,
+    moved = Q(
+        items__asset=item,
+        status__in=["checked_out", "returned"],
+        actual_checkout_date__isnull=False,
+    ) & (
+        Q(
+            actual_checkout_date__gte=start_date_obj,
+            actual_checkout_date__lte=end_date_obj,
         )
-        .filter(
-            Q(
-                actual_checkout_date__gte=start_date_obj,
-                actual_checkout_date__lte=end_date_obj,
-            )
-            | Q(
-                actual_return_date__gte=start_date_obj,
-                actual_return_date__lte=end_date_obj,
-            )
+        | Q(
+            actual_return_date__gte=start_date_obj,
+            actual_return_date__lte=end_date_obj,
         )
-        .distinct()
-        .order_by("-actual_checkout_date")
     )
+    reservations = (
+        Reservation.objects.filter(moved).distinct().order_by("-actual_checkout_date")
+    )
+    if include_archive:
+        reservations = sorted(
+            chain(reservations, ReservationArchive.objects.filter(moved).distinct()),
+            key=lambda reservation: reservation.actual_checkout_date,
+            reverse=True,
+        )
 
     context = {
         "item": item,
         "quantities": quantities,
         "stock_events": stock_events,
+        "include_archive": include_archive,
         "reservations": reservations,
         "start_date": start_date,
         "end_date": end_date,
-        "capability": get_capability(request.user),
     }
     return render(request, "ui/stock/item_detail.html", context)
 
@@ -373,6 +389,42 @@ def stock_event_create(request, asset_id=None):
         "ui/stock/stock_event_form.html",
         {
             "form": form,
-            "capability": get_capability(request.user),
+        },
+    )
+
+
+@login_required
+@user_type_required("admin")
+@idempotent
+def stock_audit(request):
+    """
+    List the assets whose stock quantity differs from their checkouts and
+    returns, and correct them on POST. The assets without reference quantity
+    are listed apart, their reference being recorded on demand.
+    :param request: HTTP request object
+    :return: Rendered audit page or redirect after the correction
+    """
+    if request.method == "POST":
+        if "init_baseline" in request.POST:
+            count = init_baselines()
+            messages.success(
+                request,
+                _("%(count)s quantité(s) de référence enregistrée(s)")
+                % {"count": count},
+            )
+        else:
+            discrepancies = correct_stock(user=request.user)
+            messages.success(
+                request,
+                _("%(count)s article(s) corrigé(s)") % {"count": len(discrepancies)},
+            )
+        return redirect("ui:stock_audit")
+    discrepancies = audit_stock()
+    return render(
+        request,
+        "ui/stock/audit.html",
+        {
+            "discrepancies": [d for d in discrepancies if d["expected"] is not None],
+            "without_baseline": [d for d in discrepancies if d["expected"] is None],
         },
     )
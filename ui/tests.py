@@ -1,3 +1,2930 @@
-from django.test import TestCase
+"""
+Tests for the UI application.
+"""
 
-# Create your tests here.
+import base64
+import copy
+import datetime
+import json
+import logging
+import os
+import pprint
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import Future
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import NotSupportedError, connection, migrations, models, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import F, Value
+from django.http import HttpResponse
+from django.test import (
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from prometheus_client import multiprocess as prometheus_multiprocess
+from pypdf import PdfReader
+
+from accounts.backends import ProfileModelBackend
+from accounts.decorators import capabilities_for
+from ui.benchmarks import BENCHMARKS
+from ui.custom_migrations.migrate_customertype import (
+    CustomerTypeMigration,
+    legacy_column_exists,
+)
+from ui.custom_migrations.models import DataMigrationCheckpoint
+from ui.management.commands.boot import (
+    LEGACY_MIGRATION_APPS,
+    Command as BootCommand,
+    take_over_legacy_history,
+)
+from ui.management.commands.check_migration_safety import unsafe_operations
+from ui.customer.models import Customer, CustomerType
+from ui.donation.forms import DonationForm
+from ui.donation.models import Donation
+from ui.idempotency.models import IdempotencyKey
+from ui.reservation.archive import archive_cutoff, archive_reservations
+from ui.reservation.models import (
+    ACTIVE_STATUSES,
+    Reservation,
+    ReservationArchive,
+    ReservationItem,
+    ReservationItemArchive,
+)
+from ui.reservation.batch import (
+    PICK_LIST_FILENAME,
+    batch_queryset,
+    pick_list,
+    render_batch,
+)
+from ui.reservation import booking, scan, stock
+from ui.reservation.pdf import (
+    LOGO_PATH,
+    render_summary_pdf,
+    summary_html,
+    summary_queryset,
+    warm_up as warm_up_pdf_pool,
+)
+from ui.stock.audit import audit_stock, correct_stock
+from ui.stock.compaction import compact_stock_events
+from ui.stock.models import (
+    Asset,
+    Category,
+    StockBaseline,
+    StockEvent,
+    StockEventArchive,
+)
+from utils.computations import (
+    analyze_asset_availability,
+    analyze_assets_availability,
+    check_reservation_availability,
+    check_reservations_availability,
+    get_asset_status_at_date,
+    get_assets_status_at_date,
+)
+from utils import idempotency, instrumentation, metrics, pdf_service
+from utils.data_migrations import DataMigration
+from utils.executors import (
+    get_pdf_batch_executor,
+    get_pdf_executor,
+    run_availability,
+)
+from utils.migration_operations import (
+    AddIndexConcurrently,
+    BackfillField,
+    backfill,
+    index_state,
+)
+from utils.partitioning import (
+    create_year_partition,
+    is_partitioned,
+    partition_name,
+    partition_years,
+)
+from utils.period import Period
+from utils.query_observers import observe_queries
+from utils.structured_logging import (
+    REQUEST_ID_HEADER,
+    JsonFormatter,
+    QueueLogHandler,
+    RequestContextFilter,
+    RequestContextMiddleware,
+    SamplingFilter,
+)
+from utils.query_profiler import (
+    COMPUTATIONS_HEADER,
+    PROFILE_HEADER,
+    QueryBudgetExceeded,
+    QueryProfile,
+    QueryProfilerMiddleware,
+    fingerprint,
+    query_budget,
+)
+
+
+def create_manager(username="manager"):
+    """
+    Create a user with the manager profile.
+    :param username: Username of the user
+    :return: User instance
+    """
+    user = User.objects.create_user(username=username, password="password")
+    user.profile.user_type = "manager"
+    user.profile.save()
+    return user
+
+
+def seed_synthetic_data(**options):
+    """
+    Seed a small synthetic dataset.
+    :param options: Options overriding the default sizes
+    """
+    sizes = {
+        "categories": 3,
+        "assets": 10,
+        "customers": 10,
+        "reservations": 30,
+        "stock_events": 40,
+        "donations": 10,
+    }
+    sizes.update(options)
+    call_command("seed_synthetic_data", stdout=StringIO(), **sizes)
+
+
+def create_customers(count):
+    """
+    Create physical customers of a single customer type.
+    :param count: Number of customers to create
+    :return: List of Customer instances
+    """
+    customer_type = CustomerType.objects.create(
+        name="Particulier", code="PHYSICAL", entity_type="physical"
+    )
+    return [
+        Customer.objects.create(
+            customer_type=customer_type,
+            first_name=f"Prénom {i}",
+            last_name=f"Nom {i}",
+            email=f"client{i}@example.com",
+            address="1 rue de la Paix",
+        )
+        for i in range(count)
+    ]
+
+
+def create_reservation(customer, quantities, status="validated"):
+    """
+    Create a reservation of the next days.
+    :param customer: Customer of the reservation
+    :param quantities: dict of Asset to reserved quantity
+    :param status: Status of the reservation
+    :return: Reservation instance
+    """
+    reservation = Reservation.objects.create(
+        customer=customer,
+        status=status,
+        checkout_date=timezone.now() + datetime.timedelta(days=1),
+        return_date=timezone.now() + datetime.timedelta(days=3),
+    )
+    for asset, quantity in quantities.items():
+        ReservationItem.objects.create(
+            reservation=reservation, asset=asset, quantity_reserved=quantity
+        )
+    return reservation
+
+
+def create_assets(*stock_quantities):
+    """
+    Create assets of a single category.
+    :param stock_quantities: Stock quantity of each asset
+    :return: List of Asset instances
+    """
+    category = Category.objects.create(name="Matériel")
+    return [
+        Asset.objects.create(
+            name=f"Article {i}",
+            description="",
+            category=category,
+            stock_quantity=quantity,
+            replacement_value=10,
+            rental_value=1,
+        )
+        for i, quantity in enumerate(stock_quantities)
+    ]
+
+
+class QueryProfileTests(TestCase):
+    """
+    Tests for the query recorder.
+    """
+
+    def test_fingerprint_ignores_parameters(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND x = 'a'"),
+            fingerprint("SELECT * FROM t WHERE id IN (%s) AND x = 'b'"),
+        )
+
+    def test_duplicates_detect_repeated_statements(self):
+        profile = QueryProfile()
+        with connection.execute_wrapper(profile):
+            for _ in range(3):
+                list(Customer.objects.filter(pk=1))
+            list(CustomerType.objects.all())
+        self.assertEqual(profile.count, 4)
+        self.assertEqual(list(profile.duplicates().values()), [3])
+        self.assertEqual(len(profile.slowest(2)), 2)
+
+
+@override_settings(QUERY_PROFILER_ENABLED=True)
+class QueryProfilerMiddlewareTests(TestCase):
+    """
+    Tests for the query profiler middleware and query budgets.
+    """
+
+    def setUp(self):
+        self.client.force_login(create_manager())
+
+    def test_header_exposes_profile(self):
+        response = self.client.get(reverse("ui:health_check"))
+        self.assertEqual(
+            response[PROFILE_HEADER], "count=0; time_ms=0.00; duplicates=0"
+        )
+
+    @override_settings(QUERY_PROFILER_ENABLED=False)
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse("ui:health_check"))
+        self.assertNotIn(PROFILE_HEADER, response)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_search_customers_within_budget(self):
+        create_customers(12)
+        response = self.client.get(reverse("ui:search_customers"), {"q": "Nom"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 10)
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_list_views_within_budget(self):
+        customers = create_customers(6)
+        assets = create_assets(5, 10, 3)
+        for i, customer in enumerate(customers):
+            create_reservation(
+                customer,
+                {asset: 1 for asset in assets},
+                status=["created", "validated", "returned"][i % 3],
+            )
+            Donation.objects.create(
+                customer=customer, amount=5, includes_membership=i % 2 == 0
+            )
+        for name in ["ui:reservations", "ui:stock", "ui:customers"]:
+            with self.subTest(view=name):
+                url = reverse(name)
+                self.assertIsNotNone(resolve(url).func.query_budget)
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_budget_exceeded(self):
+        @query_budget(1)
+        def view(request):
+            list(CustomerType.objects.all())
+            list(CustomerType.objects.all())
+
+        request = RequestFactory().get("/")
+        request.resolver_match = None
+
+        def get_response(req):
+            middleware.process_view(req, view, (), {})
+            view(req)
+            return HttpResponse()
+
+        middleware = QueryProfilerMiddleware(get_response)
+        with self.assertLogs("utils.query_profiler", "WARNING"):
+            middleware(request)
+        with override_settings(QUERY_BUDGET_STRICT=True):
+            with self.assertRaises(QueryBudgetExceeded):
+                middleware(request)
+
+
+class HealthAndMetricsTests(TestCase):
+    """
+    Tests of the liveness, readiness and metrics endpoints.
+    """
+
+    def test_liveness(self):
+        response = self.client.get(reverse("ui:liveness"))
+        self.assertEqual(response.content, b"OK")
+
+    def test_readiness(self):
+        response = self.client.get(reverse("ui:readiness"))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["status"], "ready")
+        self.assertEqual(set(data["checks"]), {"database", "cache"})
+
+    def test_readiness_fails_on_slow_database_or_broken_cache(self):
+        with override_settings(READINESS_MAX_DB_LATENCY_MS=-1):
+            response = self.client.get(reverse("ui:readiness"))
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()["checks"]["database"]["ok"])
+
+        with mock.patch("ui.views.cache.get", return_value=None):
+            response = self.client.get(reverse("ui:readiness"))
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response.json()["checks"]["database"]["ok"])
+        self.assertFalse(response.json()["checks"]["cache"]["ok"])
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("ui:health_check"))
+        check_reservations_availability([])
+        response = self.client.get(reverse("ui:metrics"))
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        content = response.content.decode()
+        self.assertIn("# TYPE pretloc_http_request_duration_seconds histogram", content)
+        self.assertIn(
+            'pretloc_http_request_duration_seconds_count{method="GET",status="2xx",'
+            'view="ui:health_check"}',
+            content,
+        )
+        self.assertIn(
+            'pretloc_http_request_queries_count{view="ui:health_check"}', content
+        )
+        self.assertIn(
+            'pretloc_availability_duration_seconds_count{function="check_reservations_availability"}',
+            content,
+        )
+
+        with override_settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get(reverse("ui:metrics")).status_code, 401)
+            response = self.client.get(
+                reverse("ui:metrics"), HTTP_AUTHORIZATION="Bearer secret"
+            )
+            self.assertEqual(response.status_code, 200)
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(self.client.get(reverse("ui:metrics")).status_code, 404)
+
+    def test_workers_metrics_aggregated(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        worker = (
+            "import os\n"
+            "from utils import metrics\n"
+            "metrics.CACHE_REQUESTS.labels(cache='test', result='hit').inc(2)\n"
+            "metrics.REQUESTS_IN_PROGRESS.inc()\n"
+            "print(os.getpid())\n"
+        )
+        environ = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory.name}
+        pids = [
+            int(
+                subprocess.run(
+                    [sys.executable, "-c", worker],
+                    capture_output=True,
+                    text=True,
+                    env=environ,
+                    cwd=Path(__file__).resolve().parent.parent,
+                    check=True,
+                ).stdout
+            )
+            for _ in range(2)
+        ]
+        with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory.name}):
+            content = metrics.render().decode()
+            self.assertIn(
+                'pretloc_cache_requests_total{cache="test",result="hit"} 4.0', content
+            )
+            self.assertIn("pretloc_http_requests_in_progress 2.0", content)
+
+            # Counters of the exited workers are kept, not their gauges
+            for pid in pids:
+                prometheus_multiprocess.mark_process_dead(pid, directory.name)
+            content = metrics.render().decode()
+            self.assertIn(
+                'pretloc_cache_requests_total{cache="test",result="hit"} 4.0', content
+            )
+            self.assertNotIn("pretloc_http_requests_in_progress 2.0", content)
+
+            metrics.reset()
+            self.assertEqual(list(Path(directory.name).glob("*.db")), [])
+
+
+class LoggingTests(TestCase):
+    """
+    Tests of the logging pipeline: request context, JSON records, sampling
+    and queued writes.
+    """
+
+    def capture(self, logger_name):
+        """
+        Capture the records of a logger formatted as JSON, with the request context.
+        :return: List of the decoded records
+        """
+        records = []
+        handler = logging.Handler()
+        handler.addFilter(RequestContextFilter())
+        handler.setFormatter(JsonFormatter())
+        handler.emit = lambda record: records.append(json.loads(handler.format(record)))
+        logger = logging.getLogger(logger_name)
+        logger.addHandler(handler)
+        previous_level = logger.level
+        logger.setLevel(logging.INFO)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(logger.setLevel, previous_level)
+        return records
+
+    def test_request_context(self):
+        records = self.capture("pretloc.access")
+        self.client.force_login(create_manager())
+        response = self.client.get(reverse("ui:reservations"))
+        request_id = response["X-Request-ID"]
+        self.assertEqual(len(request_id), 32)
+        record = records[-1]
+        self.assertEqual(record["request_id"], request_id)
+        self.assertEqual(record["view"], "ui:reservations")
+        self.assertEqual(record["user"], "manager")
+        self.assertEqual(record["status"], 200)
+        self.assertIn("duration_ms", record)
+
+        response = self.client.get(
+            reverse("ui:health_check"), HTTP_X_REQUEST_ID="front-1234"
+        )
+        self.assertEqual(response["X-Request-ID"], "front-1234")
+        # The user is not loaded for logging
+        self.assertNotIn("user", records[-1])
+        response = self.client.get(
+            reverse("ui:health_check"), HTTP_X_REQUEST_ID="bad id\n"
+        )
+        self.assertNotEqual(response["X-Request-ID"], "bad id\n")
+
+    def test_json_format(self):
+        records = self.capture("ui.tests.logging")
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            logging.getLogger("ui.tests.logging").exception(
+                "Failed %s", "here", extra={"reservation": 3}
+            )
+        record = records[0]
+        self.assertEqual(record["message"], "Failed here")
+        self.assertEqual(record["level"], "ERROR")
+        self.assertEqual(record["reservation"], 3)
+        self.assertIn("ValueError: broken", record["exception"])
+        self.assertNotIn("request_id", record)
+
+    def test_sampling(self):
+        sampling = SamplingFilter({"ui": 0, "ui.stock": 1})
+
+        def kept(name, level):
+            return sampling.filter(logging.LogRecord(name, level, "", 0, "", (), None))
+
+        self.assertFalse(kept("ui.donation.views", logging.DEBUG))
+        self.assertTrue(kept("ui.donation.views", logging.INFO))
+        self.assertTrue(kept("ui.stock.views", logging.DEBUG))
+        self.assertTrue(kept("uix", logging.DEBUG))
+
+    def test_queue_handler(self):
+        stream = StringIO()
+        handler = QueueLogHandler(stream, queue_size=2)
+        handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+        record = logging.LogRecord("ui", logging.INFO, "", 0, "message %s", (1,), None)
+        handler.handle(record)
+        handler.close()
+        self.assertEqual(stream.getvalue(), "INFO message 1\n")
+        self.assertEqual(record.args, (1,))
+
+        # Records are dropped rather than waiting for the writer thread
+        handler = QueueLogHandler(StringIO(), queue_size=1)
+        handler.close()
+        for _ in range(3):
+            handler.handle(record)
+        self.assertEqual(handler.dropped, 2)
+        handler.queue.get_nowait()
+        # The count of dropped records goes first, the record is dropped
+        handler.handle(record)
+        self.assertEqual(
+            handler.queue.get_nowait().getMessage(),
+            "2 log records dropped, the logging queue was full",
+        )
+        self.assertEqual(handler.dropped, 1)
+
+    def test_dropped_records_reported_with_verbose_format(self):
+        stream = StringIO()
+        handler = QueueLogHandler(stream, queue_size=1)
+        handler.setFormatter(
+            logging.Formatter(
+                settings.LOGGING["formatters"]["verbose"]["format"], style="{"
+            )
+        )
+        handler.addFilter(RequestContextFilter())
+        # Stopped writer: the queue fills up
+        handler.listener.stop()
+        record = logging.LogRecord("ui", logging.INFO, "", 0, "message", (), None)
+        for _ in range(3):
+            handler.handle(record)
+        self.assertEqual(handler.dropped, 2)
+        handler.queue.get_nowait()
+        handler.handle(record)
+        self.assertEqual(handler.dropped, 1)
+        handler.listener.start()
+        with mock.patch("sys.stderr", new_callable=StringIO) as errors:
+            handler.close()
+        self.assertEqual(errors.getvalue(), "")
+        self.assertIn(
+            "[None] 2 log records dropped, the logging queue was full",
+            stream.getvalue(),
+        )
+
+
+class SyntheticDataTests(TestCase):
+    """
+    Tests for the synthetic dataset generator and the benchmark suite.
+    """
+
+    def test_seed_synthetic_data(self):
+        seed_synthetic_data()
+        self.assertEqual(Asset.objects.count(), 10)
+        self.assertEqual(Customer.objects.count(), 10)
+        self.assertEqual(StockEvent.objects.count(), 40)
+        self.assertEqual(Donation.objects.count(), 10)
+        self.assertEqual(
+            set(Reservation.objects.values_list("status", flat=True)),
+            {"created", "validated", "checked_out", "returned", "cancelled"},
+        )
+        self.assertFalse(
+            Reservation.objects.filter(
+                status="returned", actual_return_date__isnull=True
+            ).exists()
+        )
+
+    def test_seed_refuses_existing_data(self):
+        seed_synthetic_data()
+        with self.assertRaises(CommandError):
+            seed_synthetic_data()
+        seed_synthetic_data(flush=True)
+        self.assertEqual(Asset.objects.count(), 10)
+
+    def test_run_benchmarks_reports_json(self):
+        seed_synthetic_data()
+        output = StringIO()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with override_settings(PDF_CACHE_DIR=cache_dir):
+                call_command(
+                    "run_benchmarks",
+                    repeat=1,
+                    warmup=0,
+                    sample=3,
+                    stdout=output,
+                    stderr=StringIO(),
+                )
+        report = json.loads(output.getvalue())
+        self.assertEqual(report["dataset"]["assets"], 10)
+        self.assertEqual(set(report["benchmarks"]), set(BENCHMARKS))
+        for result in report["benchmarks"].values():
+            self.assertEqual(result["runs"], 1)
+            self.assertGreater(result["queries"], 0)
+
+
+# Reference time of the randomized availability cases, with seconds to exercise
+# the minute resolution of Period
+FUZZ_NOW = datetime.datetime(2024, 6, 15, 12, 0, 30, tzinfo=datetime.timezone.utc)
+FUZZ_SPAN = 3 * 24 * 3600
+# Default seed of the randomized availability tests
+FUZZ_SEED = 20240615
+
+
+def generate_availability_case(rng):
+    """
+    Generate a random history of stock events and reservations.
+    Dates are stored as offsets in seconds from FUZZ_NOW so that cases stay
+    readable and easy to shrink.
+    :param rng: Random generator
+    :return: Case dict
+    """
+
+    def offset():
+        return rng.randint(-FUZZ_SPAN, FUZZ_SPAN) // 60 * 60 + rng.choice(
+            [0, 0, rng.randint(1, 59)]
+        )
+
+    asset_count = rng.randint(1, 3)
+    case = {
+        "stocks": [rng.randint(0, 10) for _ in range(asset_count)],
+        "events": [
+            {
+                "asset": rng.randrange(asset_count),
+                "date": offset(),
+                "type": rng.choice(StockEvent.EventType.values),
+                "quantity": rng.randint(1, 5),
+            }
+            for _ in range(rng.randint(0, 8))
+        ],
+        "reservations": [],
+    }
+    for _ in range(rng.randint(0, 6)):
+        status = rng.choice(
+            ["created", "validated", "checked_out", "returned", "cancelled"]
+        )
+        checkout = offset()
+        reservation = {
+            "status": status,
+            "checkout": checkout,
+            "return": checkout + rng.randint(-3600, 2 * 24 * 3600),
+            "actual_checkout": None,
+            "actual_return": None,
+            "excluded": False,
+            "items": {
+                asset: rng.randint(1, 4)
+                for asset in rng.sample(range(asset_count), rng.randint(1, asset_count))
+            },
+        }
+        if status in ["checked_out", "returned"] or rng.random() < 0.1:
+            reservation["actual_checkout"] = checkout + rng.randint(-7200, 7200)
+        if status == "returned" or rng.random() < 0.1:
+            reservation["actual_return"] = reservation["return"] + rng.randint(
+                -7200, 7200
+            )
+        case["reservations"].append(reservation)
+    if case["reservations"] and rng.random() < 0.4:
+        rng.choice(case["reservations"])["excluded"] = True
+
+    # probe dates on and around the boundaries of the history
+    boundaries = [0] + [event["date"] for event in case["events"]]
+    for reservation in case["reservations"]:
+        boundaries += [
+            reservation[key]
+            for key in ["checkout", "return", "actual_checkout", "actual_return"]
+            if reservation[key] is not None
+        ]
+    probes = [
+        rng.choice(boundaries) + rng.choice([0, 0, -60, -20, 20, 60]) for _ in range(6)
+    ]
+    case["probes"] = probes + [None]
+    case["periods"] = [tuple(rng.sample(probes, 2)) for _ in range(3)]
+    return case
+
+
+def fuzz_date(offset):
+    """
+    Convert a case offset into a date.
+    :param offset: Offset in seconds from FUZZ_NOW, or None
+    :return: Date, or None
+    """
+    if offset is None:
+        return None
+    return FUZZ_NOW + datetime.timedelta(seconds=offset)
+
+
+def materialize_availability_case(case, customer):
+    """
+    Create the assets, stock events and reservations of a case.
+    :param case: Case dict
+    :param customer: Customer making the reservations
+    :return: Tuple (list of assets, excluded reservation or None)
+    """
+    category = Category.objects.create(name="Catégorie")
+    assets = [
+        Asset.objects.create(
+            name=f"Article {i}",
+            description="",
+            category=category,
+            stock_quantity=stock,
+            replacement_value=10,
+            rental_value=1,
+        )
+        for i, stock in enumerate(case["stocks"])
+    ]
+    StockEvent.objects.bulk_create(
+        StockEvent(
+            asset=assets[event["asset"]],
+            event_type=event["type"],
+            quantity=event["quantity"],
+            date=fuzz_date(event["date"]),
+        )
+        for event in case["events"]
+    )
+    excluded = None
+    for data in case["reservations"]:
+        reservation = Reservation.objects.create(
+            customer=customer,
+            status=data["status"],
+            checkout_date=fuzz_date(data["checkout"]),
+            return_date=fuzz_date(data["return"]),
+            actual_checkout_date=fuzz_date(data["actual_checkout"]),
+            actual_return_date=fuzz_date(data["actual_return"]),
+        )
+        for asset, quantity in data["items"].items():
+            ReservationItem.objects.create(
+                reservation=reservation,
+                asset=assets[asset],
+                quantity_reserved=quantity,
+            )
+        if data["excluded"]:
+            excluded = reservation
+    return assets, excluded
+
+
+def availability_mismatches(case, customer):
+    """
+    Compare the bulk availability engine with the per-date reference implementation,
+    including the availability check of every reservation of the case.
+    :param case: Case dict
+    :param customer: Customer making the reservations
+    :return: List of mismatch descriptions, empty when both engines agree
+    """
+    mismatches = []
+    with mock.patch("django.utils.timezone.now", return_value=FUZZ_NOW):
+        with transaction.atomic():
+            assets, excluded = materialize_availability_case(case, customer)
+            for offset in case["probes"]:
+                date = fuzz_date(offset)
+                fast = get_assets_status_at_date(assets, date, excluded)
+                for asset in assets:
+                    reference = get_asset_status_at_date(asset, date, excluded)
+                    if fast[asset.pk] != reference:
+                        mismatches.append(
+                            ("status", asset.name, offset, reference, fast[asset.pk])
+                        )
+            for start, end in case["periods"]:
+                period = Period(fuzz_date(start), fuzz_date(end))
+                fast = analyze_assets_availability(assets, period, excluded)
+                for asset in assets:
+                    reference = analyze_asset_availability(asset, period, excluded)
+                    if fast[asset.pk] != reference:
+                        mismatches.append(
+                            (
+                                "analyze",
+                                asset.name,
+                                (start, end),
+                                reference,
+                                fast[asset.pk],
+                            )
+                        )
+            reservations = list(Reservation.objects.filter(customer=customer))
+            fast = check_reservations_availability(reservations)
+            for reservation in reservations:
+                reference = check_reservation_availability(reservation)
+                if fast[reservation.pk] != reference:
+                    mismatches.append(
+                        ("check", reservation.pk, reference, fast[reservation.pk])
+                    )
+            transaction.set_rollback(True)
+    return mismatches
+
+
+def case_simplifications(case):
+    """
+    Generate simpler variants of a case, used to shrink failing cases.
+    :param case: Case dict
+    :return: Iterator of simplified cases
+    """
+    for key in ["reservations", "events", "probes", "periods"]:
+        for i in range(len(case[key])):
+            simpler = copy.deepcopy(case)
+            del simpler[key][i]
+            yield simpler
+    for i, reservation in enumerate(case["reservations"]):
+        if reservation["excluded"]:
+            simpler = copy.deepcopy(case)
+            simpler["reservations"][i]["excluded"] = False
+            yield simpler
+        if len(reservation["items"]) > 1:
+            for asset in reservation["items"]:
+                simpler = copy.deepcopy(case)
+                del simpler["reservations"][i]["items"][asset]
+                yield simpler
+    for i, quantity in enumerate(case["stocks"]):
+        if quantity:
+            simpler = copy.deepcopy(case)
+            simpler["stocks"][i] = 0
+            yield simpler
+    for i, event in enumerate(case["events"]):
+        if event["quantity"] > 1:
+            simpler = copy.deepcopy(case)
+            simpler["events"][i]["quantity"] = 1
+            yield simpler
+
+
+def shrink_case(case, fails):
+    """
+    Greedily simplify a failing case until no simpler variant fails.
+    :param case: Failing case dict
+    :param fails: Predicate telling whether a case still fails
+    :return: Minimal failing case
+    """
+    shrinking = True
+    while shrinking:
+        shrinking = False
+        for simpler in case_simplifications(case):
+            if fails(simpler):
+                case = simpler
+                shrinking = True
+                break
+    return case
+
+
+class AvailabilityEquivalenceTests(TestCase):
+    """
+    Randomized equivalence tests between the bulk availability engine and
+    the per-date reference implementation of utils.computations.
+    The cases are generated from a fixed seed, so that the test is
+    reproducible: set AVAILABILITY_FUZZ_SEED to explore other cases or replay
+    a failure, and AVAILABILITY_FUZZ_RUNS to change the number of cases.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = create_customers(1)[0]
+
+    def test_bulk_engine_matches_reference(self):
+        seed = int(os.environ.get("AVAILABILITY_FUZZ_SEED", FUZZ_SEED))
+        runs = int(os.environ.get("AVAILABILITY_FUZZ_RUNS", 50))
+        rng = random.Random(seed)
+        for run in range(runs):
+            case = generate_availability_case(rng)
+            if availability_mismatches(case, self.customer):
+                minimal = shrink_case(
+                    case, lambda c: bool(availability_mismatches(c, self.customer))
+                )
+                self.fail(
+                    f"AVAILABILITY_FUZZ_SEED={seed} (case {run}), minimal case:\n"
+                    f"{pprint.pformat(minimal)}\n"
+                    f"{pprint.pformat(availability_mismatches(minimal, self.customer))}"
+                )
+
+    def test_shrink_case_finds_minimal_example(self):
+        case = generate_availability_case(random.Random(1))
+        case["events"].append({"asset": 0, "date": 0, "type": "ISSUE", "quantity": 3})
+
+        def has_issue(c):
+            return any(event["type"] == "ISSUE" for event in c["events"])
+
+        minimal = shrink_case(case, has_issue)
+        self.assertEqual(minimal["reservations"], [])
+        self.assertEqual(minimal["probes"], [])
+        self.assertEqual(len(minimal["events"]), 1)
+        self.assertEqual(minimal["events"][0]["quantity"], 1)
+
+    def test_bulk_engine_query_count(self):
+        seed_synthetic_data()
+        assets = list(Asset.objects.all())
+        period = Period(FUZZ_NOW, FUZZ_NOW + datetime.timedelta(days=30))
+        with self.assertNumQueries(2):
+            analyze_assets_availability(assets, period)
+        with self.assertNumQueries(2):
+            get_assets_status_at_date(assets)
+        reservations = list(Reservation.objects.all())
+        with self.assertNumQueries(3):
+            check_reservations_availability(reservations)
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN plans are PostgreSQL specific")
+class QueryPlanTests(TestCase):
+    """
+    Regression tests checking that the hot queries are served by an index.
+    Sequential scans are disabled for the planner, so a "Seq Scan" node in
+    a plan means that no index can serve the query.
+    """
+
+    HOT_TABLES = [
+        Asset._meta.db_table,
+        StockEvent._meta.db_table,
+        Reservation._meta.db_table,
+        ReservationItem._meta.db_table,
+        Donation._meta.db_table,
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_synthetic_data(assets=50, customers=50, reservations=300, stock_events=500)
+        with connection.cursor() as cursor:
+            for table in cls.HOT_TABLES:
+                cursor.execute(f"ANALYZE {table}")
+
+    def assertUsesIndexes(self, queryset):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+        for table in self.HOT_TABLES:
+            self.assertNotIn(f"Seq Scan on {table}", plan, plan)
+
+    def test_stock_events_by_asset_and_date(self):
+        asset = Asset.objects.first()
+        self.assertUsesIndexes(
+            StockEvent.objects.filter(asset=asset, date__lte=FUZZ_NOW).order_by("date")
+        )
+        self.assertUsesIndexes(
+            StockEvent.objects.filter(
+                asset_id__in=[asset.pk], date__lte=FUZZ_NOW
+            ).order_by("date")
+        )
+
+    def test_active_reservation_items_by_asset(self):
+        asset = Asset.objects.first()
+        self.assertUsesIndexes(
+            ReservationItem.objects.filter(asset=asset)
+            .exclude(reservation__status__in=["cancelled", "returned"])
+            .select_related("reservation")
+        )
+
+    def test_reservations_by_status(self):
+        self.assertUsesIndexes(
+            Reservation.objects.filter(status__in=ACTIVE_STATUSES).order_by(
+                "-checkout_date"
+            )
+        )
+        self.assertUsesIndexes(
+            Reservation.objects.filter(
+                status="validated", checkout_date__gte=FUZZ_NOW
+            ).order_by("checkout_date")
+        )
+
+    def test_reservations_by_customer(self):
+        customer = Customer.objects.first()
+        self.assertUsesIndexes(customer.reservations.all().order_by("-checkout_date"))
+
+    def test_membership_donations(self):
+        customer = Customer.objects.first()
+        self.assertUsesIndexes(
+            customer.donations.filter(date__year=2024, includes_membership=True)
+        )
+        self.assertUsesIndexes(customer.donations.filter(date__year=2024))
+
+
+class AsyncEndpointsTests(TestCase):
+    """
+    Tests of the async JSON endpoints against the reference computations.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        with mock.patch("django.utils.timezone.now", return_value=FUZZ_NOW):
+            seed_synthetic_data()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_search_assets_at_date(self):
+        with mock.patch("django.utils.timezone.now", return_value=FUZZ_NOW):
+            response = self.client.get(reverse("ui:search_assets"))
+            references = {
+                asset.pk: get_asset_status_at_date(asset)
+                for asset in Asset.objects.filter(stock_quantity__gt=0)
+            }
+        results = response.json()["results"]
+        self.assertEqual(len(results), len(references))
+        for result in results:
+            reference = references[result["id"]]
+            self.assertEqual(result["stock"], reference["available"])
+            self.assertEqual(result["stock_total"], reference["total"])
+            self.assertEqual(result["stock_reserved"], reference["reserved"])
+
+    def test_search_assets_over_period(self):
+        end_date = FUZZ_NOW + datetime.timedelta(days=30)
+        response = self.client.get(
+            reverse("ui:search_assets"),
+            {"start_date": FUZZ_NOW.isoformat(), "end_date": end_date.isoformat()},
+        )
+        for result in response.json()["results"]:
+            asset = Asset.objects.get(pk=result["id"])
+            reference = analyze_asset_availability(asset, Period(FUZZ_NOW, end_date))
+            self.assertEqual(result["stock"], reference["available"])
+            self.assertEqual(result["stock_checked_out"], 0)
+
+    def test_check_reservation(self):
+        reservation = Reservation.objects.filter(status="validated").first()
+        response = self.client.get(
+            reverse("ui:check_reservation"), {"res_pk": reservation.pk}
+        )
+        self.assertEqual(response.json(), check_reservation_availability(reservation))
+        response = self.client.get(reverse("ui:check_reservation"), {"res_pk": 0})
+        self.assertEqual(response.status_code, 404)
+
+    def test_calendar_data(self):
+        response = self.client.get(
+            reverse("ui:reservation_calendar_data"), {"active_only": "true"}
+        )
+        events = response.json()
+        self.assertEqual(
+            len(events), Reservation.objects.filter(status__in=ACTIVE_STATUSES).count()
+        )
+        for event in events:
+            reservation = Reservation.objects.get(pk=event["id"])
+            self.assertEqual(
+                event["extendedProps"]["is_problematic"],
+                not check_reservation_availability(reservation)["is_ok"],
+            )
+            self.assertIn(
+                f"{reservation.total_donations} €",
+                event["extendedProps"]["description"],
+            )
+
+    def test_calendar_data_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse("ui:reservation_calendar_data"))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse("accounts:login"), response["Location"])
+
+    def test_availability_runs_inline_in_transaction(self):
+        # Pool threads could not see the data of the test transaction
+        thread = async_to_sync(run_availability)(threading.get_ident)
+        self.assertEqual(thread, threading.get_ident())
+
+    @override_settings(DEBUG=True, METRICS_ENABLED=True, QUERY_PROFILER_ENABLED=True)
+    def test_middlewares_run_async(self):
+        with mock.patch("django.core.handlers.base.logger") as logger:
+            ASGIHandler()
+        adapted = " ".join(str(call.args) for call in logger.debug.call_args_list)
+        for path in [
+            "utils.structured_logging.RequestContextMiddleware",
+            "utils.metrics.MetricsMiddleware",
+            "utils.query_profiler.QueryProfilerMiddleware",
+            "accounts.middleware.CapabilityMiddleware",
+        ]:
+            self.assertNotIn(path, adapted)
+
+        async def get_response(request):
+            return HttpResponse()
+
+        for middleware in [RequestContextMiddleware, QueryProfilerMiddleware]:
+            instance = middleware(get_response)
+            self.assertTrue(iscoroutinefunction(instance))
+            # Otherwise run in a thread by the handler
+            self.assertTrue(iscoroutinefunction(instance.process_view))
+
+    @override_settings(QUERY_PROFILER_ENABLED=True)
+    def test_profile_of_async_request(self):
+        self.async_client.force_login(self.user)
+        response = async_to_sync(self.async_client.get)(
+            reverse("ui:search_assets"), {"q": "a"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(REQUEST_ID_HEADER, response)
+        self.assertNotIn("count=0;", response[PROFILE_HEADER])
+
+
+class AvailabilityPoolTests(TransactionTestCase):
+    """
+    Tests of the availability pool, only used outside of a transaction.
+    """
+
+    @override_settings(AVAILABILITY_EXECUTOR_WORKERS=2)
+    def test_pool_queries_observed(self):
+        create_assets(1, 2)
+
+        def load():
+            return len(Asset.objects.all()), threading.get_ident()
+
+        profile = QueryProfile()
+        with observe_queries(profile):
+            count, thread = async_to_sync(run_availability)(load)
+        self.assertEqual(count, 2)
+        self.assertNotEqual(thread, threading.get_ident())
+        self.assertEqual(profile.count, 1)
+
+
+class InstrumentationTests(TestCase):
+    """
+    Tests of the instrumentation of the availability computations.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        with mock.patch("django.utils.timezone.now", return_value=FUZZ_NOW):
+            seed_synthetic_data()
+        cls.asset = Asset.objects.filter(reservation_items__isnull=False).first()
+        cls.period = Period(FUZZ_NOW, FUZZ_NOW + datetime.timedelta(days=30))
+
+    def test_disabled_by_default(self):
+        with instrumentation.collect() as stats:
+            analyze_asset_availability(self.asset, self.period)
+        self.assertEqual(stats.as_dict(), {})
+
+    @override_settings(COMPUTATIONS_INSTRUMENTATION=True)
+    def test_calls_queries_and_items(self):
+        calls = (
+            REGISTRY.get_sample_value(
+                "pretloc_computation_calls_total",
+                {"function": "analyze_asset_availability"},
+            )
+            or 0
+        )
+        with instrumentation.collect() as stats, CaptureQueriesContext(
+            connection
+        ) as queries:
+            analyze_asset_availability(self.asset, self.period)
+        figures = stats.as_dict()
+        analyze = figures["analyze_asset_availability"]
+        status = figures["get_asset_status_at_date"]
+        self.assertEqual(analyze["calls"], 1)
+        # Figures are inclusive of the nested calls
+        self.assertEqual(status["calls"], analyze["critical_dates"])
+        self.assertEqual(analyze["queries"], len(queries))
+        self.assertLess(status["queries"], analyze["queries"])
+        self.assertEqual(analyze["events"], status["events"])
+        self.assertGreaterEqual(analyze["time_ms"], status["time_ms"])
+        self.assertEqual(
+            REGISTRY.get_sample_value(
+                "pretloc_computation_calls_total",
+                {"function": "analyze_asset_availability"},
+            ),
+            calls + 1,
+        )
+
+    def test_availability_duration_observed_once(self):
+        def observed():
+            return (
+                REGISTRY.get_sample_value(
+                    "pretloc_availability_duration_seconds_count",
+                    {"function": "check_reservations_availability"},
+                )
+                or 0
+            )
+
+        reservations = list(Reservation.objects.all())
+        for instrumentation_enabled in (False, True):
+            with self.subTest(instrumentation=instrumentation_enabled):
+                with override_settings(
+                    COMPUTATIONS_INSTRUMENTATION=instrumentation_enabled
+                ):
+                    count = observed()
+                    check_reservations_availability(reservations)
+                    self.assertEqual(observed(), count + 1)
+
+        with override_settings(METRICS_ENABLED=False):
+            count = observed()
+            check_reservations_availability(reservations)
+            self.assertEqual(observed(), count)
+
+    @override_settings(COMPUTATIONS_INSTRUMENTATION=True)
+    def test_bulk_engine_figures(self):
+        with instrumentation.collect() as stats:
+            analyze_assets_availability(list(Asset.objects.all()), self.period)
+        figures = stats.as_dict()
+        self.assertEqual(figures["analyze_assets_availability"]["queries"], 2)
+        self.assertEqual(
+            figures["load_asset_timelines"]["events"],
+            StockEvent.objects.filter(date__lte=self.period.end_date).count(),
+        )
+        self.assertGreaterEqual(
+            figures["analyze_assets_availability"]["critical_dates"],
+            2 * Asset.objects.count(),
+        )
+
+    @override_settings(COMPUTATIONS_INSTRUMENTATION=True)
+    def test_pool_threads_report_to_the_request(self):
+        @instrumentation.instrumented
+        def computation():
+            instrumentation.add("events", 3)
+            return threading.get_ident()
+
+        with mock.patch("utils.executors.connection") as pool_connection:
+            pool_connection.in_atomic_block = False
+            with instrumentation.collect() as stats:
+                thread = async_to_sync(run_availability)(computation)
+        self.assertNotEqual(thread, threading.get_ident())
+        self.assertEqual(stats.as_dict()["computation"]["events"], 3)
+
+    @override_settings(COMPUTATIONS_INSTRUMENTATION=True, QUERY_PROFILER_ENABLED=True)
+    def test_query_profiler_reports_computations(self):
+        self.client.force_login(self.user)
+        reservation = Reservation.objects.filter(status="validated").first()
+        response = self.client.get(
+            reverse("ui:check_reservation"), {"res_pk": reservation.pk}
+        )
+        self.assertIn(
+            "check_reservations_availability=1x/", response[COMPUTATIONS_HEADER]
+        )
+
+
+class StockMovementTests(TestCase):
+    """
+    Tests of the checkout and return of the reservation items.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        cls.customer = create_customers(1)[0]
+        cls.tent, cls.table = create_assets(5, 10)
+
+    def setUp(self):
+        self.reservation = create_reservation(
+            self.customer, {self.tent: 3, self.table: 8}
+        )
+        self.items = {
+            item.asset_id: item for item in self.reservation.items.order_by("pk")
+        }
+
+    def stock(self):
+        return dict(Asset.objects.values_list("pk", "stock_quantity"))
+
+    def checkout(self, tent, table):
+        return stock.checkout_reservation(
+            self.reservation.pk,
+            {self.items[self.tent.pk].pk: tent, self.items[self.table.pk].pk: table},
+            self.user,
+        )
+
+    def test_checkout_one_update_per_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            reservation = self.checkout(3, 8)
+        updates = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(
+            sum(f'UPDATE "{Asset._meta.db_table}"' in sql for sql in updates), 1
+        )
+        self.assertEqual(
+            sum(f'UPDATE "{ReservationItem._meta.db_table}"' in sql for sql in updates),
+            1,
+        )
+        if connection.features.has_select_for_update:
+            self.assertEqual(
+                sum("FOR UPDATE" in q["sql"] for q in queries),
+                2,
+            )
+        self.assertEqual(self.stock(), {self.tent.pk: 2, self.table.pk: 2})
+        self.assertEqual(reservation.status, "checked_out")
+        self.assertEqual(
+            set(self.reservation.items.values_list("quantity_checked_out", flat=True)),
+            {3, 8},
+        )
+
+    def test_checkout_applies_nothing_on_error(self):
+        with self.assertRaises(stock.StockError) as error:
+            self.checkout(6, 8)
+        self.assertEqual(len(error.exception.errors), 1)
+        self.assertIn("Article 0", error.exception.errors[0])
+        self.assertEqual(self.stock(), {self.tent.pk: 5, self.table.pk: 10})
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.reservation.status, "validated")
+
+        self.checkout(3, 8)
+        with self.assertRaises(stock.StockError):
+            self.checkout(3, 8)
+        self.assertEqual(self.stock(), {self.tent.pk: 2, self.table.pk: 2})
+
+    def test_return(self):
+        self.checkout(3, 8)
+        returns = {
+            self.items[self.tent.pk].pk: (2, 1, 0),
+            self.items[self.table.pk].pk: (5, 1, 2),
+        }
+        with self.assertRaises(stock.StockError):
+            stock.return_reservation(
+                self.reservation.pk,
+                {**returns, self.items[self.tent.pk].pk: (3, 1, 0)},
+                self.user,
+            )
+        self.assertEqual(self.stock(), {self.tent.pk: 2, self.table.pk: 2})
+
+        reservation = stock.return_reservation(self.reservation.pk, returns, self.user)
+        self.assertEqual(reservation.status, "returned")
+        self.assertEqual(self.stock(), {self.tent.pk: 4, self.table.pk: 7})
+        item = ReservationItem.objects.get(pk=self.items[self.table.pk].pk)
+        self.assertEqual((item.quantity_returned, item.quantity_damaged), (5, 1))
+
+    def test_checkout_and_return_views(self):
+        self.client.force_login(self.user)
+        url = reverse("ui:reservation_checkout", args=[self.reservation.pk])
+        response = self.client.post(
+            url, {f"checkout_{self.items[self.tent.pk].pk}": 9}, follow=True
+        )
+        self.assertContains(response, "Article 0")
+        self.assertEqual(self.stock()[self.tent.pk], 5)
+
+        response = self.client.post(
+            url, {f"checkout_{item.pk}": 2 for item in self.items.values()}
+        )
+        self.assertRedirects(
+            response,
+            reverse("ui:reservation_detail", args=[self.reservation.pk]),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(self.stock(), {self.tent.pk: 3, self.table.pk: 8})
+
+        data = {"total_donations": "12"}
+        for item in self.items.values():
+            data.update(
+                {
+                    f"return_{item.pk}": 2,
+                    f"damaged_{item.pk}": 0,
+                    f"destroyed_{item.pk}": 0,
+                }
+            )
+        self.client.post(
+            reverse("ui:reservation_return", args=[self.reservation.pk]), data
+        )
+        self.assertEqual(self.stock(), {self.tent.pk: 5, self.table.pk: 10})
+        self.assertEqual(self.reservation.donations.get().amount, 12)
+
+
+@skipUnless(connection.vendor == "postgresql", "Row locks are PostgreSQL specific")
+class ConcurrentStockMovementTests(TransactionTestCase):
+    """
+    Concurrent checkouts of the same assets by several desk operators.
+    """
+
+    def test_no_lost_update(self):
+        user = create_manager()
+        customer = create_customers(1)[0]
+        tent, table = create_assets(10, 10)
+        reservations = [
+            create_reservation(customer, {tent: 3, table: 3}) for _ in range(4)
+        ]
+        barrier = threading.Barrier(len(reservations))
+        results = []
+
+        def checkout(reservation):
+            try:
+                barrier.wait()
+                stock.checkout_reservation(
+                    reservation.pk,
+                    {item.pk: 3 for item in reservation.items.all()},
+                    user,
+                )
+                results.append(True)
+            except stock.StockError:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=checkout, args=[reservation])
+            for reservation in reservations
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False, True, True, True])
+        self.assertEqual(
+            list(Asset.objects.order_by("pk").values_list("stock_quantity", flat=True)),
+            [1, 1],
+        )
+
+
+class StockAuditTests(TestCase):
+    """
+    Tests of the audit of the stock quantities against the movements.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        cls.customer = create_customers(1)[0]
+        cls.tent, cls.table = create_assets(5, 10)
+
+    def setUp(self):
+        self.assertEqual(audit_stock(), [])
+
+    def move(self):
+        reservation = create_reservation(self.customer, {self.tent: 3, self.table: 4})
+        items = {item.asset_id: item.pk for item in reservation.items.all()}
+        stock.checkout_reservation(
+            reservation.pk, {items[self.tent.pk]: 3, items[self.table.pk]: 4}, self.user
+        )
+        return reservation, items
+
+    def test_movements_keep_stock_consistent(self):
+        self.assertEqual(StockBaseline.objects.count(), 2)
+        reservation, items = self.move()
+        self.assertEqual(audit_stock(), [])
+        stock.return_reservation(
+            reservation.pk,
+            {items[self.tent.pk]: (1, 1, 1), items[self.table.pk]: (4, 0, 0)},
+            self.user,
+        )
+        self.assertEqual(audit_stock(), [])
+
+    def test_direct_change_corrected_as_adjustment(self):
+        self.move()
+        Asset.objects.filter(pk=self.tent.pk).update(
+            stock_quantity=F("stock_quantity") + 2
+        )
+        total = get_asset_status_at_date(Asset.objects.get(pk=self.tent.pk))["total"]
+        self.assertEqual(
+            audit_stock(),
+            [
+                {
+                    "asset": self.tent.pk,
+                    "name": "Article 0",
+                    "stock_quantity": 4,
+                    "expected": 2,
+                    "difference": 2,
+                }
+            ],
+        )
+
+        self.assertEqual(len(correct_stock(user=self.user)), 1)
+        tent = Asset.objects.get(pk=self.tent.pk)
+        self.assertEqual(tent.stock_quantity, 2)
+        event = StockEvent.objects.get(asset=tent)
+        self.assertEqual(event.event_type, "INVENTORY_ADJUSTMENT")
+        self.assertEqual(event.quantity, 2)
+        self.assertEqual(event.user, self.user)
+        self.assertEqual(get_asset_status_at_date(tent)["total"], total)
+        self.assertEqual(audit_stock(), [])
+
+    def test_audit_queries_do_not_grow_with_assets(self):
+        for i in range(20):
+            create_reservation(self.customer, {self.tent: 1, self.table: 1})
+        create_assets(*range(50))
+        with self.assertNumQueries(1):
+            self.assertEqual(audit_stock(), [])
+
+    def test_asset_without_baseline_reported(self):
+        reservation, items = self.move()
+        StockBaseline.objects.filter(asset=self.tent).delete()
+        missing = {
+            "asset": self.tent.pk,
+            "name": "Article 0",
+            "stock_quantity": 2,
+            "expected": None,
+            "difference": None,
+        }
+        self.assertEqual(audit_stock(), [missing])
+        self.assertEqual(correct_stock(user=self.user), [])
+        self.assertFalse(StockEvent.objects.exists())
+
+        out = StringIO()
+        call_command("audit_stock", stdout=out)
+        self.assertIn(
+            "Article 0 (#%s): stock 2, no reference" % self.tent.pk, out.getvalue()
+        )
+        self.assertIn("1 assets have no reference quantity", out.getvalue())
+        self.assertEqual(audit_stock(), [missing])
+
+        out = StringIO()
+        call_command("audit_stock", "--init-baseline", stdout=out)
+        self.assertIn("1 reference quantities recorded", out.getvalue())
+        self.assertEqual(StockBaseline.objects.get(asset=self.tent).quantity, 5)
+        stock.return_reservation(
+            reservation.pk,
+            {items[self.tent.pk]: (3, 0, 0), items[self.table.pk]: (4, 0, 0)},
+            self.user,
+        )
+        self.assertEqual(audit_stock(), [])
+
+    def test_command_and_view(self):
+        Asset.objects.filter(pk=self.table.pk).update(stock_quantity=7)
+        out = StringIO()
+        call_command("audit_stock", stdout=out)
+        self.assertIn("Article 1", out.getvalue())
+        self.assertIn("(-3)", out.getvalue())
+
+        admin = create_manager("admin")
+        admin.profile.user_type = "admin"
+        admin.profile.save()
+        self.client.force_login(admin)
+        response = self.client.get(reverse("ui:stock_audit"))
+        self.assertContains(response, "Article 1")
+        response = self.client.post(reverse("ui:stock_audit"))
+        self.assertRedirects(response, reverse("ui:stock_audit"))
+        self.assertEqual(Asset.objects.get(pk=self.table.pk).stock_quantity, 10)
+        self.assertEqual(StockEvent.objects.get().quantity, -3)
+
+        out = StringIO()
+        call_command("audit_stock", "--fix", stdout=out)
+        self.assertIn("0 discrepancies corrected", out.getvalue())
+
+
+class StockEventCompactionTests(TestCase):
+    """
+    Tests of the compaction of the old stock events.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        cls.customer = create_customers(1)[0]
+        cls.tent, cls.table, cls.chair = create_assets(5, 10, 3)
+        now = timezone.now()
+        cls.horizon = now - datetime.timedelta(days=365)
+        history = [
+            (cls.tent, "ISSUE", 2, 900),
+            (cls.tent, "REPAIR", 2, 850),
+            (cls.tent, "ACQUISITION", 4, 800),
+            (cls.tent, "SALE", 1, 700),
+            (cls.tent, "ISSUE", 1, 600),
+            (cls.tent, "DESTRUCTION", 1, 100),
+            (cls.table, "ISSUE", 3, 800),
+            (cls.table, "REPAIR", 1, 700),
+            (cls.table, "REPAIR", 2, 500),
+            (cls.table, "ISSUE", 1, 30),
+            (cls.chair, "ACQUISITION", 2, 400),
+        ]
+        StockEvent.objects.bulk_create(
+            [
+                StockEvent(
+                    asset=asset,
+                    event_type=event_type,
+                    quantity=quantity,
+                    date=now - datetime.timedelta(days=days),
+                    user=cls.user,
+                )
+                for asset, event_type, quantity, days in history
+            ]
+        )
+        create_reservation(cls.customer, {cls.tent: 2, cls.table: 3})
+
+    def statuses(self):
+        assets = Asset.objects.order_by("pk")
+        dates = [self.horizon + datetime.timedelta(days=days) for days in (0, 300, 400)]
+        period = Period(self.horizon, timezone.now() + datetime.timedelta(days=10))
+        return [
+            [get_asset_status_at_date(asset, date) for date in dates]
+            + [analyze_asset_availability(asset, period)]
+            for asset in assets
+        ]
+
+    def test_compaction_keeps_statuses_after_horizon(self):
+        statuses = self.statuses()
+        self.assertEqual(compact_stock_events(self.horizon), (8, 2))
+
+        self.assertEqual(self.statuses(), statuses)
+        self.assertEqual(StockEventArchive.objects.count(), 8)
+        self.assertEqual(
+            sorted(
+                StockEvent.objects.filter(date__lt=self.horizon).values_list(
+                    "asset__name", "event_type", "quantity"
+                )
+            ),
+            [
+                ("Article 0", "INVENTORY_ADJUSTMENT", 3),
+                ("Article 0", "ISSUE", 1),
+                ("Article 2", "ACQUISITION", 2),
+            ],
+        )
+        # Nothing left to compact
+        self.assertEqual(compact_stock_events(self.horizon), (0, 0))
+
+    def test_item_detail_reads_archive_on_demand(self):
+        compact_stock_events(self.horizon)
+        self.client.force_login(self.user)
+        url = reverse("ui:item_detail", args=[self.tent.pk])
+        params = {
+            "start_date": (self.horizon - datetime.timedelta(days=1000)).strftime(
+                "%Y-%m-%dT%H:%M"
+            )
+        }
+        response = self.client.get(url, params)
+        self.assertEqual(len(response.context["stock_events"]), 3)
+        response = self.client.get(url, {**params, "archive": "1"})
+        events = response.context["stock_events"]
+        self.assertEqual(len(events), 8)
+        self.assertEqual(
+            [event.date for event in events],
+            sorted((event.date for event in events), reverse=True),
+        )
+
+    def test_command(self):
+        out = StringIO()
+        call_command("compact_stock_events", "--retention-days", "365", stdout=out)
+        self.assertIn("8 events", out.getvalue())
+        self.assertIn("2 assets compacted", out.getvalue())
+
+
+class ReservationArchiveTests(TestCase):
+    """
+    Tests of the archiving of the closed reservations.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        cls.customer = create_customers(1)[0]
+        cls.tent, cls.table = create_assets(5, 10)
+        long_ago = timezone.now() - datetime.timedelta(days=1000)
+
+        cls.old = create_reservation(cls.customer, {cls.tent: 3, cls.table: 2})
+        items = {item.asset_id: item.pk for item in cls.old.items.all()}
+        stock.checkout_reservation(
+            cls.old.pk, {items[cls.tent.pk]: 3, items[cls.table.pk]: 2}, cls.user
+        )
+        stock.return_reservation(
+            cls.old.pk,
+            {items[cls.tent.pk]: (2, 0, 1), items[cls.table.pk]: (2, 0, 0)},
+            cls.user,
+            date=long_ago,
+        )
+        cls.cancelled = create_reservation(
+            cls.customer, {cls.tent: 1}, status="cancelled"
+        )
+        Reservation.objects.filter(pk=cls.cancelled.pk).update(return_date=long_ago)
+        cls.recent = create_reservation(cls.customer, {cls.tent: 1}, status="returned")
+        cls.active = create_reservation(cls.customer, {cls.table: 4})
+        cls.donation = Donation.objects.create(
+            customer=cls.customer, amount=5, reservation=cls.old
+        )
+
+    def test_archive_moves_closed_reservations(self):
+        old = Reservation.objects.get(pk=self.old.pk)
+        statuses = [
+            get_asset_status_at_date(asset) for asset in Asset.objects.order_by("pk")
+        ]
+        with self.assertNumQueries(15):
+            self.assertEqual(archive_reservations(archive_cutoff(12)), 2)
+
+        self.assertEqual(
+            set(Reservation.objects.values_list("pk", flat=True)),
+            {self.recent.pk, self.active.pk},
+        )
+        archived = ReservationArchive.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.created_at, old.created_at)
+        self.assertEqual(archived.returned_by, self.user)
+        self.assertEqual(
+            sorted(archived.items.values_list("quantity_returned", flat=True)), [2, 2]
+        )
+        self.assertEqual(ReservationItemArchive.objects.count(), 3)
+        self.assertEqual(ReservationItem.objects.count(), 2)
+        donation = Donation.objects.get(pk=self.donation.pk)
+        self.assertIsNone(donation.reservation)
+        self.assertEqual(donation.linked_reservation, archived)
+        self.assertEqual(archived.total_donations, 5)
+
+        self.assertEqual(
+            [get_asset_status_at_date(asset) for asset in Asset.objects.order_by("pk")],
+            statuses,
+        )
+        self.assertEqual(audit_stock(), [])
+        self.assertEqual(archive_reservations(archive_cutoff(12)), 0)
+
+    def test_archived_reservations_stay_readable(self):
+        archive_reservations(archive_cutoff(12))
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("ui:reservation_detail", args=[self.old.pk]))
+        self.assertContains(response, "Réservation archivée")
+        self.assertEqual(len(response.context["items"]), 2)
+        response = self.client.get(
+            reverse("ui:customer_detail", args=[self.customer.pk])
+        )
+        self.assertEqual(response.context["total_reservations"], 4)
+        response = self.client.get(reverse("ui:donation_list"))
+        self.assertContains(
+            response, reverse("ui:reservation_detail", args=[self.old.pk])
+        )
+
+    def test_command(self):
+        out = StringIO()
+        call_command("archive_reservations", "--months", "12", stdout=out)
+        self.assertIn("2 reservations closed before", out.getvalue())
+
+
+@skipUnless(connection.vendor == "postgresql", "Partitioning is PostgreSQL specific")
+class StockEventPartitioningTests(TestCase):
+    """
+    Tests of the yearly partitions of the stock events.
+    """
+
+    TABLE = StockEvent._meta.db_table
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tent = create_assets(5)[0]
+        cls.year = timezone.now().year
+        create_year_partition(connection, cls.TABLE, "date", cls.year - 1)
+        StockEvent.objects.bulk_create(
+            [
+                StockEvent(
+                    asset=cls.tent,
+                    event_type="ACQUISITION",
+                    quantity=1,
+                    date=datetime.datetime(year, 6, 1, tzinfo=datetime.timezone.utc),
+                )
+                for year in (cls.year - 1, cls.year)
+            ]
+        )
+
+    def scanned_partitions(self, queryset):
+        plan = queryset.explain()
+        return {
+            year
+            for year in range(self.year - 1, self.year + 2)
+            if partition_name(self.TABLE, year) in plan
+        }
+
+    def test_partitioned(self):
+        self.assertTrue(is_partitioned(connection, self.TABLE))
+        self.assertLessEqual(
+            {self.year, self.year + 1}, partition_years(connection, self.TABLE)
+        )
+
+    def test_date_bounded_scans_are_pruned(self):
+        start = datetime.datetime(self.year, 1, 1, tzinfo=datetime.timezone.utc)
+        self.assertEqual(
+            self.scanned_partitions(
+                StockEvent.objects.filter(
+                    asset=self.tent, date__gte=start, date__lte=timezone.now()
+                )
+            ),
+            {self.year},
+        )
+        self.assertEqual(
+            self.scanned_partitions(
+                StockEvent.objects.filter(
+                    asset=self.tent, date__lte=start - datetime.timedelta(days=1)
+                )
+            ),
+            {self.year - 1},
+        )
+        status = get_asset_status_at_date(self.tent, start)
+        self.assertEqual(status["total"], 6)
+
+    def test_command(self):
+        later = self.year + 5
+        StockEvent.objects.create(
+            asset=self.tent,
+            event_type="ACQUISITION",
+            quantity=1,
+            date=datetime.datetime(later, 3, 1, tzinfo=datetime.timezone.utc),
+        )
+        self.assertNotIn(later, partition_years(connection, self.TABLE))
+        out = StringIO()
+        call_command("create_stock_event_partitions", "--years", "2", stdout=out)
+        self.assertIn(
+            f"{partition_name(self.TABLE, later)} created, 1 events moved",
+            out.getvalue(),
+        )
+        self.assertLessEqual(
+            {self.year + 2, later}, partition_years(connection, self.TABLE)
+        )
+        self.assertEqual(StockEvent.objects.filter(asset=self.tent).count(), 3)
+
+        out = StringIO()
+        call_command("create_stock_event_partitions", "--years", "2", stdout=out)
+        self.assertIn("0 partition(s) created", out.getvalue())
+
+
+class DeskTests(TestCase):
+    """
+    Tests of the checkout and return of many reservations at once.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        cls.customer = create_customers(1)[0]
+        cls.tent, cls.table = create_assets(5, 10)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.reservations = [
+            create_reservation(self.customer, {self.tent: 2, self.table: 3})
+            for _ in range(3)
+        ]
+        self.day = timezone.localtime(self.reservations[0].checkout_date).date()
+
+    def stock(self):
+        return dict(Asset.objects.values_list("pk", "stock_quantity"))
+
+    def test_checkout_reservations(self):
+        quantities = {
+            reservation.pk: {item.pk: 2 for item in reservation.items.all()}
+            for reservation in self.reservations
+        }
+        with CaptureQueriesContext(connection) as queries:
+            results = stock.checkout_reservations(quantities, self.user)
+        self.assertEqual(
+            [bool(results[reservation.pk]) for reservation in self.reservations],
+            [False, False, True],
+        )
+        self.assertIn("Article 0 (disponible: 1)", results[self.reservations[2].pk][0])
+        # One UPDATE per table, whatever the number of reservations
+        self.assertEqual(sum(q["sql"].startswith("UPDATE") for q in queries), 3)
+        self.assertEqual(self.stock(), {self.tent.pk: 1, self.table.pk: 6})
+        self.assertEqual(
+            list(Reservation.objects.order_by("pk").values_list("status", flat=True)),
+            ["checked_out", "checked_out", "validated"],
+        )
+
+    def test_desk_view(self):
+        url = reverse("ui:reservation_desk")
+        response = self.client.get(url, {"mode": "checkout", "date": self.day})
+        self.assertEqual(len(response.context["reservations"]), 3)
+
+        first, second, third = self.reservations
+        response = self.client.post(
+            url,
+            {
+                "mode": "checkout",
+                "date": self.day,
+                "reservations": [first.pk, second.pk, third.pk],
+                "actual_date": "2030-01-02 08:30",
+                f"checkout_{third.items.get(asset=self.tent).pk}": 1,
+            },
+        )
+        self.assertEqual(
+            [bool(errors) for _, errors in response.context["results"]],
+            [False, False, False],
+        )
+        self.assertEqual(self.stock(), {self.tent.pk: 0, self.table.pk: 1})
+        self.assertEqual(len(response.context["reservations"]), 0)
+        first.refresh_from_db()
+        self.assertEqual(
+            timezone.localtime(first.actual_checkout_date).strftime("%Y-%m-%d %H:%M"),
+            "2030-01-02 08:30",
+        )
+
+        return_day = timezone.localtime(first.return_date).date()
+        response = self.client.post(
+            url,
+            {
+                "mode": "return",
+                "date": return_day,
+                "reservations": [first.pk, second.pk],
+                f"damaged_{first.items.get(asset=self.table).pk}": 1,
+            },
+        )
+        self.assertContains(response, "Quantités invalides pour Article 1")
+        self.assertEqual(
+            [bool(errors) for _, errors in response.context["results"]],
+            [True, False],
+        )
+        self.assertEqual(self.stock(), {self.tent.pk: 2, self.table.pk: 4})
+
+
+class ScanTests(TestCase):
+    """
+    Tests of the desk scan of the reservation QR codes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        cls.customer = create_customers(1)[0]
+        cls.tent, cls.table = create_assets(5, 10)
+        cls.reservation = create_reservation(cls.customer, {cls.tent: 2, cls.table: 3})
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_token(self):
+        token = scan.make_token(self.reservation.pk)
+        self.assertLess(len(token), 20)
+        self.assertEqual(scan.read_token(token), self.reservation.pk)
+        other = scan.make_token(self.reservation.pk + 1)
+        self.assertIsNone(
+            scan.read_token(token.split(".")[0] + "." + other.split(".")[1])
+        )
+        self.assertIsNone(scan.read_token(str(self.reservation.pk)))
+        self.assertIsNone(scan.read_token("!.abc"))
+
+    def test_scan_reservation_one_query(self):
+        with self.assertNumQueries(1):
+            state = scan.scan_reservation(self.reservation.pk)
+        self.assertEqual(state["status"], "validated")
+        self.assertEqual(state["next_action"], "checkout")
+        self.assertEqual(
+            [(item["asset"], item["reserved"]) for item in state["items"]],
+            [("Article 0", 2), ("Article 1", 3)],
+        )
+        self.assertIsNone(scan.scan_reservation(self.reservation.pk + 100))
+
+    @override_settings(QUERY_PROFILER_ENABLED=True, QUERY_BUDGET_STRICT=True)
+    def test_scan_view(self):
+        stock.checkout_reservation(
+            self.reservation.pk,
+            {item.pk: item.quantity_reserved for item in self.reservation.items.all()},
+            self.user,
+        )
+        url = reverse(
+            "ui:reservation_scan", args=[scan.make_token(self.reservation.pk)]
+        )
+        response = self.client.get(url, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.json()["status"], "checked_out")
+        self.assertEqual(
+            response.json()["next_action_url"],
+            reverse("ui:reservation_return", args=[self.reservation.pk]),
+        )
+        self.assertEqual(
+            [item["checked_out"] for item in response.json()["items"]], [2, 3]
+        )
+        response = self.client.get(url)
+        self.assertContains(response, "Enregistrer le retour")
+
+        url = reverse("ui:reservation_scan", args=[f"{self.reservation.pk}.forged"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class IdempotencyTests(TestCase):
+    """
+    Tests of the replay of the repeated submits.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        cls.customer = create_customers(1)[0]
+        (cls.tent,) = create_assets(5)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def donate(self, key, **extra):
+        return self.client.post(
+            reverse("ui:donation_create"),
+            {
+                "customer": self.customer.pk,
+                "amount": "10",
+                idempotency.FIELD: key,
+            },
+            **extra,
+        )
+
+    def test_form_key(self):
+        response = self.client.get(reverse("ui:donation_create"))
+        key = response.wsgi_request.idempotency_key
+        self.assertContains(response, f'name="idempotency_key" value="{key}"')
+
+    def test_repeated_submit_replayed(self):
+        first = self.donate("key-00000001")
+        second = self.donate("key-00000001")
+        self.assertEqual(Donation.objects.count(), 1)
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second["Location"], first["Location"])
+        self.assertEqual(second[idempotency.REPLAY_HEADER], "true")
+
+        self.donate("key-00000002")
+        self.assertEqual(Donation.objects.count(), 2)
+        # Without a key, every submit runs
+        self.donate("")
+        self.assertEqual(Donation.objects.count(), 3)
+
+    def test_replay_keeps_cookies_and_messages(self):
+        first = self.donate("key-00000003")
+        # The repeated submit is sent before the first response is received
+        del self.client.cookies["messages"]
+        second = self.donate("key-00000003")
+        self.assertEqual(Donation.objects.count(), 1)
+        self.assertEqual(second[idempotency.REPLAY_HEADER], "true")
+        self.assertEqual(
+            second.cookies["messages"].value, first.cookies["messages"].value
+        )
+        self.assertContains(self.client.get(second["Location"]), "Don créé avec succès")
+
+        record = IdempotencyKey.objects.get(key="key-00000003")
+        record.cookies = "theme=dark; Max-Age=60; Path=/"
+        record.save(update_fields=["cookies"])
+        third = self.donate("key-00000003")
+        self.assertEqual(third.cookies["theme"].value, "dark")
+        self.assertEqual(third.cookies["theme"]["max-age"], "60")
+
+    def test_checkout_replayed(self):
+        reservation = create_reservation(self.customer, {self.tent: 2})
+        url = reverse("ui:reservation_checkout", args=[reservation.pk])
+        data = {
+            f"checkout_{reservation.items.get().pk}": 2,
+            idempotency.FIELD: "checkout-key",
+        }
+        first = self.client.post(url, data)
+        second = self.client.post(url, data)
+        self.assertEqual(second["Location"], first["Location"])
+        self.assertEqual(Asset.objects.get().stock_quantity, 3)
+
+        # The key of another request is refused
+        response = self.client.post(
+            reverse("ui:donation_create"), {idempotency.FIELD: "checkout-key"}
+        )
+        self.assertEqual(response.status_code, 422)
+
+    def test_expired_key(self):
+        self.donate("key-00000001")
+        with override_settings(IDEMPOTENCY_KEY_TTL=-1):
+            response = self.donate("key-00000001")
+        self.assertNotIn(idempotency.REPLAY_HEADER, response)
+        self.assertEqual(Donation.objects.count(), 2)
+
+    def test_failed_view_not_recorded(self):
+        with mock.patch(
+            "ui.donation.views.DonationForm.save", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.donate("key-00000001")
+        self.donate("key-00000001")
+        self.assertEqual(Donation.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == "postgresql", "Row locks are PostgreSQL specific")
+class ConcurrentIdempotencyTests(TransactionTestCase):
+    """
+    Duplicate submits sent while the first one runs.
+    """
+
+    def test_duplicate_waits_for_first(self):
+        user = create_manager()
+        customer = create_customers(1)[0]
+        save = DonationForm.save
+        started = threading.Event()
+
+        def slow_save(form, *args, **kwargs):
+            started.set()
+            time.sleep(0.3)
+            return save(form, *args, **kwargs)
+
+        responses = []
+
+        def donate():
+            client = Client()
+            client.force_login(user)
+            responses.append(
+                client.post(
+                    reverse("ui:donation_create"),
+                    {
+                        "customer": customer.pk,
+                        "amount": "10",
+                        idempotency.FIELD: "double-click",
+                    },
+                )
+            )
+            connection.close()
+
+        with mock.patch.object(DonationForm, "save", slow_save):
+            first = threading.Thread(target=donate)
+            first.start()
+            started.wait(timeout=5)
+            second = threading.Thread(target=donate)
+            second.start()
+            first.join()
+            second.join()
+
+        self.assertEqual(Donation.objects.count(), 1)
+        self.assertEqual([response.status_code for response in responses], [302, 302])
+        self.assertEqual(
+            [idempotency.REPLAY_HEADER in response for response in responses],
+            [False, True],
+        )
+
+
+class OverbookingTests(TestCase):
+    """
+    Tests of the availability check made while saving the reservations.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        cls.customer = create_customers(1)[0]
+        (cls.tent,) = create_assets(5)
+        cls.booked = create_reservation(cls.customer, {cls.tent: 3})
+
+    def post_reservation(self, quantity, url=None, days=(1, 3), item_id=""):
+        start = timezone.now() + datetime.timedelta(days=days[0])
+        end = timezone.now() + datetime.timedelta(days=days[1])
+        return self.client.post(
+            url or reverse("ui:reservation_create"),
+            {
+                "customer": self.customer.pk,
+                "checkout_date": start.strftime("%Y-%m-%d %H:%M"),
+                "return_date": end.strftime("%Y-%m-%d %H:%M"),
+                "notes": "",
+                "items-TOTAL_FORMS": 1,
+                "items-INITIAL_FORMS": 1 if item_id else 0,
+                "items-0-id": item_id,
+                "items-0-asset": self.tent.pk,
+                "items-0-quantity_reserved": quantity,
+            },
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_create_rejected(self):
+        response = self.post_reservation(3)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Article 0 (disponible: 2)")
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertEqual(ReservationItem.objects.count(), 1)
+
+        response = self.post_reservation(2)
+        self.assertEqual(response.status_code, 302)
+        response = self.post_reservation(3, days=(10, 12))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Reservation.objects.count(), 3)
+
+    def test_update_rejected(self):
+        item = self.booked.items.get()
+        url = reverse("ui:reservation_update", args=[self.booked.pk])
+        self.assertEqual(
+            self.post_reservation(5, url, item_id=item.pk).status_code, 302
+        )
+        create_reservation(self.customer, {self.tent: 1}, status="created")
+
+        response = self.post_reservation(5, url, item_id=item.pk)
+        self.assertContains(response, "Article 0 (disponible: 4)")
+        item.refresh_from_db()
+        self.assertEqual(item.quantity_reserved, 5)
+
+    @override_settings(RESERVATION_OVERBOOKING="flag")
+    def test_create_flagged(self):
+        response = self.post_reservation(3)
+        self.assertEqual(response.status_code, 302)
+        response = self.client.get(response.url)
+        self.assertContains(response, "Article 0 (disponible: 2)")
+        self.assertEqual(Reservation.objects.count(), 2)
+
+    def test_commit_reservation(self):
+        def save():
+            return create_reservation(self.customer, {self.tent: 4})
+
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertRaises(booking.OverbookingError) as error:
+                booking.commit_reservation(save)
+        self.assertEqual(
+            error.exception.problematic_items,
+            {"Article 0": {"reserved_quantity": 4, "available_quantity": 2}},
+        )
+        if connection.vendor == "postgresql":
+            self.assertEqual(
+                sum("pg_advisory_xact_lock" in query["sql"] for query in queries), 1
+            )
+        self.assertEqual(Reservation.objects.count(), 1)
+
+        reservation, overbooked = booking.commit_reservation(save, reject=False)
+        self.assertEqual(list(overbooked), ["Article 0"])
+        self.assertTrue(Reservation.objects.filter(pk=reservation.pk).exists())
+
+
+@skipUnless(connection.vendor == "postgresql", "Advisory locks are PostgreSQL specific")
+class ConcurrentBookingTests(TransactionTestCase):
+    """
+    Concurrent reservations of the last units of an asset.
+    """
+
+    def test_one_booking_wins(self):
+        customer = create_customers(1)[0]
+        tent, table = create_assets(5, 5)
+        barrier = threading.Barrier(2)
+        results = []
+
+        def book(asset):
+            def save():
+                reservation = create_reservation(customer, {asset: 3})
+                # Both reservations are written before either is checked
+                barrier.wait(timeout=5)
+                return reservation
+
+            try:
+                booking.commit_reservation(save)
+                results.append(True)
+            except booking.OverbookingError:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=[tent]) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False, True])
+        self.assertEqual(ReservationItem.objects.filter(asset=tent).count(), 1)
+
+    def test_unrelated_assets_not_serialized(self):
+        customer = create_customers(1)[0]
+        tent, table = create_assets(5, 5)
+
+        def book(asset):
+            booking.commit_reservation(lambda: create_reservation(customer, {asset: 1}))
+            connection.close()
+
+        with transaction.atomic():
+            booking.lock_assets_bookings([tent.pk])
+            other_asset = threading.Thread(target=book, args=[table])
+            same_asset = threading.Thread(target=book, args=[tent])
+            other_asset.start()
+            same_asset.start()
+            other_asset.join(timeout=5)
+            same_asset.join(timeout=0.5)
+            self.assertFalse(other_asset.is_alive())
+            self.assertTrue(same_asset.is_alive())
+        same_asset.join(timeout=5)
+        self.assertFalse(same_asset.is_alive())
+        self.assertEqual(Reservation.objects.count(), 2)
+
+
+class ReservationPdfTests(TestCase):
+    """
+    Tests of the cached, background rendered reservation PDFs.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        seed_synthetic_data(reservations=5)
+        cls.reservation = Reservation.objects.filter(status="validated").first()
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        settings_override = override_settings(PDF_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.cache_dir = Path(cache_dir.name)
+        self.client.force_login(self.user)
+        self.url = reverse("ui:reservation_pdf", args=[self.reservation.pk])
+        self.status_url = reverse(
+            "ui:reservation_pdf_status", args=[self.reservation.pk]
+        )
+
+    def get_pdf(self):
+        with mock.patch(
+            "ui.reservation.pdf.render_summary_pdf", wraps=render_summary_pdf
+        ) as render:
+            response = self.client.get(self.url)
+        return response, render.call_count
+
+    def test_pdf_is_served_from_cache(self):
+        response, renders = self.get_pdf()
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(renders, 1)
+        response, renders = self.get_pdf()
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertIn(
+            f'filename="reservation_{self.reservation.pk}.pdf"',
+            response["Content-Disposition"],
+        )
+        self.assertEqual(renders, 0)
+        self.assertEqual(self.client.get(self.status_url).json()["status"], "ready")
+
+    def test_modified_reservation_is_rendered_again(self):
+        self.get_pdf()
+        item = self.reservation.items.first()
+        item.quantity_reserved += 1
+        item.save()
+        _, renders = self.get_pdf()
+        self.assertEqual(renders, 1)
+        # The outdated PDF is removed
+        self.assertEqual(len(list(self.cache_dir.glob("*.pdf"))), 1)
+
+    def test_render_in_background(self):
+        with mock.patch(
+            "ui.reservation.pdf.submit_in_background", return_value=Future()
+        ) as submit:
+            response = self.client.get(self.url)
+            self.assertTemplateUsed(response, "ui/reservations/pdf_pending.html")
+            # The render is already pending, it is not submitted twice
+            self.client.get(self.url)
+            self.assertEqual(
+                self.client.get(self.status_url).json()["status"], "pending"
+            )
+        self.assertEqual(submit.call_count, 1)
+
+    def test_failed_render_is_reported_and_retried(self):
+        with mock.patch(
+            "ui.reservation.pdf.render_summary_pdf", side_effect=OSError("boom")
+        ):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["status"], "failed")
+        self.assertEqual(self.client.get(self.status_url).json()["status"], "failed")
+        response, renders = self.get_pdf()
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(renders, 1)
+        self.assertEqual(list(self.cache_dir.glob("*.failed")), [])
+
+
+@override_settings(PDF_BATCH_PROCESSES=0)
+class BatchExportTests(TestCase):
+    """
+    Tests of the batch export of reservation summaries and of the pick list.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_manager()
+        customer = create_customers(1)[0]
+        category = Category.objects.create(name="Tentes")
+        cls.tent = Asset.objects.create(
+            name="Barnum",
+            description="",
+            category=category,
+            stock_quantity=10,
+            replacement_value=100,
+            rental_value=10,
+        )
+        cls.table = Asset.objects.create(
+            name="Table",
+            description="",
+            category=category,
+            stock_quantity=10,
+            replacement_value=10,
+            rental_value=1,
+        )
+        day = timezone.make_aware(datetime.datetime(2025, 6, 14, 9))
+        cls.reservations = []
+        for hours, status, quantities in [
+            (0, "validated", {cls.tent: 2, cls.table: 4}),
+            (3, "created", {cls.tent: 1}),
+            (24, "validated", {cls.table: 6}),
+            (0, "cancelled", {cls.tent: 5}),
+        ]:
+            reservation = Reservation.objects.create(
+                customer=customer,
+                status=status,
+                checkout_date=day + datetime.timedelta(hours=hours),
+                return_date=day + datetime.timedelta(days=2),
+            )
+            for asset, quantity in quantities.items():
+                ReservationItem.objects.create(
+                    reservation=reservation, asset=asset, quantity_reserved=quantity
+                )
+            cls.reservations.append(reservation)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse("ui:reservation_batch_export")
+
+    def test_batch_queryset(self):
+        saturday = datetime.date(2025, 6, 14)
+        self.assertEqual(
+            list(batch_queryset(saturday, saturday)), self.reservations[:2]
+        )
+        self.assertEqual(
+            list(batch_queryset(saturday, saturday, [self.reservations[2].pk])),
+            self.reservations[:3],
+        )
+        self.assertEqual(list(batch_queryset(ids=[self.reservations[3].pk])), [])
+
+    def test_pick_list(self):
+        days = pick_list(batch_queryset(ids=[r.pk for r in self.reservations]))
+        self.assertEqual(
+            days,
+            [
+                (
+                    datetime.date(2025, 6, 14),
+                    [
+                        {
+                            "category": "Tentes",
+                            "asset": "Barnum",
+                            "quantity": 3,
+                            "reservations": 2,
+                        },
+                        {
+                            "category": "Tentes",
+                            "asset": "Table",
+                            "quantity": 4,
+                            "reservations": 1,
+                        },
+                    ],
+                ),
+                (
+                    datetime.date(2025, 6, 15),
+                    [
+                        {
+                            "category": "Tentes",
+                            "asset": "Table",
+                            "quantity": 6,
+                            "reservations": 1,
+                        }
+                    ],
+                ),
+            ],
+        )
+
+    def test_export_merged_pdf(self):
+        response = self.client.get(
+            self.url,
+            {"start_date": "2025-06-14", "end_date": "2025-06-15", "output": "pdf"},
+        )
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        merged = PdfReader(BytesIO(b"".join(response.streaming_content)))
+        # Pick list followed by one summary per reservation
+        self.assertEqual(len(merged.pages), 4)
+
+    def test_export_zip(self):
+        pks = ",".join(str(r.pk) for r in self.reservations[:2])
+        response = self.client.get(self.url, {"reservations": pks, "output": "zip"})
+        self.assertEqual(response["Content-Type"], "application/zip")
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(
+            archive.namelist(),
+            [PICK_LIST_FILENAME]
+            + [f"reservation_{r.pk}.pdf" for r in self.reservations[:2]],
+        )
+
+    def test_invalid_selection(self):
+        response = self.client.get(self.url, {"output": "pdf"})
+        self.assertTemplateUsed(response, "ui/reservations/batch_export.html")
+        self.assertTrue(response.context["form"].errors)
+        response = self.client.get(
+            self.url, {"reservations": str(self.reservations[3].pk), "output": "pdf"}
+        )
+        self.assertTemplateUsed(response, "ui/reservations/batch_export.html")
+
+    @override_settings(PDF_BATCH_PROCESSES=2)
+    def test_render_in_process_pool(self):
+        reservations = list(batch_queryset(ids=[r.pk for r in self.reservations[:3]]))
+        with mock.patch.dict("utils.executors._executors", clear=True):
+            documents = list(
+                render_batch(
+                    reservations, lambda pk: f"http://test/{pk}", "http://test/"
+                )
+            )
+            pool = get_pdf_batch_executor()
+            self.addCleanup(pool.shutdown)
+            # The processes of the pool are kept for the next exports
+            self.assertEqual(len(list(render_batch(reservations, str, "/"))), 4)
+            self.assertIs(get_pdf_batch_executor(), pool)
+
+            # A pool whose process died is replaced on the next export
+            with mock.patch.object(pool, "map", side_effect=BrokenProcessPool):
+                with self.assertRaises(BrokenProcessPool):
+                    list(render_batch(reservations, str, "/"))
+            self.assertIsNot(get_pdf_batch_executor(), pool)
+            self.addCleanup(get_pdf_batch_executor().shutdown)
+        self.assertEqual(
+            [name for name, _ in documents],
+            [PICK_LIST_FILENAME] + [f"reservation_{r.pk}.pdf" for r in reservations],
+        )
+        for _, content in documents:
+            self.assertTrue(content.startswith(b"%PDF"))
+
+
+class PdfServiceTests(TestCase):
+    """
+    Tests of the resource caching of the PDF rendering service.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # New paths for each test, the service caches are process wide
+        self.stylesheet = Path(directory.name) / "style.css"
+        self.stylesheet.write_text("body { color: black; }")
+        self.image = Path(directory.name) / "logo.png"
+        self.image.write_bytes(b"logo")
+
+    def render(self, count=1):
+        with mock.patch(
+            "utils.pdf_service.CSS", wraps=pdf_service.CSS
+        ) as css, mock.patch(
+            "utils.pdf_service.FontConfiguration", wraps=pdf_service.FontConfiguration
+        ) as font_config:
+            for _ in range(count):
+                pdf_service.render_document("<p>Test</p>", [self.stylesheet])
+        return css.call_count, font_config.call_count
+
+    def test_resources_loaded_once_per_thread(self):
+        self.assertEqual(self.render(3), (1, 1))
+        self.assertEqual(self.render(), (0, 0))
+        thread = threading.Thread(target=lambda: self.results.append(self.render()))
+        self.results = []
+        thread.start()
+        thread.join()
+        self.assertEqual(self.results, [(1, 1)])
+
+    def test_warm_up(self):
+        pdf_service.warm_up([self.stylesheet], [self.image])
+        self.assertEqual(self.render(), (0, 0))
+        self.image.write_bytes(b"changed")
+        self.assertEqual(
+            pdf_service.image_uri(self.image),
+            f"data:image/png;base64,{base64.b64encode(b'logo').decode()}",
+        )
+
+    @override_settings(PDF_WARM_UP=True, PDF_RENDER_WORKERS=2)
+    def test_pdf_pool_threads_warm_up(self):
+        threads = []
+        with mock.patch.dict("utils.executors._executors", clear=True), mock.patch(
+            "utils.pdf_service.warm_up",
+            side_effect=lambda *args: threads.append(threading.current_thread().name),
+        ):
+            warm_up_pdf_pool()
+            get_pdf_executor().shutdown(wait=True)
+        self.assertEqual(len(set(threads)), 2)
+        self.assertTrue(all(name.startswith("pdf_") for name in threads))
+
+    def test_summary_embeds_logo(self):
+        seed_synthetic_data(reservations=5)
+        reservation = summary_queryset().first()
+        html = summary_html(reservation, "http://localhost/")
+        self.assertIn(pdf_service.image_uri(LOGO_PATH), html)
+
+
+class BootCommandTests(TestCase):
+    """
+    Tests of the boot command run when the container starts.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        static_root = Path(directory.name) / "staticfiles"
+        static_root.mkdir()
+        (static_root / "staticfiles.json").write_text("{}")
+        settings = override_settings(
+            BOOT_STATE_FILE=Path(directory.name) / "boot_state.json",
+            STATIC_ROOT=static_root,
+            LOCALE_PATHS=[],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def boot(self, *args):
+        with mock.patch("ui.management.commands.boot.call_command") as command:
+            call_command("boot", *args, stdout=StringIO(), stderr=StringIO())
+        return [call.args[0] for call in command.call_args_list]
+
+    def test_migrations_only_when_state_changes(self):
+        self.assertEqual(self.boot(), ["migrate"])
+        self.assertEqual(self.boot(), [])
+        with mock.patch(
+            "ui.management.commands.boot.migration_state_hash", return_value="changed"
+        ):
+            self.assertEqual(self.boot(), ["migrate"])
+        self.assertEqual(
+            self.boot("--full"),
+            ["migrate", "compilemessages", "collectstatic"],
+        )
+
+    def test_superuser_created_once(self):
+        with mock.patch.dict(
+            os.environ, {"SUPERUSER_LOGIN": "admin", "SUPERUSER_PASSWORD": "secret"}
+        ):
+            self.boot()
+            self.boot()
+        self.assertEqual(User.objects.filter(is_superuser=True).count(), 1)
+
+
+class LegacyDatabaseTakeoverTests(TransactionTestCase):
+    """
+    Tests of the boot on a database created by the migrations formerly
+    generated at boot: baseline schema, and tables of the Django applications
+    in their final state with only their initial migration recorded.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            BOOT_STATE_FILE=Path(directory.name) / "boot_state.json"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Leave a migrated database to the next tests, even on failure
+        self.addCleanup(call_command, "migrate", verbosity=0)
+
+    def test_legacy_history_taken_over(self):
+        self.assertEqual(take_over_legacy_history(), [])
+        call_command("migrate", "ui", "0001_initial", verbosity=0)
+        recorder = MigrationRecorder(connection)
+        recorder.migration_qs.filter(app__in=LEGACY_MIGRATION_APPS).exclude(
+            name="0001_initial"
+        ).delete()
+
+        output = StringIO()
+        BootCommand(stdout=output).migrate({}, full=False)
+
+        self.assertIn("recorded as applied", output.getvalue())
+        applied = recorder.applied_migrations()
+        self.assertFalse(
+            [
+                key
+                for key in MigrationLoader(connection).graph.nodes
+                if key not in applied
+            ]
+        )
+        self.assertTrue(ContentType.objects.get_for_model(Asset).pk)
+        self.assertEqual(
+            is_partitioned(connection, StockEvent._meta.db_table),
+            connection.vendor == "postgresql",
+        )
+
+
+class MigrationTests(TestCase):
+    """
+    Tests of the checked-in migrations, the online schema change operations
+    and the migration safety check.
+    """
+
+    def test_migrations_match_models(self):
+        call_command("makemigrations", "--check", "--dry-run", stdout=StringIO())
+
+    def test_backfill_in_batches(self):
+        seed_synthetic_data(reservations=30)
+        queryset = Reservation.objects.filter(notes="")
+        count = queryset.count()
+        with CaptureQueriesContext(connection) as queries:
+            updated = backfill(queryset, {"notes": Value("backfilled")}, batch_size=7)
+        self.assertEqual(updated, count)
+        updates = [query for query in queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), -(-count // 7))
+        self.assertFalse(Reservation.objects.filter(notes="").exists())
+
+    def test_backfill_field_only_updates_null_values(self):
+        seed_synthetic_data(reservations=30)
+        validated = set(
+            Reservation.objects.filter(validated_at__isnull=False).values_list(
+                "pk", "validated_at"
+            )
+        )
+        state = MigrationLoader(connection).project_state()
+        operation = BackfillField(
+            "reservation", "validated_at", models.F("created_at"), batch_size=4
+        )
+        operation.database_forwards(
+            "ui", mock.Mock(connection=connection), state, state
+        )
+        for reservation in Reservation.objects.all():
+            if (reservation.pk, reservation.validated_at) not in validated:
+                self.assertEqual(reservation.validated_at, reservation.created_at)
+
+    def test_safety_check_flags_locking_operations(self):
+        seed_synthetic_data(stock_events=50)
+        if connection.vendor == "postgresql":
+            # The estimate may come from an analysis of the emptied table
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE ui_stockevent")
+        loader = MigrationLoader(connection)
+        migration = migrations.Migration("0099_test", "ui")
+        migration.dependencies = [("ui", "0002_performance_indexes")]
+        migration.operations = [
+            migrations.AddIndex(
+                "stockevent",
+                models.Index(fields=["quantity"], name="ui_stockevent_qty_idx"),
+            ),
+            AddIndexConcurrently(
+                "stockevent",
+                models.Index(fields=["event_type"], name="ui_stockevent_type_idx"),
+            ),
+            migrations.AddField(
+                "stockevent", "reference", models.CharField(max_length=20)
+            ),
+            migrations.AddField("stockevent", "comment", models.TextField(null=True)),
+        ]
+        loader.graph.add_node(("ui", "0099_test"), migration)
+        loader.graph.add_dependency(
+            migration, ("ui", "0099_test"), ("ui", "0002_performance_indexes")
+        )
+        found = unsafe_operations([migration], loader, 10)
+        self.assertEqual(
+            [(operation, table) for _, operation, table, _, _ in found],
+            [
+                (migration.operations[0], "ui_stockevent"),
+                (migration.operations[2], "ui_stockevent"),
+            ],
+        )
+        self.assertEqual(unsafe_operations([migration], loader, 1000), [])
+
+    def test_safety_check_command(self):
+        output = StringIO()
+        call_command(
+            "check_migration_safety",
+            "ui.0002",
+            "--large-table-rows",
+            "0",
+            stdout=output,
+        )
+        self.assertIn("1 migration(s) checked", output.getvalue())
+
+
+@skipUnless(
+    connection.vendor == "postgresql", "Concurrent indexes are PostgreSQL specific"
+)
+class ConcurrentIndexTests(TransactionTestCase):
+    """
+    Tests of the concurrent index creation, outside of a transaction.
+    """
+
+    def run_operation(self, operation, backwards=False):
+        loader = MigrationLoader(connection)
+        state = loader.project_state(("ui", "0002_performance_indexes"))
+        new_state = state.clone()
+        operation.state_forwards("ui", new_state)
+        with connection.schema_editor(atomic=False) as editor:
+            if backwards:
+                operation.database_backwards("ui", editor, new_state, state)
+            else:
+                operation.database_forwards("ui", editor, state, new_state)
+
+    def test_create_index_if_missing(self):
+        index = models.Index(fields=["name"], name="ui_category_name_idx")
+        operation = AddIndexConcurrently("category", index)
+        with connection.schema_editor(atomic=False) as editor:
+            self.assertIsNone(index_state(editor, Category, index.name))
+        with self.assertRaises(NotSupportedError), transaction.atomic():
+            self.run_operation(operation)
+
+        self.run_operation(operation)
+        with CaptureQueriesContext(connection) as queries:
+            self.run_operation(operation)
+        self.assertFalse([q for q in queries if "CREATE INDEX" in q["sql"]])
+        with connection.schema_editor(atomic=False) as editor:
+            self.assertEqual(index_state(editor, Category, index.name), "valid")
+
+        self.run_operation(operation, backwards=True)
+        with connection.schema_editor(atomic=False) as editor:
+            self.assertIsNone(index_state(editor, Category, index.name))
+
+
+class NotesMigration(DataMigration):
+    """
+    Data migration of the tests, marking the notes of the reservations.
+    """
+
+    name = "test_notes"
+    fields = ["notes"]
+    batch_size = 7
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.seen = []
+
+    def get_queryset(self):
+        return Reservation.objects.all()
+
+    def migrate_row(self, row):
+        if row.pk == self.fail_at:
+            raise RuntimeError("Interrupted")
+        self.seen.append(row.pk)
+        row.notes = "migrated"
+        return True
+
+
+class DataMigrationTests(TestCase):
+    """
+    Tests of the data migration framework.
+    """
+
+    def setUp(self):
+        seed_synthetic_data(reservations=30)
+        self.pks = list(Reservation.objects.order_by("pk").values_list("pk", flat=True))
+
+    def test_batches_and_checkpoint(self):
+        progress = []
+        with CaptureQueriesContext(connection) as queries:
+            checkpoint = NotesMigration().run(
+                progress=lambda checkpoint, rate: progress.append(checkpoint.processed)
+            )
+        self.assertEqual(progress, list(range(7, 30, 7)) + [30])
+        self.assertEqual(
+            (checkpoint.processed, checkpoint.updated, checkpoint.last_pk),
+            (30, 30, self.pks[-1]),
+        )
+        self.assertIsNotNone(checkpoint.completed_at)
+        updates = [q for q in queries if q["sql"].startswith('UPDATE "ui_reservation"')]
+        self.assertEqual(len(updates), 5)
+        self.assertEqual(Reservation.objects.exclude(notes="migrated").count(), 0)
+        # A completed migration is not run again
+        self.assertEqual(NotesMigration().run().processed, 30)
+
+    def test_interrupted_run_resumes(self):
+        with self.assertRaises(RuntimeError):
+            NotesMigration(fail_at=self.pks[10]).run()
+        checkpoint = DataMigrationCheckpoint.objects.get(name="test_notes")
+        self.assertEqual((checkpoint.last_pk, checkpoint.processed), (self.pks[6], 7))
+        self.assertIsNone(checkpoint.completed_at)
+
+        migration = NotesMigration()
+        checkpoint = migration.run()
+        self.assertEqual(migration.seen, self.pks[7:])
+        self.assertEqual(checkpoint.processed, 30)
+
+    def test_run_data_migrations_command(self):
+        output = StringIO()
+        call_command("run_data_migrations", stdout=output)
+        self.assertIn("customertype: completed", output.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("run_data_migrations", "unknown", stdout=StringIO())
+
+
+@skipUnless(
+    connection.vendor == "postgresql", "The legacy schema only existed on PostgreSQL"
+)
+class CustomerTypeMigrationTests(TransactionTestCase):
+    """
+    Tests of the migration of the legacy customer types, run outside of a
+    transaction as at boot.
+    """
+
+    def test_legacy_types_migrated(self):
+        self.addCleanup(
+            connection.cursor().execute,
+            "ALTER TABLE ui_customer DROP COLUMN IF EXISTS customer_type",
+        )
+        customers = create_customers(8)
+        legacy_types = ["member", "physical", "asso", "unknown"] * 2
+        Customer.objects.update(customer_type=None)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "ALTER TABLE ui_customer ADD COLUMN customer_type varchar(20)"
+            )
+            for customer, legacy_type in zip(customers, legacy_types):
+                cursor.execute(
+                    "UPDATE ui_customer SET customer_type = %s WHERE id = %s",
+                    [legacy_type, customer.pk],
+                )
+
+        migration = CustomerTypeMigration()
+        migration.batch_size = 3
+        checkpoint = migration.run()
+
+        self.assertEqual((checkpoint.processed, checkpoint.updated), (8, 6))
+        codes = {
+            customer.pk: customer.customer_type and customer.customer_type.code
+            for customer in Customer.objects.select_related("customer_type")
+        }
+        self.assertEqual(
+            [codes[customer.pk] for customer in customers],
+            ["MEMBER", "PHYSICAL", "ASSO", None] * 2,
+        )
+        self.assertFalse(legacy_column_exists())
+
+
+class CapabilityTests(TestCase):
+    """
+    Tests of the request scoped capabilities and profile loading.
+    """
+
+    def test_capabilities_cached_per_user_type(self):
+        self.assertIs(capabilities_for("manager"), capabilities_for("manager"))
+        self.assertTrue(capabilities_for("manager")["can_add_reservations"])
+        self.assertFalse(capabilities_for("manager")["can_delete_articles"])
+        self.assertFalse(any(capabilities_for(None).values()))
+        with self.assertRaises(TypeError):
+            capabilities_for("admin")["can_add_articles"] = False
+
+    def test_profile_loaded_with_user(self):
+        self.client.force_login(create_manager())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("ui:reservations"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["capability"]["can_add_reservations"])
+        profile_queries = [
+            query["sql"]
+            for query in queries
+            if 'FROM "accounts_userprofile"' in query["sql"]
+        ]
+        self.assertEqual(profile_queries, [])
+        self.assertTrue(
+            any('JOIN "accounts_userprofile"' in query["sql"] for query in queries)
+        )
+
+    def test_anonymous_capabilities(self):
+        response = self.client.get(reverse("accounts:login"))
+        self.assertFalse(response.context["capability"]["can_view_reservations"])
+
+
+class SessionAndUserCacheTests(TestCase):
+    """
+    Tests of the session configurations and of the per-process user cache.
+    """
+
+    @override_settings(AUTH_USER_CACHE_TTL=60)
+    def test_user_cache(self):
+        user = create_manager()
+        backend = ProfileModelBackend()
+        with self.assertNumQueries(1):
+            first = backend.get_user(user.pk)
+            second = backend.get_user(user.pk)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.profile.user_type, "manager")
+
+        user.profile.user_type = "member"
+        user.profile.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(backend.get_user(user.pk).profile.user_type, "member")
+
+    def test_user_cache_disabled_by_default(self):
+        user = create_manager()
+        with self.assertNumQueries(2):
+            ProfileModelBackend().get_user(user.pk)
+            ProfileModelBackend().get_user(user.pk)
+
+    def test_signed_cookie_sessions(self):
+        create_customers(3)
+        with override_settings(
+            SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies",
+            AUTH_USER_CACHE_TTL=60,
+        ):
+            self.client.force_login(create_manager())
+            url = reverse("ui:search_customers")
+            self.client.get(url, {"q": "Nom"})
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {"q": "Nom"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 3)
+        tables = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("django_session", tables)
+        self.assertNotIn("auth_user", tables)
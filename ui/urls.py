@@ -15,6 +15,9 @@ app_name = "ui"
 urlpatterns = (
     [
         path("health/", views.health_check, name="health_check"),
+        path("health/live/", views.health_check, name="liveness"),
+        path("health/ready/", views.readiness, name="readiness"),
+        path("metrics", views.metrics, name="metrics"),
         path("", views.home, name="home"),  # Page d'accueil
     ]
     + reservation_urls
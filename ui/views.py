@@ -1,17 +1,104 @@
 """
 views.py
 
-defines the views for the UI application, including a health check endpoint.
+defines the views for the UI application, including the health check and
+metrics endpoints.
 """
 
-from django.http import HttpResponse
+import os
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import redirect
 
+from utils import metrics as app_metrics
+from utils.query_profiler import query_budget
+
 
+@query_budget(0)
 def health_check(request):
+    """
+    Liveness: the worker answers, whatever the state of its dependencies.
+    """
     return HttpResponse("OK", status=200)
 
 
+def _timed_check(check):
+    """
+    Run a readiness check.
+    :param check: Function returning an error message, or None when healthy
+    :return: Dict with the result and the latency of the check
+    """
+    start = time.perf_counter()
+    try:
+        error = check()
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    result = {
+        "ok": error is None,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    if error is not None:
+        result["error"] = error
+    return result
+
+
+def _check_database():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+
+
+def _check_cache():
+    key = f"readiness:{os.getpid()}"
+    value = secrets.token_hex(8)
+    cache.set(key, value, 30)
+    if cache.get(key) != value:
+        return "value written to the cache was not read back"
+
+
+@query_budget(1)
+def readiness(request):
+    """
+    Readiness: the database answers within ``READINESS_MAX_DB_LATENCY_MS`` and
+    the cache works.
+    :param request: HTTP request object
+    :return: JSON response with the checks, status 503 when one fails
+    """
+    checks = {
+        "database": _timed_check(_check_database),
+        "cache": _timed_check(_check_cache),
+    }
+    database = checks["database"]
+    if database["ok"] and database["latency_ms"] > settings.READINESS_MAX_DB_LATENCY_MS:
+        database["ok"] = False
+        database["error"] = "database round trip too slow"
+    ready = all(check["ok"] for check in checks.values())
+    return JsonResponse(
+        {"status": "ready" if ready else "unavailable", "checks": checks},
+        status=200 if ready else 503,
+    )
+
+
+@query_budget(0)
+def metrics(request):
+    """
+    Metrics of the application in the Prometheus text format. When
+    ``METRICS_TOKEN`` is set, it must be sent as a bearer token.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and not secrets.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"
+    ):
+        return HttpResponse(status=401)
+    return HttpResponse(app_metrics.render(), content_type=app_metrics.CONTENT_TYPE)
+
+
 def home(request):
     return redirect("ui:reservations")
-    # return render(request, "ui/home.html", {"capability": get_capability(request.user)})
+    # return render(request, "ui/home.html")
@@ -3,17 +3,22 @@ Calculations related to asset status and reservations.
 """
 
 import logging
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 
 from django.db.models import Q
 from django.utils import timezone
 
 from ui.reservation.models import ReservationItem
 from ui.stock.models import StockEvent
+from utils import instrumentation
+from utils.instrumentation import instrumented
 from utils.period import Period
 
 logger = logging.getLogger(__name__)
 
 
+@instrumented
 def get_asset_status_at_date(asset, date=None, excluded_reservation=None):
     """
     Compute amounts of an asset considering the full history
@@ -53,6 +58,7 @@ def get_asset_status_at_date(asset, date=None, excluded_reservation=None):
             damaged_count += event.quantity
         elif event.event_type == "REPAIR":
             damaged_count -= event.quantity
+    instrumentation.add("events", len(stock_events))
 
     # reservation that concerns the asset
     reservations = ReservationItem.objects.filter(asset=asset).exclude(
@@ -66,6 +72,7 @@ def get_asset_status_at_date(asset, date=None, excluded_reservation=None):
         for reservation in reservations
         if reservation.reservation.actual_period().contains(date)
     ]
+    instrumentation.add("reservations", len(reservations))
 
     # for each reservation, determine its status at the given date
     for reservation in reservations:
@@ -84,6 +91,7 @@ def get_asset_status_at_date(asset, date=None, excluded_reservation=None):
     }
 
 
+@instrumented
 def analyze_asset_availability(asset, period: Period, excluded_reservation=None):
     """
     Analyze the availability of an asset over a given period.
@@ -135,6 +143,7 @@ def analyze_asset_availability(asset, period: Period, excluded_reservation=None)
     min_available = float("inf")
 
     critical_dates = sorted(list(critical_dates))
+    instrumentation.add("critical_dates", len(critical_dates))
 
     for date in critical_dates:
         status = get_asset_status_at_date(asset, date, excluded_reservation)
@@ -156,6 +165,7 @@ def analyze_asset_availability(asset, period: Period, excluded_reservation=None)
     }
 
 
+@instrumented
 def check_reservation_availability(reservation):
     """
     Verify the availability of items for a given reservation.
@@ -184,3 +194,220 @@ def check_reservation_availability(reservation):
         "is_ok": len(problematic_items) == 0,
         "problematic_items": problematic_items,
     }
+
+
+def _event_deltas(event_type, quantity):
+    """
+    Effect of a stock event on the total stock and on the damaged count,
+    following the rules of get_asset_status_at_date.
+    :param event_type: Type of the stock event
+    :param quantity: Quantity of the stock event
+    :return: Tuple (total delta, damaged delta)
+    """
+    if event_type in ["SALE", "DESTRUCTION"]:
+        return -quantity, 0
+    if event_type in ["ACQUISITION", "INVENTORY_ADJUSTMENT"]:
+        return quantity, 0
+    if event_type == "ISSUE":
+        return 0, quantity
+    if event_type == "REPAIR":
+        return 0, -quantity
+    return 0, 0
+
+
+class AssetTimeline:
+    """
+    Stock history of one asset, loaded once and queried at any date.
+    Cumulative event sums are precomputed so that the status at a date
+    costs a binary search plus a scan of the active reservations.
+    """
+
+    def __init__(self, asset, events, reservations):
+        """
+        Build the timeline.
+        :param asset: The asset (Asset)
+        :param events: List of (date, total delta, damaged delta) sorted by date
+        :param reservations: List of (Reservation, reserved quantity) of active reservations
+        """
+        self.asset = asset
+        self.event_dates = []
+        self.total_sums = [0]
+        self.damaged_sums = [0]
+        for date, total_delta, damaged_delta in events:
+            self.event_dates.append(date)
+            self.total_sums.append(self.total_sums[-1] + total_delta)
+            self.damaged_sums.append(self.damaged_sums[-1] + damaged_delta)
+        self.reservations = [
+            (reservation, reservation.actual_period(), quantity)
+            for reservation, quantity in reservations
+        ]
+
+    def status_at(self, date, excluded_pk=None):
+        """
+        Compute the status of the asset at a given date.
+        :param date: Date for which to compute the status
+        :param excluded_pk: Primary key of a reservation to ignore (optional)
+        :return: Same dict as get_asset_status_at_date
+        """
+        index = bisect_right(self.event_dates, date)
+        total_stock = self.asset.stock_quantity + self.total_sums[index]
+        damaged_count = self.damaged_sums[index]
+        reserved_count = sum(
+            quantity
+            for reservation, period, quantity in self.reservations
+            if reservation.pk != excluded_pk and period.contains(date)
+        )
+        return {
+            "damaged": damaged_count,
+            "checked_out": 0,
+            "reserved": reserved_count,
+            "available": max(0, total_stock - (damaged_count + reserved_count)),
+            "total": total_stock,
+        }
+
+    def analyze(self, period: Period, excluded_pk=None):
+        """
+        Analyze the availability of the asset over a period.
+        :param period: The period
+        :param excluded_pk: Primary key of a reservation to ignore (optional)
+        :return: Same dict as analyze_asset_availability
+        """
+        critical_dates = {period.start_date, period.end_date}
+        start = bisect_left(self.event_dates, period.start_date)
+        end = bisect_right(self.event_dates, period.end_date)
+        critical_dates.update(self.event_dates[start:end])
+        for reservation, reservation_period, _ in self.reservations:
+            if reservation.pk == excluded_pk or not period.overlaps(reservation_period):
+                continue
+            if period.contains(reservation.true_start_date):
+                critical_dates.add(reservation.true_start_date)
+            if period.contains(reservation.true_return_date):
+                critical_dates.add(reservation.true_return_date)
+
+        instrumentation.add("critical_dates", len(critical_dates))
+        statuses = [self.status_at(date, excluded_pk) for date in critical_dates]
+        return {
+            "total": min(status["total"] for status in statuses),
+            "damaged": max(0, max(status["damaged"] for status in statuses)),
+            "reserved": max(0, max(status["reserved"] for status in statuses)),
+            "available": min(status["available"] for status in statuses),
+        }
+
+
+@instrumented
+def load_asset_timelines(assets, until, excluded_reservation=None):
+    """
+    Load the stock events and active reservations of several assets
+    in two queries, whatever the number of assets.
+    :param assets: The assets (iterable of Asset)
+    :param until: Date of the last stock event to load
+    :param excluded_reservation: Reservation to exclude from calculations (optional)
+    :return: dict of asset pk to AssetTimeline
+    """
+    assets = {asset.pk: asset for asset in assets}
+
+    events = defaultdict(list)
+    for asset_id, date, event_type, quantity in (
+        StockEvent.objects.filter(asset_id__in=assets, date__lte=until)
+        .order_by("date")
+        .values_list("asset_id", "date", "event_type", "quantity")
+    ):
+        events[asset_id].append((date, *_event_deltas(event_type, quantity)))
+
+    items = (
+        ReservationItem.objects.filter(asset_id__in=assets)
+        .exclude(reservation__status__in=["cancelled", "returned"])
+        .select_related("reservation")
+    )
+    if excluded_reservation:
+        items = items.exclude(reservation__pk=excluded_reservation.pk)
+    reservations = defaultdict(list)
+    for item in items:
+        reservations[item.asset_id].append((item.reservation, item.quantity_reserved))
+    instrumentation.add("events", sum(len(group) for group in events.values()))
+    instrumentation.add("reservations", len(items))
+
+    return {
+        pk: AssetTimeline(asset, events[pk], reservations[pk])
+        for pk, asset in assets.items()
+    }
+
+
+@instrumented
+def get_assets_status_at_date(assets, date=None, excluded_reservation=None):
+    """
+    Bulk version of get_asset_status_at_date.
+
+    :param assets: The assets (iterable of Asset)
+    :param date: Date for which to compute the status (defaults to now if None)
+    :param excluded_reservation: Reservation to exclude from calculations (optional)
+
+    :return: dict of asset pk to the status returned by get_asset_status_at_date
+    """
+    if date is None:
+        date = timezone.now()
+    timelines = load_asset_timelines(assets, date, excluded_reservation)
+    return {pk: timeline.status_at(date) for pk, timeline in timelines.items()}
+
+
+@instrumented
+def analyze_assets_availability(assets, period: Period, excluded_reservation=None):
+    """
+    Bulk version of analyze_asset_availability.
+
+    :param assets: The assets (iterable of Asset)
+    :param period: The period
+    :param excluded_reservation: Reservation to exclude from calculations (optional)
+
+    :return: dict of asset pk to the analysis returned by analyze_asset_availability
+    """
+    timelines = load_asset_timelines(assets, period.end_date, excluded_reservation)
+    return {pk: timeline.analyze(period) for pk, timeline in timelines.items()}
+
+
+@instrumented
+def check_reservations_availability(reservations):
+    """
+    Bulk version of check_reservation_availability.
+    The stock history of every reserved asset is loaded once for all the
+    reservations, each reservation being ignored when checking itself.
+
+    :param reservations: The reservations to check (iterable of Reservation)
+
+    :return: dict of reservation pk to the result of check_reservation_availability
+    """
+    reservations = list(reservations)
+    items = defaultdict(list)
+    for item in (
+        ReservationItem.objects.filter(reservation__in=[r.pk for r in reservations])
+        .select_related("asset")
+        .order_by("pk")
+    ):
+        items[item.reservation_id].append(item)
+
+    periods = {
+        reservation.pk: reservation.actual_period() for reservation in reservations
+    }
+    assets = {item.asset_id: item.asset for group in items.values() for item in group}
+    timelines = {}
+    if assets:
+        until = max(period.end_date for period in periods.values())
+        timelines = load_asset_timelines(assets.values(), until)
+
+    results = {}
+    for reservation in reservations:
+        problematic_items = {}
+        for item in items[reservation.pk]:
+            availability = timelines[item.asset_id].analyze(
+                periods[reservation.pk], excluded_pk=reservation.pk
+            )
+            if item.quantity_reserved > availability["available"]:
+                problematic_items[item.asset.name] = {
+                    "reserved_quantity": item.quantity_reserved,
+                    "available_quantity": availability["available"],
+                }
+        results[reservation.pk] = {
+            "is_ok": len(problematic_items) == 0,
+            "problematic_items": problematic_items,
+        }
+    return results
@@ -0,0 +1,109 @@
+"""
+Framework for the data migrations: updates of existing rows too large to run
+in a single transaction.
+
+A data migration walks its queryset in primary key order (keyset pagination,
+so each batch is an index range scan whatever the progress), updates each
+batch with a single bulk_update, and records the last processed key in a
+DataMigrationCheckpoint in the same transaction. An interrupted run resumes
+after the last committed batch, and a completed migration is not run again.
+"""
+
+import logging
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from ui.custom_migrations.models import DataMigrationCheckpoint
+
+logger = logging.getLogger(__name__)
+
+
+class DataMigration:
+    """
+    Base class of the data migrations. Subclasses define the name, the rows
+    to process, the fields to update and how to update a row.
+    """
+
+    name = None
+    fields = []
+    batch_size = 1000
+
+    def get_queryset(self):
+        """
+        Rows to process.
+        :return: QuerySet
+        """
+        raise NotImplementedError
+
+    def before(self):
+        """
+        Prepare the migration, called at the start of every run.
+        """
+
+    def prepare_batch(self, rows):
+        """
+        Load the data needed to migrate a batch of rows.
+        :param rows: List of model instances
+        """
+
+    def migrate_row(self, row):
+        """
+        Update a row in place.
+        :param row: Model instance
+        :return: True when the row changed and must be saved
+        """
+        raise NotImplementedError
+
+    def after(self):
+        """
+        Finish the migration, called once every row has been processed.
+        """
+
+    def run(self, progress=None):
+        """
+        Run the migration, resuming after the last checkpoint.
+        :param progress: Function called after each batch with the checkpoint
+            and the throughput of the run (rows per second)
+        :return: DataMigrationCheckpoint instance
+        """
+        checkpoint, _ = DataMigrationCheckpoint.objects.get_or_create(name=self.name)
+        if checkpoint.completed_at:
+            return checkpoint
+        self.before()
+        queryset = self.get_queryset().order_by("pk")
+        model = queryset.model
+        start = time.perf_counter()
+        processed = 0
+        while True:
+            batch = queryset
+            if checkpoint.last_pk is not None:
+                batch = batch.filter(pk__gt=checkpoint.last_pk)
+            with transaction.atomic():
+                rows = list(batch[: self.batch_size])
+                if not rows:
+                    break
+                self.prepare_batch(rows)
+                changed = [row for row in rows if self.migrate_row(row)]
+                if changed:
+                    model._base_manager.bulk_update(changed, self.fields)
+                checkpoint.last_pk = rows[-1].pk
+                checkpoint.processed += len(rows)
+                checkpoint.updated += len(changed)
+                checkpoint.save()
+            processed += len(rows)
+            rate = processed / max(time.perf_counter() - start, 1e-6)
+            logger.info(
+                "Data migration %s: %s rows processed, %s updated (%.0f rows/s)",
+                self.name,
+                checkpoint.processed,
+                checkpoint.updated,
+                rate,
+            )
+            if progress:
+                progress(checkpoint, rate)
+        self.after()
+        checkpoint.completed_at = timezone.now()
+        checkpoint.save()
+        return checkpoint
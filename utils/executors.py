@@ -0,0 +1,170 @@
+"""
+Bounded pools for the slow work of the views.
+
+* The availability computations of the async views run in a pool of
+  ``AVAILABILITY_EXECUTOR_WORKERS`` threads, so that they neither block the
+  event loop nor compete with the threads serving the synchronous views.
+* The PDF renders run in the background in a pool of ``PDF_RENDER_WORKERS``
+  threads, so that a print burst does not tie up the request threads.
+* The batch exports of PDFs are laid out in a pool of
+  ``PDF_BATCH_PROCESSES`` processes, started by the first export of the web
+  worker and kept for the next ones.
+
+Pool threads have their own database connection: work submitted while the
+connection of the caller is inside a transaction (``ATOMIC_REQUESTS``, tests)
+would not see its uncommitted data, so it runs inline instead. The queries
+run by the availability pool for a request are seen by the observers of the
+request (see utils/query_observers.py).
+"""
+
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from utils import query_observers
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name, max_workers, initializer=None):
+    """
+    Return the thread pool of the given name, creating it on first use.
+    :param name: Name of the pool, also used to name its threads
+    :param max_workers: Number of threads of the pool
+    :param initializer: Function called by each thread of the pool when it
+        starts (optional, only used when the pool is created)
+    :return: ThreadPoolExecutor instance
+    """
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix=name,
+                initializer=initializer,
+            )
+        return _executors[name]
+
+
+def get_process_executor(name, max_workers, initializer=None, initargs=()):
+    """
+    Return the process pool of the given name, creating it on first use.
+    :param name: Name of the pool
+    :param max_workers: Number of processes of the pool
+    :param initializer: Function called by each process of the pool when it
+        starts (optional, only used when the pool is created)
+    :param initargs: Arguments of the initializer
+    :return: ProcessPoolExecutor instance
+    """
+    with _executors_lock:
+        if name not in _executors:
+            _executors[name] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                # Forking a threaded server process is unsafe, start clean
+                # interpreters
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer,
+                initargs=initargs,
+            )
+        return _executors[name]
+
+
+def discard_executor(name):
+    """
+    Shut a pool down without waiting for it, so that the next use creates a
+    new one (e.g. when a process of the pool died).
+    :param name: Name of the pool
+    """
+    with _executors_lock:
+        executor = _executors.pop(name, None)
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_availability_executor():
+    """
+    Return the availability thread pool.
+    :return: ThreadPoolExecutor instance
+    """
+    return get_executor("availability", settings.AVAILABILITY_EXECUTOR_WORKERS)
+
+
+def get_pdf_executor(initializer=None):
+    """
+    Return the PDF rendering thread pool.
+    :param initializer: Function called by each thread of the pool when it
+        starts, loading its rendering resources (optional)
+    :return: ThreadPoolExecutor instance
+    """
+    return get_executor("pdf", settings.PDF_RENDER_WORKERS, initializer)
+
+
+def get_pdf_batch_executor(initializer=None, initargs=()):
+    """
+    Return the process pool of the batch exports of PDFs.
+    :param initializer: Function called by each process of the pool when it
+        starts, loading its rendering resources (optional)
+    :param initargs: Arguments of the initializer
+    :return: ProcessPoolExecutor instance
+    """
+    return get_process_executor(
+        "pdf_batch", settings.PDF_BATCH_PROCESSES, initializer, initargs
+    )
+
+
+def _run_in_worker(func, *args, **kwargs):
+    """
+    Run a function in a pool thread, managing its database connection
+    the same way Django does around a request.
+    """
+    close_old_connections()
+    query_observers.install_all()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def submit_in_background(executor, func, *args, **kwargs):
+    """
+    Run a synchronous function in a pool from synchronous code.
+    The function runs inline when the connection is inside a transaction.
+    :param executor: Pool to run the function in
+    :param func: Function to call
+    :return: Future of the result
+    """
+    if connection.in_atomic_block:
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return executor.submit(_run_in_worker, func, *args, **kwargs)
+
+
+async def run_availability(func, *args, **kwargs):
+    """
+    Run a synchronous availability computation from an async view.
+    The computation runs in the availability pool, or inline on the request
+    thread when the connection of the request is inside a transaction.
+    :param func: Synchronous function to call
+    :return: Result of the function
+    """
+    in_transaction = await sync_to_async(lambda: connection.in_atomic_block)()
+    if in_transaction or settings.AVAILABILITY_EXECUTOR_WORKERS < 1:
+        return await sync_to_async(func)(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    # The context carries the instrumentation of the request to the pool thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_availability_executor(),
+        functools.partial(context.run, _run_in_worker, func, *args, **kwargs),
+    )
@@ -0,0 +1,149 @@
+"""
+Idempotency keys of the state-changing views.
+
+A double click or a retried submit must not check out a reservation twice or
+create a second donation. The forms of the views decorated with
+:func:`idempotent` send a key generated when they were rendered (the
+``idempotency_key`` field, or the ``Idempotency-Key`` header for scripts).
+The first request with a key records it, runs the view and stores its
+response; the next requests of the same user with the same key get the
+stored response without running the view, for ``IDEMPOTENCY_KEY_TTL``
+seconds.
+
+The stored response keeps its cookies and the messages added by the view:
+the messages are only written to their cookie by the middleware, after the
+view, so they are added again to the replayed requests for the redirect to
+show them.
+
+The key is recorded in the transaction running the view, so a duplicate
+sent while the first request runs waits on the unique key until the first
+one commits, then replays its response. When the view fails, the key is
+rolled back with its changes and the request can be retried.
+"""
+
+import datetime
+import functools
+import re
+import uuid
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from ui.idempotency.models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+FIELD = "idempotency_key"
+REPLAY_HEADER = "Idempotent-Replayed"
+
+_KEY_RE = re.compile(r"^[A-Za-z0-9._:-]{8,64}$")
+
+
+def request_key(request):
+    """
+    Idempotency key sent with a request.
+    :param request: HTTP request object
+    :return: Key, or None when there is no valid key
+    """
+    key = request.headers.get(HEADER) or request.POST.get(FIELD, "")
+    return key if _KEY_RE.match(key) else None
+
+
+def _queued_messages(request):
+    """
+    Messages added during a request, not stored yet. The storage is not
+    iterated, iterating it would mark the messages as read.
+    :param request: HTTP request object
+    :return: List of (level, message, extra_tags) tuples
+    """
+    storage = messages.get_messages(request)
+    return [
+        (message.level, str(message.message), message.extra_tags)
+        for message in getattr(storage, "_queued_messages", [])
+    ]
+
+
+def _replay(request, record):
+    """
+    Build the stored response of a key.
+    :param request: HTTP request object repeating the key
+    :param record: IdempotencyKey instance
+    :return: HTTP response
+    """
+    for level, message, extra_tags in record.messages:
+        messages.add_message(
+            request, level, message, extra_tags=extra_tags, fail_silently=True
+        )
+    response = HttpResponse(
+        bytes(record.content),
+        status=record.status_code,
+        content_type=record.content_type or None,
+    )
+    if record.location:
+        response["Location"] = record.location
+    response.cookies.load(record.cookies)
+    response[REPLAY_HEADER] = "true"
+    return response
+
+
+def idempotent(view_func):
+    """
+    Run a view once per idempotency key, returning the response of the first
+    run to the requests repeating the key. Requests without a key run the
+    view as usual. The view gets a new key to render in its forms as
+    ``request.idempotency_key``.
+    """
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        request.idempotency_key = uuid.uuid4().hex
+        key = request_key(request) if request.method == "POST" else None
+        if key is None or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+
+        IdempotencyKey.objects.filter(
+            created_at__lt=timezone.now()
+            - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        ).delete()
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(
+                        user=request.user, key=key, path=request.path
+                    )
+            except IntegrityError:
+                record = None
+            if record is not None:
+                queued = len(_queued_messages(request))
+                response = view_func(request, *args, **kwargs)
+                if response.streaming or response.status_code >= 500:
+                    record.delete()
+                    return response
+                record.status_code = response.status_code
+                record.content_type = response.get("Content-Type", "")
+                record.location = response.get("Location", "")
+                record.content = response.content
+                record.cookies = response.cookies.output(header="", sep="\n")
+                record.messages = _queued_messages(request)[queued:]
+                record.save(
+                    update_fields=[
+                        "status_code",
+                        "content_type",
+                        "location",
+                        "content",
+                        "cookies",
+                        "messages",
+                    ]
+                )
+                return response
+
+        record = IdempotencyKey.objects.get(user=request.user, key=key)
+        if record.path != request.path:
+            return HttpResponse(
+                "Idempotency key already used for another request", status=422
+            )
+        return _replay(request, record)
+
+    return wrapper
@@ -0,0 +1,227 @@
+"""
+Instrumentation of the hot paths of the availability computations.
+
+When ``COMPUTATIONS_INSTRUMENTATION`` is enabled, the functions decorated with
+:func:`instrumented` and the blocks run in :func:`section` record their number
+of calls, their wall time, the SQL queries they run and the items they
+process (stock events, reservations, critical dates), reported with
+:func:`add`. Figures are inclusive: a call also counts the queries and items
+of the instrumented calls it makes. When disabled, the decorator and
+:func:`add` only check the setting.
+
+Independently, the decorator times the calls of the functions for the
+availability duration histogram while the metrics are enabled (``METRICS``),
+from the same measure as the detailed figures when both are enabled.
+
+The figures are aggregated per process in the metrics served on /metrics,
+and per request while :func:`collect` is active, which the query profiler
+middleware does.
+"""
+
+import functools
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+from utils.metrics import (
+    AVAILABILITY_DURATION,
+    COMPUTATION_CALLS,
+    COMPUTATION_ITEMS,
+    COMPUTATION_QUERIES,
+    COMPUTATION_SECONDS,
+)
+
+# Copies of the settings, reading the settings costs more than the disabled hooks
+_enabled = settings.COMPUTATIONS_INSTRUMENTATION
+_timed = settings.METRICS_ENABLED
+# Instrumented calls in progress, innermost last
+_frames = ContextVar("instrumentation_frames", default=())
+# Statistics of the current request
+_collector = ContextVar("instrumentation_collector", default=None)
+
+
+@receiver(setting_changed)
+def _update_enabled(setting, value, **kwargs):
+    global _enabled, _timed
+    if setting == "COMPUTATIONS_INSTRUMENTATION":
+        _enabled = value
+    elif setting == "METRICS_ENABLED":
+        _timed = value
+
+
+class _Frame:
+    """
+    Figures of one instrumented call in progress.
+    """
+
+    __slots__ = ("name", "function", "queries", "items")
+
+    def __init__(self, name, function=False):
+        self.name = name
+        self.function = function
+        self.queries = 0
+        self.items = {}
+
+
+class CallStats:
+    """
+    Aggregated figures of the calls of a function.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.queries = 0
+        self.items = {}
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "time_ms": round(self.time * 1000, 2),
+            "queries": self.queries,
+            **self.items,
+        }
+
+
+class RequestStats:
+    """
+    Figures of the instrumented calls of a request, by function. Calls may
+    be recorded by the threads of the availability pool.
+    """
+
+    def __init__(self):
+        self.functions = {}
+        self._lock = threading.Lock()
+
+    def record(self, frame, duration):
+        """
+        Add a finished call.
+        :param frame: Figures of the call
+        :param duration: Wall time of the call, in seconds
+        """
+        with self._lock:
+            stats = self.functions.setdefault(frame.name, CallStats())
+            stats.calls += 1
+            stats.time += duration
+            stats.queries += frame.queries
+            for item, count in frame.items.items():
+                stats.items[item] = stats.items.get(item, 0) + count
+
+    def __bool__(self):
+        return bool(self.functions)
+
+    def as_dict(self):
+        """
+        :return: Dict of function name to its figures
+        """
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self.functions.items()}
+
+
+def _count_query(execute, sql, params, many, context):
+    for frame in _frames.get():
+        frame.queries += 1
+    return execute(sql, params, many, context)
+
+
+def _record(frame, duration):
+    if frame.function and _timed:
+        AVAILABILITY_DURATION.labels(function=frame.name).observe(duration)
+    COMPUTATION_CALLS.labels(function=frame.name).inc()
+    COMPUTATION_SECONDS.labels(function=frame.name).inc(duration)
+    COMPUTATION_QUERIES.labels(function=frame.name).inc(frame.queries)
+    for item, count in frame.items.items():
+        COMPUTATION_ITEMS.labels(function=frame.name, item=item).inc(count)
+    collector = _collector.get()
+    if collector is not None:
+        collector.record(frame, duration)
+
+
+@contextmanager
+def _section(name, function):
+    frames = _frames.get()
+    frame = _Frame(name, function)
+    token = _frames.set(frames + (frame,))
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            # The outermost call counts the queries for every frame
+            if not frames:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(_count_query))
+            yield
+    finally:
+        duration = time.perf_counter() - start
+        _frames.reset(token)
+        _record(frame, duration)
+
+
+@contextmanager
+def section(name):
+    """
+    Instrument a block of code.
+    :param name: Name under which the block is reported
+    """
+    if not _enabled:
+        yield
+        return
+    with _section(name, function=False):
+        yield
+
+
+def instrumented(func):
+    """
+    Instrument a function, reported under its name, and time its calls in
+    the availability duration histogram.
+    """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _enabled:
+            with _section(name, function=True):
+                return func(*args, **kwargs)
+        if not _timed:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            AVAILABILITY_DURATION.labels(function=name).observe(
+                time.perf_counter() - start
+            )
+
+    return wrapper
+
+
+def add(item, count=1):
+    """
+    Report items processed by the instrumented calls in progress.
+    :param item: Kind of item (e.g. "events", "critical_dates")
+    :param count: Number of items
+    """
+    if not _enabled:
+        return
+    for frame in _frames.get():
+        frame.items[item] = frame.items.get(item, 0) + count
+
+
+@contextmanager
+def collect():
+    """
+    Aggregate the instrumented calls made in the block, including those run
+    by the availability pool on its behalf.
+    :return: RequestStats instance
+    """
+    stats = RequestStats()
+    token = _collector.set(stats)
+    try:
+        yield stats
+    finally:
+        _collector.reset(token)
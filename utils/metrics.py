@@ -0,0 +1,225 @@
+"""
+Prometheus metrics of the application, with ``prometheus_client``.
+
+gunicorn runs several worker processes and a scrape only reaches one of
+them, so the metrics use the multiprocess mode of ``prometheus_client`` when
+``PROMETHEUS_MULTIPROC_DIR`` is set (in the image): every process keeps its
+values in files of this directory, and /metrics aggregates the files of all
+the processes. Counters and histograms of the exited workers are kept, so
+that totals never decrease; the gunicorn ``child_exit`` hook
+(PretLoc/gunicorn.conf.py) removes the gauges of an exited worker. The
+directory must exist before the first metric is created (the entrypoint
+creates it), and the boot command empties it when the container starts, as
+the multiprocess mode requires.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from utils.query_observers import observe_queries
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+REQUEST_DURATION = Histogram(
+    "pretloc_http_request_duration_seconds",
+    "Time spent serving the requests, by URL name.",
+    ["view", "method", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "pretloc_http_request_queries",
+    "Number of SQL queries run by the requests, by URL name.",
+    ["view"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+REQUEST_QUERY_DURATION = Counter(
+    "pretloc_http_request_query_seconds_total",
+    "Time spent in SQL queries by the requests, by URL name.",
+    ["view"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "pretloc_http_requests_in_progress",
+    "Requests being served.",
+    multiprocess_mode="livesum",
+)
+# Observed by the functions decorated with instrumented() (see
+# utils/instrumentation.py)
+AVAILABILITY_DURATION = Histogram(
+    "pretloc_availability_duration_seconds",
+    "Time spent in the availability computations, by function.",
+    ["function"],
+)
+# Detailed figures of the computations, when COMPUTATIONS_INSTRUMENTATION is
+# enabled (see utils/instrumentation.py)
+COMPUTATION_CALLS = Counter(
+    "pretloc_computation_calls_total",
+    "Calls of the instrumented computations, by function.",
+    ["function"],
+)
+COMPUTATION_SECONDS = Counter(
+    "pretloc_computation_seconds_total",
+    "Wall time of the instrumented computations, by function.",
+    ["function"],
+)
+COMPUTATION_QUERIES = Counter(
+    "pretloc_computation_queries_total",
+    "SQL queries run by the instrumented computations, by function.",
+    ["function"],
+)
+COMPUTATION_ITEMS = Counter(
+    "pretloc_computation_items_total",
+    "Items (stock events, reservations, critical dates) processed by the "
+    "instrumented computations, by function and kind of item.",
+    ["function", "item"],
+)
+PDF_RENDER_DURATION = Histogram(
+    "pretloc_pdf_render_duration_seconds",
+    "Time spent rendering the PDF documents, by document.",
+    ["document"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+CACHE_REQUESTS = Counter(
+    "pretloc_cache_requests_total",
+    "Lookups in the caches of the application, by cache and result (hit or miss).",
+    ["cache", "result"],
+)
+
+
+def multiprocess_dir():
+    """
+    Directory of the values of the processes.
+    :return: Path, or None when the processes do not share their metrics
+    """
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    return Path(directory) if directory else None
+
+
+def reset():
+    """
+    Remove the values of the processes of the previous run, called when the
+    container starts.
+    """
+    directory = multiprocess_dir()
+    if directory is None or not directory.exists():
+        return
+    for path in directory.glob("*.db"):
+        path.unlink(missing_ok=True)
+
+
+def render():
+    """
+    Metrics of all the processes in the Prometheus text format.
+    :return: Bytes
+    """
+    directory = multiprocess_dir()
+    if directory is None:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=str(directory))
+    return generate_latest(registry)
+
+
+class _QueryCounter:
+    """
+    Count the SQL queries and their duration, used as a query observer (see
+    utils/query_observers.py).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            # Queries of the availability pool may run at the same time
+            with self._lock:
+                self.count += 1
+                self.time += duration
+
+
+class MetricsMiddleware:
+    """
+    Record the duration and the SQL queries of each request, by URL name.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """
+        Initialize the middleware, disabled unless ``METRICS_ENABLED`` is set.
+        :param get_response: Next handler in the chain
+        """
+        if not getattr(settings, "METRICS_ENABLED", False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        queries = _QueryCounter()
+        start = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            with observe_queries(queries):
+                response = self.get_response(request)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+        return self.record(request, response, queries, start)
+
+    async def __acall__(self, request):
+        queries = _QueryCounter()
+        start = time.perf_counter()
+        REQUESTS_IN_PROGRESS.inc()
+        try:
+            with observe_queries(queries):
+                response = await self.get_response(request)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+        return self.record(request, response, queries, start)
+
+    def record(self, request, response, queries, start):
+        """
+        Record the figures of a request.
+        :param request: HTTP request
+        :param response: HTTP response
+        :param queries: _QueryCounter of the request
+        :param start: perf_counter() value at the start of the request
+        :return: The response
+        """
+        # Unresolved URLs share a label, so that scanners do not create series
+        view = (
+            request.resolver_match.view_name if request.resolver_match else "unresolved"
+        )
+        REQUEST_DURATION.labels(
+            view=view,
+            method=request.method,
+            status=f"{response.status_code // 100}xx",
+        ).observe(time.perf_counter() - start)
+        REQUEST_QUERIES.labels(view=view).observe(queries.count)
+        REQUEST_QUERY_DURATION.labels(view=view).inc(queries.time)
+        return response
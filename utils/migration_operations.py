@@ -0,0 +1,245 @@
+"""
+Migration operations changing the schema of a database in use.
+
+* AddIndexConcurrently builds an index without blocking the writes on
+  PostgreSQL (CREATE INDEX CONCURRENTLY), and skips the indexes which already
+  exist, so that databases whose index was created by an older migration are
+  left untouched. An invalid index left by an interrupted build is rebuilt.
+  Other databases create the index normally. Migrations using it must set
+  ``atomic = False``.
+* BackfillField fills a column in primary key ordered batches, each one in its
+  own transaction, so that rows are only locked for the time of a batch.
+  Adding a column then takes three steps: add it nullable, backfill it, then
+  make it NOT NULL.
+* PartitionByYear replaces a PostgreSQL table by a table partitioned by year
+  of a date column (see utils/partitioning.py). The rows are copied into the
+  new table under an exclusive lock: compact or archive the old rows first.
+  Other databases are left untouched.
+"""
+
+from django.db import NotSupportedError, transaction
+from django.db.migrations.operations import AddIndex
+from django.db.migrations.operations.base import Operation
+
+from utils.partitioning import (
+    is_partitioned,
+    partition_table_by_year,
+    unpartition_table,
+)
+
+
+def index_state(schema_editor, model, name):
+    """
+    State of an index in the database.
+    :param schema_editor: Schema editor of the migration
+    :param model: Model of the indexed table
+    :param name: Name of the index
+    :return: None when missing, "valid" or "invalid"
+    """
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+                [name],
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return "valid" if row[0] else "invalid"
+        constraints = connection.introspection.get_constraints(
+            cursor, model._meta.db_table
+        )
+    return "valid" if name in constraints else None
+
+
+class AddIndexConcurrently(AddIndex):
+    """
+    Create an index without locking the table, unless it already exists.
+    """
+
+    def describe(self):
+        return f"Concurrently create index {self.index.name} on model {self.model_name} if missing"
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        state = index_state(schema_editor, model, self.index.name)
+        if state == "valid":
+            return
+        if schema_editor.connection.vendor != "postgresql":
+            schema_editor.add_index(model, self.index)
+            return
+        if schema_editor.connection.in_atomic_block:
+            raise NotSupportedError(
+                "AddIndexConcurrently cannot run inside a transaction, "
+                "set atomic = False on the migration."
+            )
+        if state == "invalid":
+            schema_editor.execute(
+                f"DROP INDEX CONCURRENTLY {schema_editor.quote_name(self.index.name)}"
+            )
+        schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        if index_state(schema_editor, model, self.index.name) is None:
+            return
+        if schema_editor.connection.vendor == "postgresql":
+            schema_editor.remove_index(model, self.index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, self.index)
+
+
+def backfill(queryset, values, batch_size=1000):
+    """
+    Update rows in primary key ordered batches, each one in its own
+    transaction.
+    :param queryset: Rows to update
+    :param values: Dict of field names and values (or expressions) to set
+    :param batch_size: Number of rows per batch
+    :return: Number of updated rows
+    """
+    manager = queryset.model._base_manager.using(queryset.db)
+    updated = 0
+    last_pk = None
+    while True:
+        batch = queryset.order_by("pk")
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return updated
+        with transaction.atomic(using=queryset.db):
+            updated += manager.filter(pk__in=pks).update(**values)
+        last_pk = pks[-1]
+
+
+class BackfillField(Operation):
+    """
+    Set the value of a field on existing rows, in batches. By default, only
+    the rows where the field is NULL are updated, so that an interrupted
+    backfill can be resumed by running the migration again.
+    """
+
+    reduces_to_sql = False
+    reversible = True
+
+    def __init__(self, model_name, name, value, condition=None, batch_size=1000):
+        """
+        :param model_name: Name of the model
+        :param name: Name of the field
+        :param value: Value or expression to set
+        :param condition: Q object selecting the rows to update (default: field is NULL)
+        :param batch_size: Number of rows per batch
+        """
+        self.model_name = model_name
+        self.name = name
+        self.value = value
+        self.condition = condition
+        self.batch_size = batch_size
+
+    def deconstruct(self):
+        kwargs = {
+            "model_name": self.model_name,
+            "name": self.name,
+            "value": self.value,
+        }
+        if self.condition is not None:
+            kwargs["condition"] = self.condition
+        if self.batch_size != 1000:
+            kwargs["batch_size"] = self.batch_size
+        return self.__class__.__name__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        queryset = model._base_manager.using(schema_editor.connection.alias)
+        if self.condition is None:
+            queryset = queryset.filter(**{f"{self.name}__isnull": True})
+        else:
+            queryset = queryset.filter(self.condition)
+        backfill(queryset, {self.name: self.value}, self.batch_size)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        pass
+
+    def describe(self):
+        return f"Backfill {self.name} of model {self.model_name} in batches of {self.batch_size}"
+
+    @property
+    def migration_name_fragment(self):
+        return f"backfill_{self.model_name.lower()}_{self.name.lower()}"
+
+
+class PartitionByYear(Operation):
+    """
+    Partition the table of a model by year of a date field, on PostgreSQL.
+    Tables already partitioned are left untouched.
+    """
+
+    reduces_to_sql = False
+    reversible = True
+
+    def __init__(self, model_name, name):
+        """
+        :param model_name: Name of the model
+        :param name: Name of the date field
+        """
+        self.model_name = model_name
+        self.name = name
+
+    def deconstruct(self):
+        kwargs = {"model_name": self.model_name, "name": self.name}
+        return self.__class__.__name__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        connection = schema_editor.connection
+        if not self.allow_migrate_model(connection.alias, model):
+            return
+        if connection.vendor != "postgresql":
+            return
+        table = model._meta.db_table
+        if is_partitioned(connection, table):
+            return
+        partition_table_by_year(
+            connection,
+            table,
+            model._meta.get_field(self.name).column,
+            model._meta.pk.column,
+        )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        connection = schema_editor.connection
+        if not self.allow_migrate_model(connection.alias, model):
+            return
+        table = model._meta.db_table
+        if not is_partitioned(connection, table):
+            return
+        unpartition_table(
+            connection,
+            table,
+            model._meta.get_field(self.name).column,
+            model._meta.pk.column,
+        )
+
+    def describe(self):
+        return f"Partition model {self.model_name} by year of {self.name}"
+
+    @property
+    def migration_name_fragment(self):
+        return f"partition_{self.model_name.lower()}_{self.name.lower()}"
@@ -0,0 +1,262 @@
+"""
+Yearly range partitioning of PostgreSQL tables.
+
+A partitioned table has one partition per calendar year (UTC) of its date
+column, named ``<table>_y<year>``, and a default partition
+``<table>_default`` receiving the rows of the years without a partition.
+Queries bounded on the date column only read the partitions of the years
+they cover (partition pruning), and the indexes created on the partitioned
+table are created on each partition, so that an (asset, date) index only
+holds the rows of its year.
+
+The partitions of the coming years are created in advance (see the
+create_stock_event_partitions management command): a partition is created
+as a standalone table, filled with the rows of its year found in the default
+partition, then attached, which does not block the reads and writes of the
+partitioned table.
+"""
+
+import datetime
+
+from django.db import transaction
+
+
+def partition_name(table, year):
+    """
+    Name of the partition of a year.
+    :param table: Name of the partitioned table
+    :param year: Year
+    :return: Name of the partition
+    """
+    return f"{table}_y{year}"
+
+
+def default_partition_name(table):
+    """
+    Name of the default partition.
+    :param table: Name of the partitioned table
+    :return: Name of the partition
+    """
+    return f"{table}_default"
+
+
+def year_bounds(year):
+    """
+    SQL literals of the bounds of the partition of a year.
+    :param year: Year
+    :return: Tuple (lower bound included, upper bound excluded)
+    """
+    return f"'{year:04d}-01-01 00:00:00+00'", f"'{year + 1:04d}-01-01 00:00:00+00'"
+
+
+def is_partitioned(connection, table):
+    """
+    Tell if a table is partitioned.
+    :param connection: Database connection
+    :param table: Name of the table
+    :return: True if the table is a partitioned PostgreSQL table
+    """
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p "
+            "JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def partition_years(connection, table):
+    """
+    Years having a partition.
+    :param connection: Database connection
+    :param table: Name of the partitioned table
+    :return: Set of years
+    """
+    prefix = partition_name(table, "")
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return {
+        int(name[len(prefix) :])
+        for name in names
+        if name.startswith(prefix) and name[len(prefix) :].isdigit()
+    }
+
+
+def default_partition_years(connection, table, column):
+    """
+    Years of the rows stored in the default partition.
+    :param connection: Database connection
+    :param table: Name of the partitioned table
+    :param column: Name of the date column
+    :return: Set of years
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT DISTINCT EXTRACT(YEAR FROM {quote(column)} AT TIME ZONE 'UTC') "
+            f"FROM {quote(default_partition_name(table))}"
+        )
+        return {int(row[0]) for row in cursor.fetchall()}
+
+
+def create_year_partition(connection, table, column, year):
+    """
+    Create the partition of a year, moving its rows out of the default
+    partition.
+    :param connection: Database connection
+    :param table: Name of the partitioned table
+    :param column: Name of the date column
+    :param year: Year
+    :return: Number of rows moved, None when the partition already exists
+    """
+    if year in partition_years(connection, table):
+        return None
+    quote = connection.ops.quote_name
+    name = quote(partition_name(table, year))
+    lower, upper = year_bounds(year)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE {name} (LIKE {quote(table)} "
+            "INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {quote(default_partition_name(table))} "
+            f"WHERE {quote(column)} >= {lower} AND {quote(column)} < {upper} "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ({lower}) TO ({upper})"
+        )
+    return moved
+
+
+def _table_definition(cursor, table):
+    """
+    Indexes and foreign keys of a table, to recreate them on its replacement.
+    :param cursor: Database cursor
+    :param table: Name of the table
+    :return: Tuple (list of CREATE INDEX statements, list of (name, definition)
+        of the foreign keys)
+    """
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+        "WHERE indrelid = %s::regclass AND NOT indisprimary",
+        [table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _replace_table(connection, table, column, pk, years):
+    """
+    Copy a table into a new partitioned (or plain) table taking its name,
+    indexes, foreign keys and primary key sequence.
+    :param connection: Database connection
+    :param table: Name of the table
+    :param column: Name of the date column
+    :param pk: Name of the auto-incremented primary key column
+    :param years: Years to create a partition for, None for a plain table
+    """
+    quote = connection.ops.quote_name
+    new_table = f"{table}__new"
+    sequence = f"{table}_{pk}_seq"
+    with connection.cursor() as cursor:
+        indexes, foreign_keys = _table_definition(cursor, table)
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, pk])
+        old_sequence = cursor.fetchone()[0]
+        cursor.execute(f"SELECT last_value, is_called FROM {old_sequence}")
+        last_value, is_called = cursor.fetchone()
+
+        cursor.execute(
+            f"CREATE TABLE {quote(new_table)} (LIKE {quote(table)} "
+            "INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            + ("" if years is None else f" PARTITION BY RANGE ({quote(column)})")
+        )
+        if years is not None:
+            cursor.execute(
+                f"CREATE TABLE {quote(default_partition_name(table))} "
+                f"PARTITION OF {quote(new_table)} DEFAULT"
+            )
+            for year in sorted(years):
+                lower, upper = year_bounds(year)
+                cursor.execute(
+                    f"CREATE TABLE {quote(partition_name(table, year))} "
+                    f"PARTITION OF {quote(new_table)} "
+                    f"FOR VALUES FROM ({lower}) TO ({upper})"
+                )
+        cursor.execute(f"INSERT INTO {quote(new_table)} SELECT * FROM {quote(table)}")
+        # The sequence of the old table goes away with it
+        cursor.execute(
+            f"ALTER TABLE {quote(new_table)} ALTER COLUMN {quote(pk)} DROP DEFAULT"
+        )
+        cursor.execute(f"DROP TABLE {quote(table)}")
+        cursor.execute(f"ALTER TABLE {quote(new_table)} RENAME TO {quote(table)}")
+
+        cursor.execute(
+            f"CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.{quote(pk)}"
+        )
+        cursor.execute("SELECT setval(%s, %s, %s)", [sequence, last_value, is_called])
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} ALTER COLUMN {quote(pk)} "
+            f"SET DEFAULT nextval('{sequence}'::regclass)"
+        )
+        # The primary key of a partitioned table includes the partition key
+        pk_columns = quote(pk) if years is None else f"{quote(pk)}, {quote(column)}"
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(table + '_pkey')} "
+            f"PRIMARY KEY ({pk_columns})"
+        )
+        for statement in indexes:
+            cursor.execute(statement)
+        for name, definition in foreign_keys:
+            cursor.execute(
+                f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}"
+            )
+
+
+def partition_table_by_year(connection, table, column, pk="id"):
+    """
+    Replace a table by a table partitioned by year, with a partition for
+    each year from the first row up to the next year.
+    :param connection: Database connection
+    :param table: Name of the table
+    :param column: Name of the date column
+    :param pk: Name of the auto-incremented primary key column
+    """
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXTRACT(YEAR FROM MIN({quote(column)}) AT TIME ZONE 'UTC') "
+            f"FROM {quote(table)}"
+        )
+        first = cursor.fetchone()[0]
+    current = datetime.datetime.now(datetime.timezone.utc).year
+    first = current if first is None else min(int(first), current)
+    _replace_table(connection, table, column, pk, range(first, current + 2))
+
+
+def unpartition_table(connection, table, column, pk="id"):
+    """
+    Replace a partitioned table by a plain table.
+    :param connection: Database connection
+    :param table: Name of the partitioned table
+    :param column: Name of the date column
+    :param pk: Name of the auto-incremented primary key column
+    """
+    _replace_table(connection, table, column, pk, None)
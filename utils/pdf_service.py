@@ -0,0 +1,106 @@
+"""
+PDF rendering service.
+
+Rendering a document with WeasyPrint from scratch re-parses its stylesheets,
+reloads the fonts and re-reads its images. The service loads them once:
+
+* the stylesheet sources and the images, as data URIs, are cached for the
+  whole process;
+* the font configuration and the parsed stylesheets are cached per thread,
+  the WeasyPrint and Pango objects not being safe to share between threads;
+
+so that rendering a document only costs its layout. :func:`warm_up` loads
+everything and renders an empty document, to pay the start-up cost (imports,
+fontconfig initialization) before the first real render. As the font
+configuration and stylesheets it prepares are those of the calling thread, it
+runs on the threads that render: the initializer of the batch export
+processes and of the threads of the PDF pool (see ui/reservation/pdf.py).
+
+The module does not depend on Django, so that the spawned processes of the
+batch exports can import it without setting Django up.
+"""
+
+import base64
+import mimetypes
+import threading
+from pathlib import Path
+
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+_lock = threading.Lock()
+_stylesheet_sources = {}
+_image_uris = {}
+_local = threading.local()
+
+
+def _stylesheet_source(path):
+    """
+    Source of a stylesheet, read once per process.
+    :param path: Path of the stylesheet
+    :return: CSS source
+    """
+    with _lock:
+        if path not in _stylesheet_sources:
+            _stylesheet_sources[path] = Path(path).read_text(encoding="utf-8")
+        return _stylesheet_sources[path]
+
+
+def image_uri(path):
+    """
+    Data URI of an image, read once per process.
+    :param path: Path of the image
+    :return: URI to use as the source of the image
+    """
+    path = str(path)
+    with _lock:
+        if path not in _image_uris:
+            mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            encoded = base64.b64encode(Path(path).read_bytes()).decode("ascii")
+            _image_uris[path] = f"data:{mime_type};base64,{encoded}"
+        return _image_uris[path]
+
+
+def _thread_resources(stylesheet_paths):
+    """
+    Font configuration and parsed stylesheets of the current thread.
+    :param stylesheet_paths: Paths of the stylesheets
+    :return: Tuple (FontConfiguration, list of CSS)
+    """
+    key = tuple(str(path) for path in stylesheet_paths)
+    if not hasattr(_local, "resources"):
+        _local.resources = {}
+    if key not in _local.resources:
+        font_config = FontConfiguration()
+        stylesheets = [
+            CSS(string=_stylesheet_source(path), font_config=font_config)
+            for path in key
+        ]
+        _local.resources[key] = (font_config, stylesheets)
+    return _local.resources[key]
+
+
+def render_document(html, stylesheet_paths, base_url=None):
+    """
+    Render an HTML document to PDF.
+    :param html: HTML document
+    :param stylesheet_paths: Paths of the stylesheets applied to the document
+    :param base_url: Base URL used to resolve relative links
+    :return: PDF content (bytes)
+    """
+    font_config, stylesheets = _thread_resources(stylesheet_paths)
+    return HTML(string=html, base_url=base_url).write_pdf(
+        stylesheets=stylesheets, font_config=font_config
+    )
+
+
+def warm_up(stylesheet_paths, image_paths=()):
+    """
+    Load the resources of the documents for the current thread and render
+    an empty one.
+    :param stylesheet_paths: Paths of the stylesheets to preload
+    :param image_paths: Paths of the images to preload
+    """
+    for path in image_paths:
+        image_uri(path)
+    render_document("<p></p>", stylesheet_paths)
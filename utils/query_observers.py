@@ -0,0 +1,67 @@
+"""
+Observation of the SQL queries run on behalf of a request.
+
+``connection.execute_wrapper`` only applies to the connection of the thread
+installing it, while the queries of a request may run in other threads: the
+threads of sync_to_async under ASGI, and the availability pool (see
+utils/executors.py). The observers registered with :func:`observe_queries`
+are kept in a context variable, which follows the request to these threads,
+and are called by a wrapper installed on every connection.
+"""
+
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Observers of the current request, outermost first
+_observers = ContextVar("query_observers", default=())
+
+
+def _observe(execute, sql, params, many, context):
+    for observer in reversed(_observers.get()):
+        execute = functools.partial(observer, execute)
+    return execute(sql, params, many, context)
+
+
+def install(connection):
+    """
+    Install the observers wrapper on a connection.
+    :param connection: Database connection
+    """
+    # First, as execute_wrapper() removes the last wrapper when it exits
+    if _observe not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _observe)
+
+
+def install_all():
+    """
+    Install the observers wrapper on the connections of the current thread.
+    """
+    for connection in connections.all():
+        install(connection)
+
+
+@receiver(connection_created)
+def _install_on_connect(sender, connection, **kwargs):
+    install(connection)
+
+
+@contextmanager
+def observe_queries(observer):
+    """
+    Call an observer for the queries run in the block, whatever the thread
+    running them, as long as it runs in a copy of the current context.
+    :param observer: Callable with the signature of the execute wrappers,
+        which may be called by several threads at once
+    :return: The observer
+    """
+    install_all()
+    token = _observers.set(_observers.get() + (observer,))
+    try:
+        yield observer
+    finally:
+        _observers.reset(token)
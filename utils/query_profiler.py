@@ -0,0 +1,239 @@
+"""
+Per-request SQL query profiling and query budgets.
+
+The middleware is opt-in (``QUERY_PROFILER_ENABLED``): when enabled it records
+every SQL statement run while serving a request, logs a structured summary and
+exposes it in the ``X-Query-Profile`` response header. The figures of the
+instrumented computations (see utils/instrumentation.py) are added to the
+summary and to the ``X-Computations-Profile`` header.
+Views can declare the maximum number of queries they are allowed to run with
+the :func:`query_budget` decorator.
+"""
+
+import logging
+import re
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from utils import instrumentation
+from utils.query_observers import observe_queries
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Query-Profile"
+COMPUTATIONS_HEADER = "X-Computations-Profile"
+
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*%s\s*,?)+\)", re.IGNORECASE)
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES_RE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a view runs more queries than its declared budget
+    and ``QUERY_BUDGET_STRICT`` is enabled.
+    """
+
+
+def query_budget(max_queries):
+    """
+    Declare the maximum number of SQL queries a view may run for one request.
+    The budget is only checked when the query profiler middleware is enabled.
+    :param max_queries: Maximum number of queries
+    :return: Decorator setting the budget on the view
+    """
+
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+
+    return decorator
+
+
+def fingerprint(sql):
+    """
+    Normalize a SQL statement so that queries differing only by their
+    parameters share the same fingerprint.
+    :param sql: SQL statement
+    :return: Normalized statement
+    """
+    sql = _IN_LIST_RE.sub("IN (...)", sql)
+    sql = _LITERAL_RE.sub("?", sql)
+    return _SPACES_RE.sub(" ", sql).strip()
+
+
+class QueryProfile:
+    """
+    Collect the SQL statements executed on the database connections.
+    Instances are used as query observers (see utils/query_observers.py).
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty profile.
+        """
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Execute the statement and record its duration.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        """
+        Number of recorded queries.
+        """
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        """
+        Total time spent in SQL, in seconds.
+        """
+        return sum(duration for _, duration in self.queries)
+
+    def slowest(self, limit=5):
+        """
+        Return the slowest recorded statements.
+        :param limit: Maximum number of statements to return
+        :return: List of (sql, duration) tuples, slowest first
+        """
+        return sorted(self.queries, key=lambda query: query[1], reverse=True)[:limit]
+
+    def duplicates(self):
+        """
+        Return the fingerprints of statements run more than once,
+        which usually reveal N+1 query patterns.
+        :return: Dict of fingerprint to number of executions, most frequent first
+        """
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in counts.most_common() if count > 1}
+
+    def as_dict(self, slowest=5):
+        """
+        Structured summary of the profile.
+        :param slowest: Number of slowest statements to include
+        :return: Dict summary
+        """
+        return {
+            "count": self.count,
+            "time_ms": round(self.total_time * 1000, 2),
+            "slowest": [
+                {"sql": sql, "time_ms": round(duration * 1000, 2)}
+                for sql, duration in self.slowest(slowest)
+            ],
+            "duplicates": self.duplicates(),
+        }
+
+    def header_value(self):
+        """
+        Compact summary for the response header.
+        :return: Header value
+        """
+        duplicated = sum(count for count in self.duplicates().values())
+        return (
+            f"count={self.count}; time_ms={self.total_time * 1000:.2f}; "
+            f"duplicates={duplicated}"
+        )
+
+
+class QueryProfilerMiddleware:
+    """
+    Record the SQL queries of each request, log a summary and check
+    the query budget of the view.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """
+        Initialize the middleware, disabled unless ``QUERY_PROFILER_ENABLED`` is set.
+        :param get_response: Next handler in the chain
+        """
+        if not getattr(settings, "QUERY_PROFILER_ENABLED", False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # Called by the async handler without switching to a thread
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        """
+        Profile the request.
+        :param request: HTTP request object
+        :return: HTTP response with the profile header
+        """
+        if self.is_async:
+            return self.__acall__(request)
+        profile = QueryProfile()
+        request.query_profile = profile
+        with observe_queries(profile), instrumentation.collect() as computations:
+            response = self.get_response(request)
+        return self.report(request, response, profile, computations)
+
+    async def __acall__(self, request):
+        profile = QueryProfile()
+        request.query_profile = profile
+        with observe_queries(profile), instrumentation.collect() as computations:
+            response = await self.get_response(request)
+        return self.report(request, response, profile, computations)
+
+    def report(self, request, response, profile, computations):
+        """
+        Log the profile of a request and check the query budget of its view.
+        :param request: HTTP request object
+        :param response: HTTP response
+        :param profile: QueryProfile of the request
+        :param computations: Figures of the instrumented computations
+        :return: HTTP response with the profile header
+        """
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        summary = profile.as_dict(getattr(settings, "QUERY_PROFILER_SLOWEST", 5))
+        if computations:
+            summary["computations"] = computations.as_dict()
+        logger.info(
+            "%s %s: %d queries in %.2f ms",
+            request.method,
+            view_name or request.path,
+            summary["count"],
+            summary["time_ms"],
+            extra={"view_name": view_name, "query_profile": summary},
+        )
+        response[PROFILE_HEADER] = profile.header_value()
+        if computations:
+            response[COMPUTATIONS_HEADER] = "; ".join(
+                f"{name}={stats['calls']}x/{stats['time_ms']}ms/{stats['queries']}q"
+                for name, stats in summary["computations"].items()
+            )
+
+        budget = getattr(request, "query_budget", None)
+        if budget is not None and profile.count > budget:
+            message = f"{view_name} ran {profile.count} queries, its budget is {budget}"
+            if getattr(settings, "QUERY_BUDGET_STRICT", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={"query_profile": summary})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Remember the query budget declared by the resolved view.
+        """
+        request.query_budget = getattr(view_func, "query_budget", None)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        QueryProfilerMiddleware.process_view(
+            self, request, view_func, view_args, view_kwargs
+        )
@@ -0,0 +1,325 @@
+"""
+Logging pipeline of the application.
+
+* :class:`QueueLogHandler` only puts the records in a queue; a background
+  thread formats them and writes them to the console, so that request
+  threads never wait for the writes. When the queue is full, records are
+  dropped rather than blocking, and the number of dropped records is logged
+  once the queue accepts records again.
+* :class:`RequestContextMiddleware` gives each request an id (the
+  ``X-Request-ID`` header of the request, or a new one) returned in the
+  response, and logs each request with its status and duration.
+  :class:`RequestContextFilter` adds the id, the user, the view name and the
+  time elapsed since the start of the request to the records.
+* :class:`JsonFormatter` writes a record as a JSON object, including the
+  ``extra`` fields given to the logger.
+* :class:`SamplingFilter` keeps a fraction of the debug records of the
+  chatty loggers.
+
+The levels, the format and the sampling rates are set from the environment
+(see ``LOGGING`` in the settings).
+"""
+
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import empty
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Context of the request being served
+_request_context = ContextVar("log_request_context", default=None)
+
+access_logger = logging.getLogger("pretloc.access")
+
+CONTEXT_ATTRIBUTES = ("request_id", "user", "view", "elapsed_ms")
+
+# Attributes of every LogRecord, the others are extra fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    *CONTEXT_ATTRIBUTES,
+}
+
+
+class RequestContext:
+    """
+    Logging context of a request.
+    """
+
+    def __init__(self, request_id, request):
+        self.request_id = request_id
+        self.request = request
+        self.view = None
+        self.start = time.perf_counter()
+
+    @property
+    def user(self):
+        """
+        Username of the user of the request, None when anonymous or not
+        loaded yet (logging does not load it).
+        """
+        user = getattr(self.request, "user", None)
+        if getattr(user, "_wrapped", None) is empty:
+            return None
+        if user is None or not user.is_authenticated:
+            return None
+        return user.get_username()
+
+
+def request_id():
+    """
+    Id of the request being served.
+    :return: Request id, or None outside of a request
+    """
+    context = _request_context.get()
+    return context.request_id if context else None
+
+
+class RequestContextMiddleware:
+    """
+    Set the logging context of the requests and log them.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # Called by the async handler without switching to a thread
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        context, token = self.start(request)
+        try:
+            return self.finish(request, context, self.get_response(request))
+        finally:
+            _request_context.reset(token)
+
+    async def __acall__(self, request):
+        context, token = self.start(request)
+        try:
+            return self.finish(request, context, await self.get_response(request))
+        finally:
+            _request_context.reset(token)
+
+    def start(self, request):
+        """
+        Give the request its id and set its logging context.
+        :param request: HTTP request
+        :return: Tuple (RequestContext, token to reset the context)
+        """
+        header = request.headers.get(REQUEST_ID_HEADER, "")
+        request.request_id = (
+            header if _REQUEST_ID_RE.match(header) else uuid.uuid4().hex
+        )
+        context = RequestContext(request.request_id, request)
+        return context, _request_context.set(context)
+
+    def finish(self, request, context, response):
+        """
+        Return the id of the request in the response and log the request.
+        :param request: HTTP request
+        :param context: Logging context of the request
+        :param response: HTTP response
+        :return: The response
+        """
+        response[REQUEST_ID_HEADER] = request.request_id
+        access_logger.info(
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - context.start) * 1000, 2),
+            },
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        context = _request_context.get()
+        if context is not None and request.resolver_match:
+            context.view = request.resolver_match.view_name
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        RequestContextMiddleware.process_view(
+            self, request, view_func, view_args, view_kwargs
+        )
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Add the context of the current request to the records: request_id, user,
+    view and elapsed_ms, None outside of a request.
+    """
+
+    def filter(self, record):
+        context = _request_context.get()
+        if context is None:
+            record.request_id = record.user = record.view = record.elapsed_ms = None
+        else:
+            record.request_id = context.request_id
+            record.user = context.user
+            record.view = context.view
+            record.elapsed_ms = round((time.perf_counter() - context.start) * 1000, 2)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a fraction of the records of some loggers (and of their children)
+    up to a level.
+    """
+
+    def __init__(self, rates=None, level="DEBUG"):
+        """
+        :param rates: Dict of logger name to the fraction of records to keep
+        :param level: Highest level of the sampled records
+        """
+        super().__init__()
+        # Longest names first, so that a child logger can have its own rate
+        self.rates = sorted(
+            ((name, float(rate)) for name, rate in (rates or {}).items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        if not self.rates or record.levelno > self.level:
+            return True
+        for name, rate in self.rates:
+            if record.name == name or record.name.startswith(name + "."):
+                return random.random() < rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format the records as JSON objects, one per line.
+    """
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for attribute in CONTEXT_ATTRIBUTES:
+            value = getattr(record, attribute, None)
+            if value is not None:
+                data[attribute] = value
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    Put the records in a queue written to a stream by a background thread.
+    The formatter set on this handler is used by the thread.
+    """
+
+    def __init__(self, stream=None, queue_size=10000):
+        """
+        :param stream: Stream to write to (default: stderr)
+        :param queue_size: Maximum number of records waiting to be written
+        """
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.StreamHandler(stream)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener.start()
+        self._listening = True
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Only what depends on the calling thread is done here, the
+        # formatting is left to the background thread
+        prepared = logging.LogRecord.__new__(logging.LogRecord)
+        prepared.__dict__.update(record.__dict__)
+        record = prepared
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.dropped:
+            self._report_dropped()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _report_dropped(self):
+        """
+        Queue a warning with the number of records dropped so far, ahead of
+        the record being logged. The count is kept when the queue is still
+        full, to be reported with the next record.
+        """
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            return
+        warning = logging.LogRecord(
+            __name__,
+            logging.WARNING,
+            __file__,
+            0,
+            "%s log records dropped, the logging queue was full",
+            (dropped,),
+            None,
+        )
+        # Not run through the filters: the records dropped are not those of
+        # the current request, but the formatters expect the context
+        # attributes
+        for attribute in CONTEXT_ATTRIBUTES:
+            setattr(warning, attribute, None)
+        try:
+            self.queue.put_nowait(self.prepare(warning))
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += dropped
+
+    def close(self):
+        # Write the records still in the queue
+        if self._listening:
+            self._listening = False
+            self.listener.stop()
+        self.target.close()
+        super().close()